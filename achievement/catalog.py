@@ -0,0 +1,91 @@
+"""
+In-process catalog of the achievements, so the signals do not look them up on every event.
+"""
+
+import threading
+import time
+
+from common.models.achievement import Achievement
+from django.conf import settings
+from django.core.cache import caches
+
+
+class AchievementCatalog:
+    """
+    The achievements keyed by title, loaded with a single query the first time they are needed
+    and reloaded after an ``Achievement`` is saved or deleted by this service, or after
+    ``ACHIEVEMENT_CATALOG_TTL`` seconds for the changes made by the other services.
+
+    When ``settings.ACHIEVEMENT_CATALOG_CACHE`` names a cache alias the catalog is also shared
+    through it: the loaded achievements are stored there and a version counter tells every
+    worker when its own copy is stale. Rolled back transactions are not seen by the catalog,
+    call ``invalidate`` after them.
+    """
+
+    cacheKey = "achievement:catalog"
+    versionKey = "achievement:catalog:version"
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.achievements = None
+        self.version = None
+        self.loadedAt = 0.0
+
+    @property
+    def cache(self):
+        alias = getattr(settings, "ACHIEVEMENT_CATALOG_CACHE", None)
+        return caches[alias] if alias else None
+
+    def sharedVersion(self, cache):
+        version = cache.get(self.versionKey)
+        if version is None:
+            cache.add(self.versionKey, 1, timeout=None)
+            version = cache.get(self.versionKey, 1)
+        return version
+
+    def load(self):
+        cache = self.cache
+        version = self.sharedVersion(cache) if cache else None
+        now = self.clock()
+        fresh = now - self.loadedAt < settings.ACHIEVEMENT_CATALOG_TTL
+        if self.achievements is not None and version == self.version and fresh:
+            return self.achievements
+
+        with self.lock:
+            achievements = cache.get(self.cacheKey, version=version) if cache else None
+            if achievements is None:
+                achievements = {
+                    achievement.title: achievement for achievement in Achievement.objects.all()
+                }
+                if cache:
+                    cache.set(
+                        self.cacheKey,
+                        achievements,
+                        timeout=settings.ACHIEVEMENT_CATALOG_TTL,
+                        version=version,
+                    )
+            self.achievements = achievements
+            self.version = version
+            self.loadedAt = now
+        return achievements
+
+    def get(self, title):
+        """
+        Returns the achievement with the given title, None if it does not exist.
+        """
+        return self.load().get(title)
+
+    def invalidate(self):
+        """
+        Drops the loaded achievements, in this process and in the shared cache.
+        """
+        with self.lock:
+            self.achievements = None
+        cache = self.cache
+        if cache:
+            self.sharedVersion(cache)
+            cache.incr(self.versionKey)
+
+
+catalog = AchievementCatalog()
@@ -0,0 +1,49 @@
+"""
+Management command that creates the missing achievement progress rows of the existing users.
+"""
+
+from common.models.achievement import Achievement, UserAchievementProgress
+from common.models.user import User
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Create the missing achievement progress of every user, in chunks of users"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunkSize = options["chunk_size"]
+        achievementIds = list(Achievement.objects.values_list("pk", flat=True))
+        if not achievementIds:
+            self.stdout.write("There are no achievements to backfill")
+            return
+
+        created = 0
+        lastId = 0
+        while True:
+            userIds = list(
+                User.objects.filter(pk__gt=lastId)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:chunkSize]
+            )
+            if not userIds:
+                break
+            lastId = userIds[-1]
+
+            existing = set(
+                UserAchievementProgress.objects.filter(user_id__in=userIds).values_list(
+                    "user_id", "achievement_id"
+                )
+            )
+            rows = [
+                UserAchievementProgress(user_id=userId, achievement_id=achievementId)
+                for userId in userIds
+                for achievementId in achievementIds
+                if (userId, achievementId) not in existing
+            ]
+            UserAchievementProgress.objects.bulk_create(rows, ignore_conflicts=True)
+            created += len(rows)
+
+        self.stdout.write(self.style.SUCCESS(f"Created {created} achievement progress rows"))
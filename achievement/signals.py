@@ -1,5 +1,7 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
+from achievement.catalog import catalog
 from common.models.achievement import UserAchievementProgress, Achievement
 from common.models.valuation import Valuation
 from common.models.user import User, Driver
@@ -7,11 +9,14 @@ from common.models.user import User, Driver
 
 # Inicialize all the achievements for the user/driver
 def initialize_achievements(user):
-    achievements = Achievement.objects.all()
-    for achievement in achievements:
-        # Check if the user already has the achievement
-        if not UserAchievementProgress.objects.filter(user=user, achievement=achievement).exists():
-            UserAchievementProgress.objects.create(user=user, achievement=achievement)
+    # Only the achievements the user does not have yet, computed in the database
+    missing = Achievement.objects.exclude(
+        pk__in=UserAchievementProgress.objects.filter(user=user).values("achievement_id")
+    ).values_list("pk", flat=True)
+    UserAchievementProgress.objects.bulk_create(
+        [UserAchievementProgress(user=user, achievement_id=pk) for pk in missing],
+        ignore_conflicts=True,
+    )
 
 
 @receiver(post_save, sender=User)
@@ -26,65 +31,95 @@ def driver_created(sender, instance, created, **kwargs):
         initialize_achievements(instance)
 
 
+# Any change of the achievements reloads the catalog
+@receiver(post_save, sender=Achievement)
+@receiver(post_delete, sender=Achievement)
+def achievement_changed(sender, instance, **kwargs):
+    catalog.invalidate()
+
+
 # Valuate 1 user
 @receiver(post_save, sender=Valuation)
 def user_valuated(sender, instance, created, **kwargs):
     if created:
-        try:
-            achievement = Achievement.objects.get(title="CriticoEstelar")
-        except Achievement.DoesNotExist:
+        achievement = catalog.get("CriticoEstelar")
+        if achievement is None:
             return
 
-        user_achievement, _ = UserAchievementProgress.objects.get_or_create(
-            user=instance.giver, achievement=achievement
-        )
+        check_and_increment_progress(instance.giver_id, achievement, instance)
+
+
+# Valuations created in bulk do not send post_save, their progress is applied at once
+def valuations_created(giver_id, valuations):
+    if not valuations:
+        return
+    achievement = catalog.get("CriticoEstelar")
+    if achievement is None:
+        return
+
+    check_and_increment_progress(giver_id, achievement, valuations[-1], len(valuations))
 
-        check_and_increment_progress(user_achievement, achievement, instance)
 
+def profile_image_name(instance):
+    value = instance.__dict__.get("profileImage")
+    return getattr(value, "name", value)
 
-def cache_old_profile_image_generic(instance):
-    if instance.pk:
-        try:
-            instance._old_profile_image = instance.__class__.objects.get(pk=instance.pk).profileImage
-        except instance.__class__.DoesNotExist:
-            instance._old_profile_image = None
-    else:
-        instance._old_profile_image = None
 
+def snapshot_profile_image_generic(instance):
+    # Deferred fields are not loaded, there is nothing to compare against
+    if "profileImage" in instance.__dict__:
+        instance._old_profile_image = profile_image_name(instance)
+
+
+def user_changed_profile_generic(instance, created, update_fields=None):
+    # Saves of other fields (i.e. last_login on login) cannot change the image
+    if update_fields is not None and "profileImage" not in update_fields:
+        return
 
-def user_changed_profile_generic(instance, created):
     if not created:
         old_profile_image = getattr(instance, "_old_profile_image", None)
-        new_profile_image = instance.profileImage
+        new_profile_image = profile_image_name(instance)
 
         if old_profile_image != new_profile_image:
-            try:
-                achievement = Achievement.objects.get(title="Camaleon")
-            except Achievement.DoesNotExist:
-                return
+            achievement = catalog.get("Camaleon")
+            if achievement is not None:
+                check_and_increment_progress(instance.pk, achievement, instance)
 
-            user_achievement, _ = UserAchievementProgress.objects.get_or_create(
-                user=instance, achievement=achievement
-            )
+    # The saved image is the one to compare with on the next save
+    snapshot_profile_image_generic(instance)
 
-            check_and_increment_progress(user_achievement, achievement, instance)
 
+# Remember the image the instance was loaded with, so saving it does not fetch the row again
+@receiver(post_init, sender=User)
+@receiver(post_init, sender=Driver)
+def snapshot_profile_image(sender, instance, **kwargs):
+    snapshot_profile_image_generic(instance)
 
-@receiver(pre_save, sender=User)
-@receiver(pre_save, sender=Driver)
-def cache_old_profile_image(sender, instance, **kwargs):
-    cache_old_profile_image_generic(instance)
 
 @receiver(post_save, sender=User)
 @receiver(post_save, sender=Driver)
-def user_changed_profile(sender, instance, created, **kwargs):
-    user_changed_profile_generic(instance, created)
-
-
-def check_and_increment_progress(user_achievement, achievement, instance):
-    if not user_achievement.achieved:
-        user_achievement.progress += 1
-        if user_achievement.progress >= achievement.required_points:
-            user_achievement.achieved = True
-            user_achievement.date_achieved = instance.createdAt
-        user_achievement.save()
+def user_changed_profile(sender, instance, created, update_fields=None, **kwargs):
+    user_changed_profile_generic(instance, created, update_fields)
+
+
+def check_and_increment_progress(user_id, achievement, instance, amount=1):
+    # A single atomic UPDATE, every expression reads the values of the row before the update
+    # so concurrent events never lose increments and the threshold is checked by the database
+    crosses = Q(achieved=False, progress__gte=achievement.required_points - amount)
+    user_achievement = UserAchievementProgress.objects.filter(
+        user_id=user_id, achievement=achievement
+    )
+    changes = {
+        "progress": Case(When(achieved=True, then=F("progress")), default=F("progress") + amount),
+        "date_achieved": Case(
+            When(crosses, then=Value(instance.createdAt)), default=F("date_achieved")
+        ),
+        "achieved": Case(When(crosses, then=Value(True)), default=F("achieved")),
+    }
+    if not user_achievement.update(**changes):
+        # Users created before the achievement do not have its progress yet
+        UserAchievementProgress.objects.bulk_create(
+            [UserAchievementProgress(user_id=user_id, achievement=achievement)],
+            ignore_conflicts=True,
+        )
+        user_achievement.update(**changes)
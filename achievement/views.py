@@ -1,30 +1,40 @@
 from rest_framework.generics import ListAPIView
+from api.conditional import ConditionalGetMixin, fingerprintETag
 from common.models.achievement import UserAchievementProgress
 from achievement.serializers import UserAchievementProgressSerializer
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
 
 
-class MyAchievementList(ListAPIView):
+class AchievementFingerprintMixin(ConditionalGetMixin):
+    """
+    ETag of the achievement lists, built from the few columns they show instead of the
+    serialized progress.
+    """
+
+    def etag(self, request):
+        rows = self.get_queryset().order_by("id")
+        versions = rows.values_list("id", "achievement__title", "achieved", "date_achieved")
+        return fingerprintETag(request.get_full_path(), *versions)
+
+
+class MyAchievementList(AchievementFingerprintMixin, ListAPIView):
     """
     List all my achievements.
     """
 
     serializer_class = UserAchievementProgressSerializer
-    authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return UserAchievementProgress.objects.filter(user=self.request.user)
+        return UserAchievementProgress.objects.filter(user_id=self.request.user.id)
 
 
-class UserAchievementList(ListAPIView):
+class UserAchievementList(AchievementFingerprintMixin, ListAPIView):
     """
     List all achievements of a user.
     """
 
     serializer_class = UserAchievementProgressSerializer
-    authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -0,0 +1,239 @@
+"""
+Authentication of the API requests: token authentication that caches the token and its user,
+so authenticated requests do not query the database every time, and signed access tokens
+that are verified without the database at all.
+"""
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    BaseAuthentication,
+    TokenAuthentication,
+    get_authorization_header,
+)
+from rest_framework.settings import api_settings
+
+
+class TokenCache:
+    """
+    Maps a token key to the snapshot of the token and its user in two tiers: a bounded LRU in
+    the process whose entries live ``TOKEN_AUTH_LOCAL_TTL`` seconds, and the cache alias named
+    by ``TOKEN_AUTH_CACHE``, shared by the workers, whose entries live ``TOKEN_AUTH_CACHE_TTL``.
+
+    Invalidating a token removes it from the shared tier and from the current process, the
+    other processes keep their copy until its local TTL expires.
+    """
+
+    keyPrefix = "authtoken:key:"
+    userPrefix = "authtoken:user:"
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.userKeys = {}
+
+    @property
+    def cache(self):
+        alias = getattr(settings, "TOKEN_AUTH_CACHE", None)
+        return caches[alias] if alias else None
+
+    def get(self, key):
+        """
+        Returns the (user, token) snapshot of the key, None if it is not cached.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                snapshot, expiresAt, _ = entry
+                if expiresAt > self.clock():
+                    self.entries.move_to_end(key)
+                    return pickle.loads(snapshot)
+                self.drop(key)
+
+        cache = self.cache
+        snapshot = cache.get(self.keyPrefix + key) if cache else None
+        if snapshot is None:
+            return None
+        user, token = pickle.loads(snapshot)
+        self.store(key, snapshot, user.pk)
+        return user, token
+
+    def set(self, key, user, token):
+        """
+        Caches the snapshot of the token and its user in both tiers.
+        """
+        snapshot = pickle.dumps((user, token))
+        self.store(key, snapshot, user.pk)
+        cache = self.cache
+        if cache:
+            timeout = settings.TOKEN_AUTH_CACHE_TTL
+            cache.set_many(
+                {self.keyPrefix + key: snapshot, self.userPrefix + str(user.pk): key}, timeout
+            )
+
+    def store(self, key, snapshot, userId):
+        with self.lock:
+            self.entries[key] = (snapshot, self.clock() + settings.TOKEN_AUTH_LOCAL_TTL, userId)
+            self.entries.move_to_end(key)
+            self.userKeys[userId] = key
+            while len(self.entries) > settings.TOKEN_AUTH_LOCAL_SIZE:
+                oldest = next(iter(self.entries))
+                self.drop(oldest)
+
+    def drop(self, key):
+        # Called with the lock held
+        entry = self.entries.pop(key, None)
+        if entry is not None and self.userKeys.get(entry[2]) == key:
+            del self.userKeys[entry[2]]
+
+    def invalidate(self, key):
+        """
+        Forgets the snapshot of the token key.
+        """
+        with self.lock:
+            self.drop(key)
+        cache = self.cache
+        if cache:
+            cache.delete(self.keyPrefix + key)
+
+    def invalidateUser(self, userId):
+        """
+        Forgets the snapshot of the token of the user, i.e. after the user changed.
+        """
+        with self.lock:
+            key = self.userKeys.get(userId)
+        cache = self.cache
+        if key is None and cache:
+            key = cache.get(self.userPrefix + str(userId))
+        if key is not None:
+            self.invalidate(key)
+
+    def clear(self):
+        """
+        Forgets every snapshot of this process.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.userKeys.clear()
+
+
+tokenCache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that looks the token up in the tokenCache before the database.
+    """
+
+    def authenticate_credentials(self, key):
+        snapshot = tokenCache.get(key)
+        if snapshot is not None:
+            return snapshot
+
+        user, token = super().authenticate_credentials(key)
+        tokenCache.set(key, user, token)
+        return user, token
+
+
+# Salt of the access tokens, the services verifying them must use the same one
+ACCESS_TOKEN_SALT = "ppf.access-token"
+
+
+def signedTokensEnabled():
+    """
+    Whether SignedTokenAuthentication is selected in REST_FRAMEWORK, the logins then issue
+    signed access tokens with a refresh token instead of a DRF Token.
+    """
+    return SignedTokenAuthentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+
+
+def accessTokenSecret():
+    """
+    The key of the access tokens, never the public SECRET_KEY outside DEBUG.
+    """
+    if not settings.ACCESS_TOKEN_SECRET:
+        raise ImproperlyConfigured("ACCESS_TOKEN_SECRET must be set to sign the access tokens")
+    return settings.ACCESS_TOKEN_SECRET
+
+
+def issueAccessToken(user):
+    """
+    Returns an access token with the id and the login type of the user, signed with HMAC
+    using ``ACCESS_TOKEN_SECRET`` and valid for ``ACCESS_TOKEN_TTL`` seconds.
+    """
+    claims = {"uid": user.pk, "typ": getattr(user, "typeOfLogin", None)}
+    return signing.dumps(claims, key=accessTokenSecret(), salt=ACCESS_TOKEN_SALT)
+
+
+def readAccessToken(token):
+    """
+    Returns the claims of the access token, raises ``signing.BadSignature`` when the token was
+    not signed by us or ``signing.SignatureExpired`` when it is too old.
+    """
+    return signing.loads(
+        token,
+        key=accessTokenSecret(),
+        salt=ACCESS_TOKEN_SALT,
+        max_age=settings.ACCESS_TOKEN_TTL,
+    )
+
+
+class TokenUser:
+    """
+    The user of a signed access token. The id and the login type come from the token, any
+    other attribute loads the user from the database the first time it is needed.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, claims):
+        self.id = self.pk = claims["uid"]
+        self.typeOfLogin = claims.get("typ")
+        self.claims = claims
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name == "_user":
+            raise AttributeError(name)
+        if "_user" not in self.__dict__:
+            self._user = get_user_model().objects.get(pk=self.pk)
+        return getattr(self._user, name)
+
+    def __str__(self):
+        return f"TokenUser {self.pk}"
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates the requests with a signed access token sent as ``Authorization: Bearer``.
+    """
+
+    keyword = "Bearer"
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+
+        try:
+            claims = readAccessToken(auth[1].decode())
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed("Token expired.")
+        except (signing.BadSignature, UnicodeError):
+            raise exceptions.AuthenticationFailed("Invalid token.")
+        return TokenUser(claims), claims
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,114 @@
+"""
+Management command comparing the requests per second of the production server modes.
+"""
+
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# How each mode is started, {port} is replaced by a free port
+SERVERS = {
+    "wsgi": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+    "asgi": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+    "runserver": [sys.executable, "manage.py", "runserver", "--noreload", "127.0.0.1:{port}"],
+}
+
+
+def freePort():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = "Start the server in each mode and measure the requests/second it serves"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--modes", default="wsgi,asgi", help="Comma separated modes, runserver is also known"
+        )
+        parser.add_argument("--path", default="/users/")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--workers", type=int, default=None, help="WEB_CONCURRENCY")
+
+    def handle(self, *args, **options):
+        for mode in options["modes"].split(","):
+            if mode not in SERVERS:
+                raise CommandError(f"Unknown mode {mode}, use {', '.join(SERVERS)}")
+            port = freePort()
+            env = {
+                **os.environ,
+                "SERVER_MODE": mode,
+                "PORT": str(port),
+                "SERVER_LOG_LEVEL": "warning",
+            }
+            if options["workers"]:
+                env["WEB_CONCURRENCY"] = str(options["workers"])
+            env.setdefault("SERVER_MAX_REQUESTS", "0")
+            command = [part.format(port=port) for part in SERVERS[mode]]
+            server = subprocess.Popen(
+                command,
+                cwd=settings.BASE_DIR,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                self.waitUntilReady(port)
+                rate, errors = self.run(port, options)
+            finally:
+                server.terminate()
+                server.wait()
+            self.stdout.write(
+                f"{mode}: {rate:.1f} requests/s over {options['requests']} requests "
+                f"with concurrency {options['concurrency']}, {errors} errors"
+            )
+
+    def waitUntilReady(self, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"The server did not start listening on port {port}")
+
+    def run(self, port, options):
+        local = threading.local()
+        errors = []
+
+        def request(_):
+            # One keep-alive connection per client thread
+            if not hasattr(local, "connection"):
+                local.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            try:
+                local.connection.request("GET", options["path"])
+                response = local.connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    errors.append(response.status)
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(e)
+                local.connection.close()
+                del local.connection
+
+        # Warm up every worker before measuring
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            list(pool.map(request, range(options["concurrency"] * 2)))
+        errors.clear()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            list(pool.map(request, range(options["requests"])))
+        elapsed = time.perf_counter() - start
+        return options["requests"] / elapsed, len(errors)
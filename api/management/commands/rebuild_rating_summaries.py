@@ -0,0 +1,44 @@
+"""
+Management command that rebuilds the rating summaries from the stored valuations.
+"""
+
+from api.models import UserRatingSummary
+from api.profile_cache import profileCache
+from common.models.valuation import Valuation
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+
+class Command(BaseCommand):
+    help = "Recompute every user rating summary from the valuations table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        histogram = {
+            f"stars{star}": Count("id", filter=Q(rating=star)) for star in UserRatingSummary.STARS
+        }
+        rows = (
+            Valuation.objects.values("receiver_id")
+            .annotate(count=Count("id"), total=Sum("rating"), **histogram)
+            .order_by("receiver_id")
+        )
+        summaries = [
+            UserRatingSummary(user_id=row.pop("receiver_id"), **row) for row in rows.iterator()
+        ]
+        with transaction.atomic():
+            UserRatingSummary.objects.all().delete()
+            UserRatingSummary.objects.bulk_create(summaries, batch_size=options["batch_size"])
+        profileCache.invalidate()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(summaries)} rating summaries"))
+        if not settings.TIERED_CACHE:
+            # The cache of each web process is not reached from this one
+            self.stdout.write(
+                self.style.WARNING(
+                    "No shared cache configured, the servers show the old ratings for up to "
+                    f"{settings.TIERED_CACHE_LOCAL_TTL} seconds"
+                )
+            )
@@ -0,0 +1,71 @@
+"""
+Management command supervising the background workers of the user api, each one in its own
+process that is started again when it exits:
+
+- validate_fcm_tokens checks the registered FCM tokens with Firebase
+- send_push_outbox sends the queued push notifications
+- send_email_outbox sends the queued emails, i.e. the password resets
+
+Run it once per deployment, either as its own service from the same image or from the
+gunicorn master with RUN_WORKERS=true (see gunicorn.conf.py).
+"""
+
+import signal
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+WORKERS = ["validate_fcm_tokens", "send_push_outbox", "send_email_outbox"]
+
+
+class Command(BaseCommand):
+    help = "Run the FCM token, push notification and email workers, restarting them on exit"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--restart-delay", type=float, default=5.0)
+        parser.add_argument(
+            "--stop-timeout",
+            type=float,
+            default=10.0,
+            help="Seconds the workers have to stop before they are killed",
+        )
+
+    def start(self, name):
+        self.stdout.write(f"Starting {name}")
+        return subprocess.Popen([sys.executable, str(settings.BASE_DIR / "manage.py"), name])
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        processes = {name: self.start(name) for name in WORKERS}
+        exitedAt = {}
+        while not self.stopping:
+            time.sleep(1)
+            for name, process in processes.items():
+                if process.poll() is None:
+                    continue
+                if name not in exitedAt:
+                    self.stderr.write(f"{name} exited with status {process.returncode}")
+                    exitedAt[name] = time.monotonic()
+                elif time.monotonic() - exitedAt[name] >= options["restart_delay"]:
+                    del exitedAt[name]
+                    processes[name] = self.start(name)
+
+        for process in processes.values():
+            if process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + options["stop_timeout"]
+        for name, process in processes.items():
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                self.stderr.write(f"{name} did not stop in time, killing it")
+                process.kill()
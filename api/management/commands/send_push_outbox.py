@@ -0,0 +1,39 @@
+"""
+Management command running the worker that sends the queued push notifications.
+"""
+
+import time
+
+from api.notifications.rate_limit import TokenBucket
+from api.views import pushController
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Send the queued push notifications to Firebase, at most PUSH_OUTBOX_RATE per second"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Send the due notifications and exit"
+        )
+        parser.add_argument("--interval", type=float, default=1.0)
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        # One token per device token, Firebase counts every message of a multicast
+        bucket = TokenBucket(settings.PUSH_OUTBOX_RATE)
+        while True:
+            result = pushController.deliverOutbox(options["batch_size"], bucket)
+            if result["sent"] or result["retried"] or result["failed"]:
+                self.stdout.write(
+                    f"Sent {result['sent']}, retried {result['retried']}, "
+                    f"failed {result['failed']} push notifications"
+                )
+            if options["once"]:
+                return
+            if result["deferred"] or sum(result.values()) == options["batch_size"]:
+                # Throttled or more work waiting, continue as soon as the rate allows it
+                time.sleep(bucket.wait())
+            else:
+                time.sleep(options["interval"])
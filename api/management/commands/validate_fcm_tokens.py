@@ -0,0 +1,29 @@
+"""
+Management command running the worker that validates the registered FCM tokens.
+"""
+
+import time
+
+from api.views import pushController
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Validate the pending FCM tokens with Firebase, promoting or purging them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Process the due tokens and exit")
+        parser.add_argument("--interval", type=float, default=5.0)
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        while True:
+            result = pushController.validatePendingTokens(options["batch_size"])
+            if any(result.values()):
+                self.stdout.write(
+                    f"Promoted {result['promoted']}, purged {result['purged']}, "
+                    f"retried {result['retried']} FCM tokens"
+                )
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
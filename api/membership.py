@@ -0,0 +1,57 @@
+"""
+This module resolves who takes part in a route with a single query per batch of routes
+"""
+
+from common.models.route import Route
+
+
+class RouteMembership:
+    """
+    The driver and passengers of a route, loaded once and checked in memory.
+    """
+
+    def __init__(self, routeId, driverId, passengerIds=()):
+        self.routeId = routeId
+        self.driverId = driverId
+        self.passengerIds = set(passengerIds)
+
+    def isDriver(self, userId):
+        return userId == self.driverId
+
+    def isPassenger(self, userId):
+        return userId in self.passengerIds
+
+    def isMember(self, userId):
+        return self.isDriver(userId) or self.isPassenger(userId)
+
+
+class RouteMembershipResolver:
+    """
+    Loads the membership of routes and keeps them for the lifetime of the resolver, so
+    several valuations of the same route only query the database once.
+    """
+
+    def __init__(self):
+        self.memberships = {}
+
+    def load(self, routeIds):
+        """
+        Loads the membership of every route not resolved yet with a single query.
+        """
+        missing = {routeId for routeId in routeIds if routeId not in self.memberships}
+        if not missing:
+            return
+        rows = Route.objects.filter(pk__in=missing).values_list("pk", "driver_id", "passengers__id")
+        for routeId, driverId, passengerId in rows:
+            membership = self.memberships.setdefault(routeId, RouteMembership(routeId, driverId))
+            if passengerId is not None:
+                membership.passengerIds.add(passengerId)
+        for routeId in missing:
+            self.memberships.setdefault(routeId, None)
+
+    def resolve(self, routeId):
+        """
+        Returns the membership of the route, None if the route does not exist.
+        """
+        self.load([routeId])
+        return self.memberships.get(routeId)
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('api', '0001_username_trigram_index'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRatingSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('stars1', models.PositiveIntegerField(default=0)),
+                ('stars2', models.PositiveIntegerField(default=0)),
+                ('stars3', models.PositiveIntegerField(default=0)),
+                ('stars4', models.PositiveIntegerField(default=0)),
+                ('stars5', models.PositiveIntegerField(default=0)),
+                ('updatedAt', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
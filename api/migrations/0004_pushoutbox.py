@@ -0,0 +1,37 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_fcmdevice'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PushOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.CharField(max_length=255)),
+                ('priority', models.CharField(default='normal', max_length=10)),
+                ('collapseKey', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('sent', 'sent'), ('failed', 'failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('nextAttemptAt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lastError', models.TextField(blank=True)),
+                ('createdAt', models.DateTimeField(auto_now_add=True)),
+                ('sentAt', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='push_outbox', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'nextAttemptAt'], name='api_pushout_status_156960_idx'), models.Index(fields=['user', 'collapseKey', 'status'], name='api_pushout_user_id_c39479_idx')],
+            },
+        ),
+    ]
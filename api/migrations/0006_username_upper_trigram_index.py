@@ -0,0 +1,38 @@
+"""
+Replaces the pg_trgm index on ``username`` by one on ``UPPER(username)``, the expression the
+``icontains`` lookups of the username search compile to on PostgreSQL. Only on PostgreSQL.
+"""
+
+from django.db import migrations
+
+
+def create_upper_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS auth_user_username_upper_trgm "
+        "ON auth_user USING gin ((UPPER(username::text)) gin_trgm_ops)"
+    )
+    schema_editor.execute("DROP INDEX IF EXISTS auth_user_username_trgm")
+
+
+def drop_upper_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS auth_user_username_trgm "
+        "ON auth_user USING gin (username gin_trgm_ops)"
+    )
+    schema_editor.execute("DROP INDEX IF EXISTS auth_user_username_upper_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_refreshtoken"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_upper_trigram_index, drop_upper_trigram_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_username_upper_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pushoutbox',
+            name='collapseKey',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='pushoutbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('sending', 'sending'), ('sent', 'sent'), ('failed', 'failed')], default='pending', max_length=10),
+        ),
+    ]
@@ -0,0 +1,248 @@
+"""
+This document contains the models owned by the user api, the shared ones live in common.models
+"""
+
+import hashlib
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.profile_cache import forgetProfile
+
+
+class UserRatingSummary(models.Model):
+    """
+    Materialized aggregate of the valuations received by a user, updated incrementally
+    every time a valuation is created or deleted so it never has to be computed from the
+    valuations.
+    """
+
+    STARS = [1, 2, 3, 4, 5]
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="rating_summary",
+    )
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    stars1 = models.PositiveIntegerField(default=0)
+    stars2 = models.PositiveIntegerField(default=0)
+    stars3 = models.PositiveIntegerField(default=0)
+    stars4 = models.PositiveIntegerField(default=0)
+    stars5 = models.PositiveIntegerField(default=0)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    @property
+    def mean(self):
+        """
+        Average rating received, None if the user has not been rated yet.
+        """
+        if not self.count:
+            return None
+        return round(self.total / self.count, 2)
+
+    @property
+    def histogram(self):
+        """
+        Number of valuations received for each star.
+        """
+        return {str(star): getattr(self, f"stars{star}") for star in self.STARS}
+
+    @classmethod
+    def addRatings(cls, userId, ratings):
+        """
+        Adds the given ratings to the summary of the user in a single UPDATE, the row is
+        created the first time the user is rated.
+        """
+        ratings = list(ratings)
+        if not ratings:
+            return
+        # The rating is part of the cached user
+        forgetProfile(userId)
+        changes = {
+            "count": F("count") + len(ratings),
+            "total": F("total") + sum(ratings),
+            # update() skips auto_now, the ETag of the rated user is built on it
+            "updatedAt": timezone.now(),
+        }
+        for star in cls.STARS:
+            amount = ratings.count(star)
+            if amount:
+                changes[f"stars{star}"] = F(f"stars{star}") + amount
+
+        if cls.objects.filter(user_id=userId).update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=userId)
+        except IntegrityError:
+            # Created concurrently by another request
+            pass
+        cls.objects.filter(user_id=userId).update(**changes)
+
+    @classmethod
+    def removeRatings(cls, userId, ratings):
+        """
+        Takes the given ratings out of the summary of the user in a single UPDATE, when the
+        valuations are deleted.
+        """
+        ratings = list(ratings)
+        if not ratings:
+            return
+        forgetProfile(userId)
+        changes = {
+            "count": F("count") - len(ratings),
+            "total": F("total") - sum(ratings),
+            "updatedAt": timezone.now(),
+        }
+        for star in cls.STARS:
+            amount = ratings.count(star)
+            if amount:
+                changes[f"stars{star}"] = F(f"stars{star}") - amount
+        # No row when the user is deleted along with the valuations
+        cls.objects.filter(user_id=userId).update(**changes)
+
+
+class FCMDevice(models.Model):
+    """
+    A device token registered by a user. Tokens are stored as pending and verified with
+    Firebase by the ``validate_fcm_tokens`` worker, out of the request that registered them.
+    """
+
+    PENDING = "pending"
+    VALID = "valid"
+
+    statusChoices = [(PENDING, "pending"), (VALID, "valid")]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="fcm_devices"
+    )
+    token = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=10, choices=statusChoices, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    nextAttemptAt = models.DateTimeField(default=timezone.now)
+    lastError = models.TextField(blank=True)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "nextAttemptAt"])]
+
+    def __str__(self):
+        return self.token
+
+
+class PushOutbox(models.Model):
+    """
+    A push notification waiting to be sent by the ``send_push_outbox`` worker. Notifications
+    to the same user with the same collapse key are merged while they wait, the ones without
+    a key are never merged. A worker sending a notification marks it as sending until
+    ``nextAttemptAt``, when another worker may claim it again.
+    """
+
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+    statusChoices = [
+        (PENDING, "pending"),
+        (SENDING, "sending"),
+        (SENT, "sent"),
+        (FAILED, "failed"),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="push_outbox"
+    )
+    title = models.CharField(max_length=255)
+    body = models.CharField(max_length=255)
+    priority = models.CharField(max_length=10, default="normal")
+    collapseKey = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=statusChoices, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    nextAttemptAt = models.DateTimeField(default=timezone.now)
+    lastError = models.TextField(blank=True)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    sentAt = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "nextAttemptAt"]),
+            models.Index(fields=["user", "collapseKey", "status"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.title}"
+
+
+class RefreshToken(models.Model):
+    """
+    Long-lived token exchanged for a new signed access token. Every refresh rotates it, so a
+    token can be used once, and using a rotated token again revokes every token of the user.
+    Only the SHA-256 hash of the token is stored.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="refresh_tokens"
+    )
+    tokenHash = models.CharField(max_length=64, unique=True)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    expiresAt = models.DateTimeField()
+    revokedAt = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.tokenHash[:8]}"
+
+    @staticmethod
+    def hash(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, userId):
+        """
+        Creates a refresh token for the user and returns its value, which is not stored.
+        """
+        token = secrets.token_urlsafe(32)
+        cls.objects.create(
+            user_id=userId,
+            tokenHash=cls.hash(token),
+            expiresAt=timezone.now() + timedelta(seconds=settings.REFRESH_TOKEN_TTL),
+        )
+        return token
+
+    @classmethod
+    def rotate(cls, token):
+        """
+        Revokes the refresh token and returns the id of its user with a new token, None if
+        the token is unknown, expired or revoked.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            refresh = (
+                cls.objects.select_for_update().filter(tokenHash=cls.hash(token)).first()
+            )
+            if refresh is None or refresh.expiresAt <= now:
+                return None
+            if refresh.revokedAt is not None:
+                # A rotated token used again has been stolen, log the user out everywhere
+                cls.revokeAll(refresh.user_id)
+                return None
+            refresh.revokedAt = now
+            refresh.save(update_fields=["revokedAt"])
+            return refresh.user_id, cls.issue(refresh.user_id)
+
+    @classmethod
+    def revokeAll(cls, userId):
+        """
+        Revokes every refresh token of the user.
+        """
+        cls.objects.filter(user_id=userId, revokedAt__isnull=True).update(
+            revokedAt=timezone.now()
+        )
@@ -1,16 +1,43 @@
+import logging
+from datetime import timedelta
 from email import message
 from enum import Enum
-from venv import logger
 
+from api.models import FCMDevice, PushOutbox
+from api.notifications.transport import (
+    DEAD_TOKEN_ERRORS,
+    MULTICAST_LIMIT,
+    PERMANENT_ERRORS,
+    get_transport,
+)
 from common.models.fcm import FCMToken
 from common.models.user import User
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 from firebase_admin.exceptions import FirebaseError
-from firebase_admin.messaging import AndroidConfig, Message, Notification, send
+from firebase_admin.messaging import AndroidConfig, Message, MulticastMessage, Notification
+
+logger = logging.getLogger(__name__)
 
 
 class PushController:
     tokens = FCMToken.objects
 
+    # Validation of the registered tokens, retried with exponential backoff
+    validationMaxAttempts = 5
+    validationBackoff = timedelta(seconds=30)
+    validationMaxBackoff = timedelta(hours=1)
+
+    # Delivery of the queued notifications, retried with exponential backoff
+    outboxMaxAttempts = 5
+    outboxBackoff = timedelta(seconds=10)
+    outboxMaxBackoff = timedelta(minutes=10)
+    outboxRetention = timedelta(days=1)
+    # Time a worker has to send the notifications it claimed before others claim them
+    outboxLease = timedelta(minutes=5)
+
     class FCMPriority(Enum):
         HIGH = "high"
         NORMAL = "normal"
@@ -21,45 +48,391 @@ class PushController:
         """
         return self.tokens.filter(user=user).first()
 
+    def hasDevices(self, user: User) -> bool:
+        """
+        - user: The user to check
+        """
+        return (
+            FCMDevice.objects.filter(user_id=user.pk, status=FCMDevice.VALID).exists()
+            or self.tokens.filter(user=user, token__isnull=False).exists()
+        )
+
     def addToken(self, user: User, token: str):
         """
         - user: The user to associate the token with
         - token: The token to associate with the user
 
-        rise
+        The token is stored as pending and checked with Firebase by validatePendingTokens,
+        so the request registering it does not wait for Firebase.
         """
-        FCMToken.objects.filter(user=user).delete()
-        t = FCMToken(user=user, token=token)
-        message = Message(
-            token=t.token,
-            notification=Notification(title="Validity check"),
-            android=AndroidConfig(priority="high"),
+        FCMDevice.objects.update_or_create(
+            token=token,
+            defaults={
+                "user_id": user.pk,
+                "status": FCMDevice.PENDING,
+                "attempts": 0,
+                "nextAttemptAt": timezone.now(),
+                "lastError": "",
+            },
         )
-        send(
-            message,
-            True,
+
+    def validatePendingTokens(self, limit: int = 100) -> dict:
+        """
+        - limit: The maximum number of tokens to check
+
+        Sends a dry run message to the pending tokens whose next attempt is due. Valid tokens
+        are promoted, tokens Firebase rejects are purged and the rest are retried later.
+        Returns how many tokens ended in each state.
+        """
+        result = {"promoted": 0, "purged": 0, "retried": 0}
+        due = FCMDevice.objects.filter(
+            status=FCMDevice.PENDING, nextAttemptAt__lte=timezone.now()
+        ).order_by("nextAttemptAt")[:limit]
+
+        for device in due:
+            message = Message(
+                token=device.token,
+                notification=Notification(title="Validity check"),
+                android=AndroidConfig(priority="high"),
+            )
+            try:
+                get_transport().send(message, True)
+            except PERMANENT_ERRORS as e:
+                logger.info(f"Purging invalid FCM token of user {device.user_id}: {e}")
+                device.delete()
+                result["purged"] += 1
+            except FirebaseError as e:
+                device.attempts += 1
+                if device.attempts >= self.validationMaxAttempts:
+                    device.delete()
+                    result["purged"] += 1
+                    continue
+                backoff = min(
+                    self.validationBackoff * 2 ** (device.attempts - 1), self.validationMaxBackoff
+                )
+                device.nextAttemptAt = timezone.now() + backoff
+                device.lastError = str(e)
+                device.save(update_fields=["attempts", "nextAttemptAt", "lastError", "updatedAt"])
+                result["retried"] += 1
+            else:
+                self.promote(device)
+                result["promoted"] += 1
+        return result
+
+    def promote(self, device: FCMDevice):
+        """
+        - device: The device whose token was accepted by Firebase
+
+        The other devices of the user are kept, the shared FCMToken points to the last one.
+        """
+        device.status = FCMDevice.VALID
+        device.lastError = ""
+        device.save(update_fields=["status", "lastError", "updatedAt"])
+        FCMToken.objects.filter(Q(user_id=device.user_id) | Q(token=device.token)).delete()
+        FCMToken.objects.create(user_id=device.user_id, token=device.token)
+
+    def tokensOf(self, userIds) -> dict:
+        """
+        - userIds: The users to get the device tokens for
+
+        Returns the tokens of every device of the users keyed by user id, resolved with a
+        single query over the validated devices and the tokens registered before them.
+        """
+        devices = FCMDevice.objects.filter(user_id__in=userIds, status=FCMDevice.VALID)
+        legacy = FCMToken.objects.filter(user_id__in=userIds, token__isnull=False)
+        rows = devices.values_list("user_id", "token").union(
+            legacy.values_list("user_id", "token")
         )
-        # Only saved if no exception is raised
-        t.save()
+        tokens = {}
+        for userId, token in rows:
+            tokens.setdefault(userId, []).append(token)
+        return tokens
+
+    def sendToTokens(
+        self, tokens: list, title: str, body: str, priority: FCMPriority = FCMPriority.NORMAL
+    ) -> dict:
+        """
+        - tokens: The device tokens to send the notification to
+        - title: The title of the notification
+        - body: The body of the notification
+        - priority: The priority of the notification either high or normal
+
+        Sends the notification with multicast messages of up to MULTICAST_LIMIT tokens and
+        prunes the tokens Firebase reports as unregistered. Returns the SendResponse of
+        every token.
+        """
+        responses = {}
+        for start in range(0, len(tokens), MULTICAST_LIMIT):
+            chunk = tokens[start : start + MULTICAST_LIMIT]
+            batch = get_transport().send_multicast(
+                MulticastMessage(
+                    tokens=chunk,
+                    notification=Notification(title=title, body=body),
+                    android=AndroidConfig(priority=priority.value),
+                )
+            )
+            responses.update(zip(chunk, batch.responses))
+
+        dead = [
+            token
+            for token, response in responses.items()
+            if isinstance(response.exception, DEAD_TOKEN_ERRORS)
+        ]
+        if dead:
+            self.pruneTokens(dead)
+        return responses
+
+    def pruneTokens(self, tokens: list):
+        """
+        - tokens: The tokens of the devices that no longer exist
+        """
+        logger.info(f"Pruning {len(tokens)} unregistered FCM tokens")
+        FCMDevice.objects.filter(token__in=tokens).delete()
+        FCMToken.objects.filter(token__in=tokens).delete()
 
     def notifyTo(
         self, user: User, title: str, body: str, priority: FCMPriority = FCMPriority.NORMAL
-    ) -> str:
+    ) -> int:
         """
         - user: The user to send the push notification
         - title: The title of the notification
         - body: The body of the notification
         - priority: The priority of the notification either high or normal
+
+        The notification reaches every device of the user, returns how many received it.
         """
-        t = self.tokens.filter(user=user)
+        tokens = self.tokensOf([user.pk]).get(user.pk, [])
+        if not tokens:
+            return 0
         try:
-            return send(
-                Message(
-                    token=t,
-                    notification=Notification(title=title, body=body),
-                    android=AndroidConfig(priority=priority.value),
-                ),
-            )
-        except FirebaseError | ValueError as e:
+            responses = self.sendToTokens(tokens, title, body, priority)
+        except (FirebaseError, ValueError) as e:
             logger.error(f"Failed to send notification {e}")
-            return ""
+            return 0
+        return sum(1 for response in responses.values() if response.success)
+
+    def notifyMany(
+        self, userIds: list, title: str, body: str, priority: FCMPriority = FCMPriority.NORMAL
+    ) -> list:
+        """
+        - userIds: The users to send the push notification
+        - title: The title of the notification
+        - body: The body of the notification
+        - priority: The priority of the notification either high or normal
+
+        The tokens of every user are resolved at once and sent together in multicast
+        batches. Returns, for each user, how many devices it has and how many were reached.
+        """
+        tokens = self.tokensOf(userIds)
+        allTokens = [token for userTokens in tokens.values() for token in userTokens]
+        responses = self.sendToTokens(allTokens, title, body, priority) if allTokens else {}
+
+        results = []
+        for userId in userIds:
+            userTokens = tokens.get(userId, [])
+            sent = sum(1 for token in userTokens if responses[token].success)
+            results.append({"user": userId, "devices": len(userTokens), "sent": sent})
+        return results
+
+    def enqueue(
+        self,
+        userIds: list,
+        title: str,
+        body: str,
+        priority: FCMPriority = FCMPriority.NORMAL,
+        collapseKey: str = None,
+    ) -> int:
+        """
+        - userIds: The users to send the push notification
+        - title: The title of the notification
+        - body: The body of the notification
+        - priority: The priority of the notification either high or normal
+        - collapseKey: Notifications with the same key replace each other, none by default
+
+        Stores the notification in the outbox for the send_push_outbox worker. With a collapse
+        key, a notification still waiting for the same user and key is replaced by this one,
+        and if one was sent, or is being sent, less than PUSH_OUTBOX_COALESCE_WINDOW seconds
+        ago this one waits for the window to end. Returns how many notifications were queued
+        or replaced.
+        """
+        now = timezone.now()
+        window = timedelta(seconds=settings.PUSH_OUTBOX_COALESCE_WINDOW)
+        content = {"title": title, "body": body, "priority": priority.value}
+
+        with transaction.atomic():
+            pending = {}
+            lastSent = {}
+            if collapseKey is not None:
+                recent = PushOutbox.objects.select_for_update().filter(
+                    Q(status__in=[PushOutbox.PENDING, PushOutbox.SENDING])
+                    | Q(status=PushOutbox.SENT, sentAt__gte=now - window),
+                    user_id__in=userIds,
+                    collapseKey=collapseKey,
+                )
+                for entry in recent:
+                    if entry.status == PushOutbox.PENDING:
+                        pending[entry.user_id] = entry
+                    else:
+                        # The ones being sent may reach the device right now
+                        sentAt = entry.sentAt or now
+                        lastSent[entry.user_id] = max(sentAt, lastSent.get(entry.user_id, sentAt))
+
+            replaced = list(pending.values())
+            for entry in replaced:
+                for field, value in content.items():
+                    setattr(entry, field, value)
+            PushOutbox.objects.bulk_update(replaced, list(content))
+
+            PushOutbox.objects.bulk_create(
+                [
+                    PushOutbox(
+                        user_id=userId,
+                        collapseKey=collapseKey,
+                        nextAttemptAt=lastSent[userId] + window if userId in lastSent else now,
+                        **content,
+                    )
+                    for userId in dict.fromkeys(userIds)
+                    if userId not in pending
+                ]
+            )
+        return len(dict.fromkeys(userIds))
+
+    def claimOutbox(self, limit: int) -> list:
+        """
+        - limit: The maximum number of notifications to claim
+
+        Marks the due notifications as being sent by this worker until outboxLease ends. The
+        rows locked by another worker claiming them at the same time are skipped, and the
+        ones whose lease ended, i.e. the worker sending them died, are claimed again.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            due = list(
+                PushOutbox.objects.select_for_update(skip_locked=True)
+                .filter(
+                    status__in=[PushOutbox.PENDING, PushOutbox.SENDING], nextAttemptAt__lte=now
+                )
+                .order_by("nextAttemptAt", "pk")[:limit]
+            )
+            PushOutbox.objects.filter(pk__in=[entry.pk for entry in due]).update(
+                status=PushOutbox.SENDING, nextAttemptAt=now + self.outboxLease
+            )
+        return due
+
+    def outboxBatches(self, entries: list, tokens: dict) -> list:
+        """
+        - entries: The notifications with the same content
+        - tokens: The tokens of their users keyed by user id
+
+        Packs the notifications in multicast batches of up to MULTICAST_LIMIT tokens without
+        splitting the tokens of a user, unless the user alone has more. Returns the entries
+        and tokens of each batch.
+        """
+        batches = []
+        batchEntries, batchTokens = [], []
+        for entry in entries:
+            userTokens = tokens.get(entry.user_id, [])
+            if batchTokens and len(batchTokens) + len(userTokens) > MULTICAST_LIMIT:
+                batches.append((batchEntries, batchTokens))
+                batchEntries, batchTokens = [], []
+            batchEntries.append(entry)
+            batchTokens.extend(userTokens)
+        if batchEntries:
+            batches.append((batchEntries, batchTokens))
+        return batches
+
+    def undelivered(self, responses: list):
+        """
+        - responses: The SendResponse of every token of a user
+
+        Firebase reports the errors of each token in its response instead of raising them.
+        Returns the error to retry the notification with when no device received it and any
+        failed with an error other than the device being gone, otherwise None.
+        """
+        if any(response.success for response in responses):
+            return None
+        for response in responses:
+            if not isinstance(response.exception, DEAD_TOKEN_ERRORS):
+                return response.exception
+        return None
+
+    def deliverOutbox(self, limit: int = 100, bucket=None) -> dict:
+        """
+        - limit: The maximum number of notifications to send
+        - bucket: The TokenBucket limiting the messages sent to Firebase, one per token
+
+        Claims the queued notifications whose time has come and sends the ones with the same
+        content together in multicast batches. The result of each batch is kept on its own,
+        so a failed batch, or a notification none of whose devices received it, is retried
+        with backoff until outboxMaxAttempts, then marked as failed, without sending the
+        other batches again. The notifications the bucket has no
+        room for wait for the next call. Returns how many notifications ended in each state.
+        """
+        result = {"sent": 0, "retried": 0, "failed": 0, "deferred": 0}
+        due = self.claimOutbox(limit)
+        if not due:
+            return result
+
+        groups = {}
+        for entry in due:
+            groups.setdefault((entry.title, entry.body, entry.priority), []).append(entry)
+        tokens = self.tokensOf([entry.user_id for entry in due])
+
+        failed = set()
+        deferred = set()
+        for (title, body, priority), entries in groups.items():
+            for batchEntries, batchTokens in self.outboxBatches(entries, tokens):
+                if deferred or (bucket is not None and not bucket.spend(len(batchTokens))):
+                    deferred.update(entry.pk for entry in batchEntries)
+                    continue
+                try:
+                    responses = (
+                        self.sendToTokens(batchTokens, title, body, self.FCMPriority(priority))
+                        if batchTokens
+                        else {}
+                    )
+                except (FirebaseError, ValueError) as e:
+                    logger.error(f"Failed to send queued notification {e}")
+                    for entry in batchEntries:
+                        entry.lastError = str(e)
+                        failed.add(entry.pk)
+                    continue
+                for entry in batchEntries:
+                    userTokens = tokens.get(entry.user_id, [])
+                    error = self.undelivered([responses[token] for token in userTokens])
+                    if error is not None:
+                        logger.error(f"Failed to send queued notification {error}")
+                        entry.lastError = str(error)
+                        failed.add(entry.pk)
+
+        now = timezone.now()
+        for entry in due:
+            if entry.pk in failed:
+                # A user split between batches is retried when any of them failed
+                entry.attempts += 1
+                if entry.attempts >= self.outboxMaxAttempts:
+                    entry.status = PushOutbox.FAILED
+                    result["failed"] += 1
+                else:
+                    entry.status = PushOutbox.PENDING
+                    backoff = min(
+                        self.outboxBackoff * 2 ** (entry.attempts - 1), self.outboxMaxBackoff
+                    )
+                    entry.nextAttemptAt = now + backoff
+                    result["retried"] += 1
+            elif entry.pk in deferred:
+                entry.status = PushOutbox.PENDING
+                entry.nextAttemptAt = now
+                result["deferred"] += 1
+            else:
+                entry.status = PushOutbox.SENT
+                entry.sentAt = now
+                result["sent"] += 1
+
+        PushOutbox.objects.bulk_update(
+            due, ["status", "attempts", "nextAttemptAt", "lastError", "sentAt"]
+        )
+        PushOutbox.objects.filter(
+            status=PushOutbox.SENT, sentAt__lt=now - self.outboxRetention
+        ).delete()
+        return result
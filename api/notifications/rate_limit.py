@@ -0,0 +1,62 @@
+"""
+Rate limiting of the messages sent to Firebase by the outbox worker.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Allows ``rate`` messages per second on average, with bursts of up to ``capacity`` messages.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updatedAt = clock()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updatedAt) * self.rate)
+        self.updatedAt = now
+
+    def take(self, wanted: int) -> int:
+        """
+        Takes up to ``wanted`` tokens without waiting, returns how many were taken.
+        """
+        with self.lock:
+            self.refill()
+            taken = min(wanted, int(self.tokens))
+            self.tokens -= taken
+            return taken
+
+    def spend(self, wanted: int) -> bool:
+        """
+        Takes ``wanted`` tokens when the bucket has them, or is full for a batch larger than
+        its capacity, which leaves it owing the rest. Returns whether they were taken.
+        """
+        with self.lock:
+            self.refill()
+            if self.tokens < min(wanted, self.capacity):
+                return False
+            self.tokens -= wanted
+            return True
+
+    def giveBack(self, unused: int):
+        """
+        Returns the tokens taken but not used.
+        """
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + unused)
+
+    def wait(self) -> float:
+        """
+        Returns the seconds until the next token is available.
+        """
+        with self.lock:
+            self.refill()
+            return max(0.0, (1 - self.tokens) / self.rate)
@@ -0,0 +1,94 @@
+"""
+Transports used by the PushController to talk with Firebase Cloud Messaging
+"""
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from django.utils.module_loading import import_string
+from firebase_admin.exceptions import InvalidArgumentError
+from firebase_admin.messaging import (
+    BatchResponse,
+    SenderIdMismatchError,
+    SendResponse,
+    UnregisteredError,
+    send,
+    send_each_for_multicast,
+)
+
+# Errors meaning the token will never be valid, any other error is worth retrying
+PERMANENT_ERRORS = (UnregisteredError, SenderIdMismatchError, InvalidArgumentError, ValueError)
+
+# Errors of a multicast response meaning the device is gone and its token must be pruned
+DEAD_TOKEN_ERRORS = (UnregisteredError, SenderIdMismatchError)
+
+# Maximum number of tokens Firebase accepts in a single multicast message
+MULTICAST_LIMIT = 500
+
+
+class FirebaseTransport:
+    """
+    Sends the messages through the Firebase Admin SDK.
+    """
+
+    def send(self, message, dry_run=False):
+        return send(message, dry_run)
+
+    def send_multicast(self, message, dry_run=False):
+        return send_each_for_multicast(message, dry_run)
+
+
+class FakeTransport:
+    """
+    Local transport for tests and development, it records the messages instead of sending
+    them. The tokens in ``failures`` raise the given exception when a message is sent to them.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.failures = {}
+
+    def send(self, message, dry_run=False):
+        error = self.failures.get(message.token)
+        if error is not None:
+            raise error
+        self.sent.append((message, dry_run))
+        return f"projects/fake/messages/{len(self.sent)}"
+
+    def send_multicast(self, message, dry_run=False):
+        self.sent.append((message, dry_run))
+        responses = []
+        for token in message.tokens:
+            error = self.failures.get(token)
+            if error is not None:
+                responses.append(SendResponse(None, error))
+            else:
+                responses.append(SendResponse({"name": f"projects/fake/messages/{token}"}, None))
+        return BatchResponse(responses)
+
+
+_transport = None
+
+
+def get_transport():
+    """
+    Returns the transport configured in ``settings.PUSH_TRANSPORT``.
+    """
+    global _transport
+    if _transport is None:
+        _transport = import_string(settings.PUSH_TRANSPORT)()
+    return _transport
+
+
+def reset_transport():
+    """
+    Drops the current transport, the next call to get_transport builds a new one.
+    """
+    global _transport
+    _transport = None
+
+
+@receiver(setting_changed)
+def push_transport_changed(setting, **kwargs):
+    if setting == "PUSH_TRANSPORT":
+        reset_transport()
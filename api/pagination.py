@@ -0,0 +1,183 @@
+"""
+This module contains the pagination classes used by the api list views
+"""
+
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor (keyset) pagination keyed on ``(<ordering field>, id)``.
+
+    Instead of ``OFFSET`` and ``COUNT(*)`` the page is located with a ``WHERE`` over the last
+    seen ``(value, id)`` pair, so the cost of a page does not depend on how deep it is nor on
+    the size of the table. The cursors returned in ``next``/``previous`` are opaque to the client.
+
+    The pagination is only applied when the client asks for it by sending ``cursor`` or
+    ``page_size``, this keeps the plain list response for the clients that already use it.
+
+    The ordering is taken from the ``OrderingFilter`` ``ordering`` query param, only the first
+    term is used and it must be one of the view ``ordering_fields``. The results of a username
+    search are keyed on their ``search_rank`` first, so the best matches come first.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = 50
+    max_page_size = 100
+    default_ordering = "createdAt"
+    invalid_cursor_message = "Invalid cursor"
+    rankField = "search_rank"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, view)
+        # The best matches of a search stay first, the ordering applies within each rank
+        self.ranked = self.rankField in queryset.query.annotations
+        cursor = self.decode_cursor(request)
+        self.has_cursor = cursor is not None
+        self.reverse = bool(cursor and cursor["r"])
+
+        keys = [(self.field, self.descending), ("id", self.descending)]
+        if self.ranked:
+            keys.insert(0, (self.rankField, False))
+        keys = [(name, descending != self.reverse) for name, descending in keys]
+        queryset = queryset.order_by(*(f"{'-' if desc else ''}{name}" for name, desc in keys))
+
+        if cursor is not None:
+            values = {
+                self.field: queryset.model._meta.get_field(self.field).to_python(cursor["v"]),
+                "id": cursor["id"],
+                self.rankField: cursor.get("k"),
+            }
+            after = Q()
+            for index, (name, desc) in enumerate(keys):
+                equal = {previous: values[previous] for previous, _ in keys[:index]}
+                after |= Q(**equal, **{f"{name}__{'lt' if desc else 'gt'}": values[name]})
+            queryset = queryset.filter(after)
+
+        # One extra row tells us if there is another page without counting
+        results = list(queryset[: self.page_size + 1])
+        self.has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if self.reverse:
+            results.reverse()
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def is_requested(self, request):
+        """
+        The pagination is opt-in, the client must send a cursor or a page size.
+        """
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        """
+        Returns the page size requested by the client capped to ``max_page_size``.
+        """
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, request, view):
+        """
+        Returns the keyset field and its direction from the ``ordering`` query param.
+        """
+        allowed = getattr(view, "ordering_fields", None) or [self.default_ordering]
+        params = request.query_params.get(OrderingFilter.ordering_param, "")
+        for term in (term.strip() for term in params.split(",")):
+            if term.lstrip("-") in allowed:
+                return term.lstrip("-"), term.startswith("-")
+        return self.default_ordering, False
+
+    def decode_cursor(self, request):
+        """
+        Decodes the opaque cursor sent by the client.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8"))
+            if cursor["f"] != self.field or cursor["d"] != self.descending:
+                raise ValueError("Cursor does not match the ordering")
+            if self.ranked:
+                cursor["k"] = int(cursor["k"])
+            cursor["id"] = int(cursor["id"])
+            cursor["r"] = bool(cursor["r"])
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, instance, reverse):
+        """
+        Returns the url pointing to the page after (or before) the given instance.
+        """
+        value = getattr(instance, self.field)
+        cursor = {
+            "f": self.field,
+            "d": self.descending,
+            "v": value.isoformat() if hasattr(value, "isoformat") else value,
+            "id": instance.pk,
+            "r": reverse,
+        }
+        if self.ranked:
+            cursor["k"] = getattr(instance, self.rankField)
+        encoded = urlsafe_b64encode(json.dumps(cursor).encode("utf-8")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.page:
+            return None
+        if self.reverse:
+            return self.encode_cursor(self.page[-1], reverse=False)
+        if not self.has_more:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_cursor:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        if self.reverse and not self.has_more:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
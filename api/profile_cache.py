@@ -0,0 +1,87 @@
+"""
+Cached responses of UserRetriever and DriverRetriever: the serialized user or driver and its
+ETag, kept for ``PROFILE_CACHE_TTL`` seconds and forgotten when this service changes it. A
+cached response is only served while its ETag matches the versions read from the database.
+"""
+
+from api.conditional import ConditionalGetMixin, fingerprintETag
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.http import Http404
+from rest_framework.response import Response
+from userApi.cache import TieredCache
+
+profileCache = TieredCache("profiles", timeout=settings.PROFILE_CACHE_TTL)
+
+
+def profileKey(kind, userId):
+    return f"{kind}:{userId}"
+
+
+def forgetProfile(userId):
+    """
+    Drops the cached user and driver representations of the user once the current
+    transaction commits, so a request reading meanwhile cannot cache the old row again.
+    """
+
+    def forget():
+        profileCache.delete(profileKey("user", userId))
+        profileCache.delete(profileKey("driver", userId))
+
+    transaction.on_commit(forget)
+
+
+class CachedRetrieveMixin(ConditionalGetMixin):
+    """
+    Serves the GET of a retrieve view from the profile cache, ``profileKind`` tells which
+    representation of the user the view returns. The cached entry keeps the ETag of the
+    representation, built from the versions of the user and its rating summary.
+
+    Every request reads those versions, a query much cheaper than the representation, so a
+    deleted user is not found and an entry cached before a change, i.e. in the L1 of a worker
+    that was not told about it, is rendered again instead of being served.
+    """
+
+    profileKind = None
+
+    def currentETag(self):
+        if not hasattr(self, "versionETag"):
+            lookup = self.lookup_url_kwarg or self.lookup_field
+            versions = (
+                self.filter_queryset(self.get_queryset())
+                .filter(**{self.lookup_field: self.kwargs[lookup]})
+                .values_list("pk", "updatedAt", "rating_summary__updatedAt")
+                .first()
+            )
+            if versions is None:
+                raise Http404
+            self.versionETag = fingerprintETag(self.profileKind, *versions)
+        return self.versionETag
+
+    def renderProfile(self):
+        instance = self.get_object()
+        try:
+            ratedAt = instance.rating_summary.updatedAt
+        except ObjectDoesNotExist:
+            ratedAt = None
+        return {
+            "etag": fingerprintETag(self.profileKind, instance.pk, instance.updatedAt, ratedAt),
+            "data": self.get_serializer(instance).data,
+        }
+
+    def cachedProfile(self):
+        if not hasattr(self, "profile"):
+            key = profileKey(self.profileKind, self.kwargs[self.lookup_field])
+            profile = profileCache.getOrSet(key, self.renderProfile)
+            if profile["etag"] != self.currentETag():
+                profile = self.renderProfile()
+                profileCache.set(key, profile)
+            self.profile = profile
+        return self.profile
+
+    def etag(self, request):
+        return self.currentETag()
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.cachedProfile()["data"])
@@ -0,0 +1,209 @@
+"""
+This module contains the username search backends used by the user and driver lists
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from common.models.user import User
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+from django.utils.module_loading import import_string
+from rest_framework.filters import SearchFilter
+
+EXACT, PREFIX, CONTAINS = 0, 1, 2
+
+
+class UsernameSearchBackend:
+    """
+    Base class for the username search backends.
+
+    A backend filters a queryset of users by username and annotates every row with a
+    ``search_rank`` (0 exact match, 1 prefix match, 2 substring match) so the best matches
+    are returned first.
+    """
+
+    def search(self, queryset, terms):
+        """
+        Returns the users of the queryset whose username contains every term, best matches first.
+        """
+        raise NotImplementedError
+
+    def suggest(self, queryset, term, limit):
+        """
+        Returns at most ``limit`` users for the type-ahead of ``term``.
+        """
+        return self.search(queryset, [term])[:limit]
+
+
+def rankByUsername(queryset, term):
+    """
+    Annotates the ``search_rank`` of every user of the queryset for ``term``.
+    """
+    return queryset.annotate(
+        search_rank=Case(
+            When(username__iexact=term, then=Value(EXACT)),
+            When(username__istartswith=term, then=Value(PREFIX)),
+            default=Value(CONTAINS),
+            output_field=IntegerField(),
+        )
+    )
+
+
+class TrigramSearchBackend(UsernameSearchBackend):
+    """
+    PostgreSQL backend, the ``icontains`` lookups compile to ``UPPER(username) LIKE`` and are
+    served by the ``pg_trgm`` GIN index on ``UPPER(username)`` created by the ``api``
+    migrations, the results are ranked by trigram similarity.
+    """
+
+    def search(self, queryset, terms):
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        for term in terms:
+            queryset = queryset.filter(username__icontains=term)
+        term = terms[0]
+        return (
+            rankByUsername(queryset, term)
+            .annotate(search_similarity=TrigramSimilarity("username", term))
+            .order_by("search_rank", "-search_similarity", "id")
+        )
+
+
+class NGramSearchBackend(UsernameSearchBackend):
+    """
+    In-process n-gram index for the databases without trigram support (SQLite).
+
+    The index maps every n-gram of the lowercased usernames to the user ids containing it,
+    it is loaded on first use and kept up to date by the ``api.signals`` receivers. Each
+    worker has its own index, which only sees the users created or renamed through that
+    worker: the others are missed until ``reloadAfter`` seconds pass and the index is loaded
+    again, as are the rows updated with ``QuerySet.update``. The results are always filtered
+    against the database, so a stale entry can only miss a match, never return a wrong user.
+
+    The index only narrows the query down to at most ``maxCandidates`` ids, terms shorter than
+    ``n`` or matching more users are searched with ``icontains`` in the database.
+    """
+
+    n = 3
+    maxCandidates = 500
+    reloadAfter = 300
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.loadedAt = 0.0
+        self.usernames = {}
+        self.grams = defaultdict(set)
+
+    def ngrams(self, value):
+        return {value[i : i + self.n] for i in range(len(value) - self.n + 1)}
+
+    def load(self):
+        with self.lock:
+            if self.loaded and time.monotonic() - self.loadedAt < self.reloadAfter:
+                return
+            self.usernames = {}
+            self.grams = defaultdict(set)
+            for pk, username in User.objects.values_list("pk", "username"):
+                self.add(pk, username)
+            self.loaded = True
+            self.loadedAt = time.monotonic()
+
+    def add(self, pk, username):
+        username = username.lower()
+        self.usernames[pk] = username
+        for gram in self.ngrams(username):
+            self.grams[gram].add(pk)
+
+    def update(self, pk, username):
+        """
+        Indexes the new username of a user.
+        """
+        if not self.loaded:
+            return
+        with self.lock:
+            if self.usernames.get(pk) == username.lower():
+                return
+            self.discard(pk)
+            self.add(pk, username)
+
+    def remove(self, pk):
+        """
+        Removes a user from the index.
+        """
+        if not self.loaded:
+            return
+        with self.lock:
+            self.discard(pk)
+
+    def discard(self, pk):
+        username = self.usernames.pop(pk, None)
+        if username is None:
+            return
+        for gram in self.ngrams(username):
+            self.grams[gram].discard(pk)
+            if not self.grams[gram]:
+                del self.grams[gram]
+
+    def candidates(self, term):
+        """
+        Returns the ids of the users that may contain ``term``, None when the index cannot
+        narrow the search down to ``maxCandidates`` users.
+        """
+        self.load()
+        term = term.lower()
+        if len(term) < self.n:
+            return None
+        with self.lock:
+            postings = sorted((self.grams.get(g, set()) for g in self.ngrams(term)), key=len)
+            ids = set(postings[0])
+            for posting in postings[1:]:
+                ids &= posting
+            ids = {pk for pk in ids if term in self.usernames[pk]}
+        return ids if len(ids) <= self.maxCandidates else None
+
+    def search(self, queryset, terms):
+        for term in terms:
+            candidates = self.candidates(term)
+            if candidates is not None:
+                queryset = queryset.filter(pk__in=sorted(candidates))
+            queryset = queryset.filter(username__icontains=term)
+        return rankByUsername(queryset, terms[0]).order_by("search_rank", "username", "id")
+
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Returns the configured username search backend.
+
+    ``settings.USERNAME_SEARCH_BACKEND`` selects the backend by its dotted path, when it is
+    not set the trigram backend is used on PostgreSQL and the n-gram index elsewhere.
+    """
+    global _backend
+    if _backend is None:
+        path = getattr(settings, "USERNAME_SEARCH_BACKEND", None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == "postgresql":
+            _backend = TrigramSearchBackend()
+        else:
+            _backend = NGramSearchBackend()
+    return _backend
+
+
+class UsernameSearchFilter(SearchFilter):
+    """
+    Drop-in replacement of ``SearchFilter`` that delegates the username search to the
+    configured backend instead of issuing ``icontains`` scans.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return get_search_backend().search(queryset, terms)
@@ -4,19 +4,61 @@ This document contains all the serializers that will be used by the api
 
 from os import write
 
-from common.models.route import Route
+from achievement.signals import valuations_created
+from api.membership import RouteMembershipResolver
+from api.models import UserRatingSummary
+from api.profile_cache import forgetProfile
 from common.models.user import ChargerType, Driver, Preference, Report, User
 from common.models.valuation import Valuation
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.forms import ChoiceField
+from rest_framework.exceptions import NotFound
 from rest_framework.serializers import (
     CharField,
     ChoiceField,
+    FloatField,
     IntegerField,
+    ListField,
     ModelSerializer,
     Serializer,
+    SerializerMethodField,
     ValidationError,
 )
+from usrLogin.hashing import hashPool
+
+
+class RatingSummarySerializer(ModelSerializer):
+    """
+    The serializer for the rating summary of a user
+
+    Args:
+        serializers (ModelSerializer): a serializer model to conveniently manipulate the class
+        and create the JSON
+    """
+
+    mean = FloatField(read_only=True)
+    histogram = SerializerMethodField()
+
+    class Meta:
+        """
+        The Meta definition for the rating summary
+        """
+
+        model = UserRatingSummary
+        fields = ["count", "total", "mean", "histogram"]
+
+    def get_histogram(self, obj) -> dict:
+        return obj.histogram
+
+
+def ratingSummaryOf(user):
+    """
+    Returns the rating summary of the user, an empty one if the user was never rated.
+    """
+    try:
+        return user.rating_summary
+    except UserRatingSummary.DoesNotExist:
+        return UserRatingSummary(user_id=user.pk)
 
 
 class UserSerializer(ModelSerializer):
@@ -29,6 +71,7 @@ class UserSerializer(ModelSerializer):
     """
 
     password2 = CharField(max_length=50, write_only=True, required=False)
+    rating = SerializerMethodField()
 
     class Meta:
         """
@@ -47,6 +90,7 @@ class UserSerializer(ModelSerializer):
             "password2",
             "birthDate",
             "profileImage",
+            "rating",
         ]
         extra_kwargs = {
             "points": {"read_only": True},
@@ -78,11 +122,34 @@ class UserSerializer(ModelSerializer):
             raise ValidationError({"password": "Passwords must match."})
         return super().validate(attrs)
 
+    def get_rating(self, obj) -> dict:
+        return RatingSummarySerializer(ratingSummaryOf(obj)).data
+
     def update(self, instance, validated_data):
         password = validated_data.pop("password", None)
         if password:
             instance.set_password(password)
-        return super().update(instance, validated_data)
+        instance = super().update(instance, validated_data)
+        forgetProfile(instance.id)
+        return instance
+
+
+class UserSuggestionSerializer(ModelSerializer):
+    """
+    The serializer for the username autocomplete
+
+    Args:
+        serializers (ModelSerializer): a serializer model to conveniently manipulate the class
+        and create the JSON
+    """
+
+    class Meta:
+        """
+        The Meta definition for user
+        """
+
+        model = User
+        fields = ["id", "username", "profileImage"]
 
 
 class UserImageUpdateSerializer(ModelSerializer):
@@ -108,6 +175,7 @@ class UserImageUpdateSerializer(ModelSerializer):
         profileImage = validated_data.pop("profileImage")
         instance.profileImage = profileImage
         instance.save()
+        forgetProfile(instance.id)
         return instance
 
 
@@ -168,10 +236,12 @@ class UserRegisterSerializer(ModelSerializer):
 
     def create(self, validated_data):
         validated_data.pop("password2")  # Remove password2 from saving
-        password = validated_data.pop("password")
-        user = User.objects.create_user(**validated_data)
-        user.set_password(password)
-        user.save()
+        # Hashed before anything is stored, a saturated pool leaves no user behind
+        passwordHash = hashPool.makePassword(validated_data.pop("password"))
+        with transaction.atomic():
+            user = User.objects.create_user(**validated_data)
+            user.password = passwordHash
+            user.save()
         return user
 
 
@@ -249,6 +319,7 @@ class DriverSerializer(UserSerializer):
                 "talkTooMuch", preference.talkTooMuch)
             preference.save()
 
+        # UserSerializer.update forgets the cached driver
         return super().update(instance, validated_data)
 
 
@@ -312,22 +383,24 @@ class DriverRegisterSerializer(ModelSerializer):
 
     def create(self, validated_data):
         validated_data.pop("password2")  # Remove password2 from saving
-        password = validated_data.pop("password")
+        # Hashed before anything is stored, a saturated pool leaves no driver behind
+        passwordHash = hashPool.makePassword(validated_data.pop("password"))
         preferenceData = validated_data.pop("preference")
         chargerTypesData = validated_data.pop("chargerTypes", None)
 
-        preference = Preference.objects.create(**preferenceData)
+        with transaction.atomic():
+            preference = Preference.objects.create(**preferenceData)
 
-        driver = Driver.objects.create_user(
-            **validated_data, preference=preference)
-        driver.set_password(password)
-        driver.save()
+            driver = Driver.objects.create_user(
+                **validated_data, preference=preference)
+            driver.password = passwordHash
+            driver.save()
 
-        if chargerTypesData:
-            for chargerTypeData in chargerTypesData:
-                chargerType = ChargerType.objects.get(
-                    chargerType=chargerTypeData)
-                driver.chargerTypes.add(chargerType)
+            if chargerTypesData:
+                for chargerTypeData in chargerTypesData:
+                    chargerType = ChargerType.objects.get(
+                        chargerType=chargerTypeData)
+                    driver.chargerTypes.add(chargerType)
 
         return driver
 
@@ -380,6 +453,38 @@ class ValuationSerializer(ModelSerializer):
         fields = ["id", "giver", "receiver", "rating", "comment"]
 
 
+ALREADY_RATED = "You have already rated this user in this route."
+
+
+def valuationError(giverId, receiverId, membership, receiverExists):
+    """
+    Checks the rules of a valuation against the membership of its route.
+
+    Args:
+        giverId (int): the user giving the valuation
+        receiverId (int): the user receiving the valuation
+        membership (RouteMembership): the members of the route
+        receiverExists (callable): looks the receiver up, only called when it is not a member
+
+    Returns:
+        str: the message of the first rule broken, None if the valuation is valid
+    """
+    receiverIsMember = membership is not None and membership.isMember(receiverId)
+    # A member of the route always exists, only look the receiver up when it is not
+    if not receiverIsMember and not receiverExists():
+        return "Invalid receiver ID. User not found."
+    if receiverId == giverId:
+        return "You cannot rate yourself."
+    if not receiverIsMember:
+        return "The receiver is not part of the route."
+    # The giver, i.e the authificated user, belongs to the route
+    if not membership.isMember(giverId):
+        return "The giver is not part of the route."
+    if membership.isPassenger(giverId) and membership.isPassenger(receiverId):
+        return "A passenger cannot value other passengers."
+    return None
+
+
 class ValuationRegisterSerializer(ModelSerializer):
     """
     This is the Serializer for valuation creation
@@ -402,41 +507,23 @@ class ValuationRegisterSerializer(ModelSerializer):
         receiverId = attrs.get("receiver").get("id")
         giver = self.context["request"].user
 
-        if not User.objects.filter(pk=receiverId).exists():
-            raise ValidationError(
-                {"error": "Invalid receiver ID. User not found."})
-
-        receiver = User.objects.get(pk=receiverId)
-
-        if receiver.pk == giver.pk:
-            raise ValidationError({"error": "You cannot rate yourself."})
-
+        # The route ids of the driver and passengers are resolved once and checked in memory
+        resolver = self.context.get("membershipResolver") or RouteMembershipResolver()
         route_id = attrs["route"].pk
-        if not (
-            Route.objects.filter(driver=receiver, pk=route_id).exists()
-            or Route.objects.filter(passengers=receiver, pk=route_id).exists()
-        ):
-            raise ValidationError(
-                {"error": "The receiver is not part of the route."})
-
-        # The giver, i.e the authificated user, belongs to the route
-        if not (
-            Route.objects.filter(driver=giver, pk=route_id).exists()
-            or Route.objects.filter(passengers=giver, pk=route_id).exists()
-        ):
-            raise ValidationError(
-                {"error": "The giver is not part of the route."})
-
-        if (
-            Route.objects.filter(passengers=giver, pk=route_id).exists()
-            and Route.objects.filter(passengers=receiver, pk=route_id).exists()
-        ):
-            raise ValidationError(
-                {"error": "A passenger cannot value other passengers."})
+        membership = resolver.resolve(route_id)
 
-        if Valuation.objects.filter(giver=giver, receiver=receiver, route_id=route_id).exists():
-            raise ValidationError(
-                {"error": "You have already rated this user in this route."})
+        error = valuationError(
+            giver.pk,
+            receiverId,
+            membership,
+            lambda: User.objects.filter(pk=receiverId).exists(),
+        )
+        if error is None and Valuation.objects.filter(
+            giver_id=giver.pk, receiver_id=receiverId, route_id=route_id
+        ).exists():
+            error = ALREADY_RATED
+        if error is not None:
+            raise ValidationError({"error": error})
 
         return attrs
 
@@ -444,23 +531,120 @@ class ValuationRegisterSerializer(ModelSerializer):
         receiver_id = validated_data.get("receiver").get("id")
         route = validated_data.get("route")
         rating = validated_data.get("rating")
-        comment = validated_data.get("comment")
+        comment = validated_data.get("comment", "")
         giver_id = self.context["request"].user.id
 
         try:
-            valuation = Valuation.objects.create(
-                giver_id=giver_id,
-                receiver_id=receiver_id,
-                route=route,
-                rating=rating,
-                comment=comment,
-            )
+            with transaction.atomic():
+                valuation = Valuation.objects.create(
+                    giver_id=giver_id,
+                    receiver_id=receiver_id,
+                    route=route,
+                    rating=rating,
+                    comment=comment,
+                )
+                UserRatingSummary.addRatings(receiver_id, [rating])
         except Exception as e:
             raise ValidationError({"error": str(e)})
 
         return valuation
 
 
+class BulkValuationEntrySerializer(Serializer):
+    """
+    One of the valuations of a bulk submission
+    """
+
+    receiver = IntegerField()
+    route = IntegerField()
+    rating = ChoiceField(choices=Valuation.RATING_CHOICES)
+    comment = CharField(required=False, allow_blank=True, default="")
+
+
+class BulkValuationSerializer(Serializer):
+    """
+    This is the Serializer for the bulk valuation creation, every valuation is validated
+    against a single load of the routes and the valid ones are inserted together.
+
+    Args:
+        serializers(Serializer): a serializer model to conveniently manipulate the class
+        and create the JSON
+    """
+
+    maxValuations = 50
+
+    valuations = ListField(
+        child=BulkValuationEntrySerializer(), min_length=1, max_length=maxValuations
+    )
+
+    def create(self, validated_data):
+        entries = validated_data["valuations"]
+        giverId = self.context["request"].user.pk
+
+        routeIds = {entry["route"] for entry in entries}
+        resolver = RouteMembershipResolver()
+        resolver.load(routeIds)
+
+        # Receivers outside their route are looked up together and only when there are any
+        outsiders = set()
+        for entry in entries:
+            membership = resolver.resolve(entry["route"])
+            if membership is None or not membership.isMember(entry["receiver"]):
+                outsiders.add(entry["receiver"])
+        existing = set(User.objects.filter(pk__in=outsiders).values_list("pk", flat=True))
+        rated = set(
+            Valuation.objects.filter(giver_id=giverId, route_id__in=routeIds).values_list(
+                "receiver_id", "route_id"
+            )
+        )
+
+        results = []
+        valuations = []
+        for index, entry in enumerate(entries):
+            receiverId, routeId = entry["receiver"], entry["route"]
+            membership = resolver.resolve(routeId)
+            error = None
+            if membership is None:
+                error = "Invalid route ID. Route not found."
+            if error is None:
+                error = valuationError(
+                    giverId, receiverId, membership, lambda: receiverId in existing
+                )
+            if error is None and (receiverId, routeId) in rated:
+                error = ALREADY_RATED
+            if error is not None:
+                results.append({"index": index, "created": False, "error": error})
+                continue
+            rated.add((receiverId, routeId))
+            valuation = Valuation(
+                giver_id=giverId,
+                receiver_id=receiverId,
+                route_id=routeId,
+                rating=int(entry["rating"]),
+                comment=entry["comment"],
+            )
+            valuations.append(valuation)
+            results.append({"index": index, "created": True, "valuation": valuation})
+
+        if valuations:
+            try:
+                with transaction.atomic():
+                    Valuation.objects.bulk_create(valuations)
+                    ratings = {}
+                    for valuation in valuations:
+                        ratings.setdefault(valuation.receiver_id, []).append(valuation.rating)
+                    for receiverId, receiverRatings in ratings.items():
+                        UserRatingSummary.addRatings(receiverId, receiverRatings)
+                    valuations_created(giverId, valuations)
+            except IntegrityError:
+                raise ValidationError({"error": ALREADY_RATED})
+
+        for result in results:
+            if result["created"]:
+                result["id"] = result.pop("valuation").pk
+        return results
+
+
 class FCMTokenSerializer(Serializer):
     token = CharField(max_length=255)
 
@@ -474,6 +658,59 @@ class FCMessageSerializer(Serializer):
     title = CharField(max_length=255)
     body = CharField(max_length=255)
     priority = ChoiceField(choices=["normal", "high"], required=False)
+    collapseKey = CharField(max_length=255, required=False)
+
+
+class BulkFCMessageSerializer(FCMessageSerializer):
+    """
+    The serializer for a notification sent to many users, either listed or the passengers
+    of a route
+    """
+
+    maxUsers = 1000
+
+    users = ListField(child=IntegerField(), required=False, max_length=maxUsers)
+    route = IntegerField(required=False)
+
+    def validate(self, attrs):
+        if not attrs.get("users") and attrs.get("route") is None:
+            raise ValidationError("Either users or route must be given.")
+        return attrs
+
+    def routeMembership(self):
+        """
+        Returns the members of the route to notify, None when no route is given.
+        """
+        routeId = self.validated_data.get("route")
+        if routeId is None:
+            return None
+        if not hasattr(self, "membership"):
+            self.membership = RouteMembershipResolver().resolve(routeId)
+        if self.membership is None:
+            raise NotFound("Route not found.")
+        return self.membership
+
+    def allowedFor(self, user):
+        """
+        Whether the user may send this notification: admins notify anyone, the driver of a
+        route only the passengers of that route.
+        """
+        if user.is_staff:
+            return True
+        if self.validated_data.get("users"):
+            return False
+        membership = self.routeMembership()
+        return membership is not None and membership.isDriver(user.id)
+
+    def recipients(self):
+        """
+        Returns the ids of the users to notify, without duplicates.
+        """
+        userIds = list(self.validated_data.get("users", []))
+        membership = self.routeMembership()
+        if membership is not None:
+            userIds += sorted(membership.passengerIds)
+        return list(dict.fromkeys(userIds))
 
 
 class UserToDriverSerializer(Serializer):
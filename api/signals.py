@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from common.models.user import User, Driver
+from common.models.valuation import Valuation
+from api.authentication import tokenCache
+from api.models import UserRatingSummary
+from api.search import NGramSearchBackend, get_search_backend
+
+
+# Keep the in-process username index in sync with the users table
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Driver)
+def index_username(sender, instance, **kwargs):
+    backend = get_search_backend()
+    if isinstance(backend, NGramSearchBackend):
+        backend.update(instance.pk, instance.username)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Driver)
+def unindex_username(sender, instance, **kwargs):
+    backend = get_search_backend()
+    if isinstance(backend, NGramSearchBackend):
+        backend.remove(instance.pk)
+
+
+# Replaced or purged (password reset) tokens stop authenticating at once, generate_token
+# upserts the row without signals and drops the old key itself
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    tokenCache.invalidate(instance.key)
+
+
+# The cached user must not outlive a change of the user, i.e. being deactivated
+@receiver(post_save, sender=get_user_model())
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Driver)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Driver)
+def forget_user_token(sender, instance, **kwargs):
+    tokenCache.invalidateUser(instance.pk)
+
+
+# The summary of the receiver is only incremented on creation, a deleted valuation, i.e. by
+# the cascade of its route or giver, is taken out of it
+@receiver(post_delete, sender=Valuation)
+def remove_rating(sender, instance, **kwargs):
+    UserRatingSummary.removeRatings(instance.receiver_id, [instance.rating])
@@ -0,0 +1,303 @@
+"""
+This module contains the tests for the achievements.
+"""
+
+from io import StringIO
+from types import SimpleNamespace
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+from common.models.achievement import Achievement, UserAchievementProgress
+from common.models.user import User
+from achievement.catalog import AchievementCatalog, catalog
+from achievement.signals import check_and_increment_progress, initialize_achievements
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+
+
+class InitializeAchievementsTest(APITestCase):
+    """
+    Test the initialization of the achievements of the users.
+    """
+
+    def setUp(self):
+        for title in ["CriticoEstelar", "Camaleon", "Viajero"]:
+            Achievement.objects.create(title=title, description=title, required_points=1)
+
+    def tearDown(self):
+        catalog.invalidate()
+
+    def testUserCreatedHasEveryAchievement(self):
+        """
+        Ensure a new user gets the progress of every achievement.
+        """
+
+        user = User.objects.create(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        self.assertEqual(UserAchievementProgress.objects.filter(user=user).count(), 3)
+
+    def testOnlyMissingAchievementsAreCreated(self):
+        """
+        Ensure the initialization only inserts the missing rows, in a constant number of queries.
+        """
+
+        user = User.objects.create(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        UserAchievementProgress.objects.filter(user=user, achievement__title="Camaleon").delete()
+        UserAchievementProgress.objects.filter(user=user, achievement__title="Viajero").update(
+            progress=1
+        )
+
+        with self.assertNumQueries(2):
+            initialize_achievements(user)
+        self.assertEqual(UserAchievementProgress.objects.filter(user=user).count(), 3)
+        self.assertEqual(
+            UserAchievementProgress.objects.get(user=user, achievement__title="Viajero").progress, 1
+        )
+
+    def testBackfillCommand(self):
+        """
+        Ensure the backfill command creates the rows of the existing users.
+        """
+
+        users = [
+            User.objects.create(
+                username=f"test{i}",
+                birthDate="1998-10-06",
+                password="test",
+                email=f"test{i}@gmail.com",
+            )
+            for i in range(3)
+        ]
+        Achievement.objects.create(title="Nuevo", description="Nuevo", required_points=1)
+        UserAchievementProgress.objects.filter(user=users[0]).delete()
+
+        call_command("backfill_achievements", "--chunk-size", "2", stdout=StringIO())
+        for user in users:
+            self.assertEqual(UserAchievementProgress.objects.filter(user=user).count(), 4)
+
+
+class AchievementCatalogTest(APITestCase):
+    """
+    Test the in-process catalog of achievements.
+    """
+
+    def setUp(self):
+        catalog.invalidate()
+        self.achievement = Achievement.objects.create(
+            title="Camaleon", description="Camaleon", required_points=1
+        )
+
+    def tearDown(self):
+        catalog.invalidate()
+
+    def testCatalogIsLoadedOnce(self):
+        """
+        Ensure the achievements are only queried the first time.
+        """
+
+        with self.assertNumQueries(1):
+            self.assertEqual(catalog.get("Camaleon").pk, self.achievement.pk)
+            self.assertIsNone(catalog.get("Unknown"))
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.get("Camaleon").pk, self.achievement.pk)
+
+    def testCatalogIsInvalidatedOnSave(self):
+        """
+        Ensure saving or deleting an achievement reloads the catalog.
+        """
+
+        catalog.get("Camaleon")
+        self.achievement.title = "Camaleonico"
+        self.achievement.save()
+        self.assertIsNone(catalog.get("Camaleon"))
+        self.assertEqual(catalog.get("Camaleonico").pk, self.achievement.pk)
+
+        self.achievement.delete()
+        self.assertIsNone(catalog.get("Camaleonico"))
+
+    def testCatalogExpires(self):
+        """
+        Ensure the achievements changed by other services are seen once the catalog expires.
+        """
+
+        now = [0.0]
+        local = AchievementCatalog(clock=lambda: now[0])
+        self.assertIsNone(local.get("Viajero"))
+        # Created without the signals, as another service sharing the database would
+        Achievement.objects.bulk_create(
+            [Achievement(title="Viajero", description="Viajero", required_points=1)]
+        )
+        self.assertIsNone(local.get("Viajero"))
+        now[0] += 300
+        self.assertIsNotNone(local.get("Viajero"))
+
+    @override_settings(ACHIEVEMENT_CATALOG_CACHE="default")
+    def testSharedCatalog(self):
+        """
+        Ensure a catalog of another worker sees the invalidation through the shared cache.
+        """
+
+        other = AchievementCatalog()
+        catalog.invalidate()
+        self.assertEqual(other.get("Camaleon").pk, self.achievement.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(AchievementCatalog().get("Camaleon").pk, self.achievement.pk)
+
+        Achievement.objects.create(title="Viajero", description="Viajero", required_points=1)
+        self.assertIsNotNone(other.get("Viajero"))
+
+
+class IncrementProgressTest(APITestCase):
+    """
+    Test the atomic increment of the achievement progress.
+    """
+
+    def setUp(self):
+        self.achievement = Achievement.objects.create(
+            title="CriticoEstelar", description="Valuate", required_points=2
+        )
+        self.user = User.objects.create(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        self.event = SimpleNamespace(createdAt=timezone.now())
+
+    def tearDown(self):
+        catalog.invalidate()
+
+    def progress(self):
+        return UserAchievementProgress.objects.get(user=self.user, achievement=self.achievement)
+
+    def testIncrementIsSingleUpdate(self):
+        """
+        Ensure every event is a single UPDATE and the achievement is flipped on the threshold.
+        """
+
+        with self.assertNumQueries(1):
+            check_and_increment_progress(self.user.pk, self.achievement, self.event)
+        self.assertEqual(self.progress().progress, 1)
+        self.assertFalse(self.progress().achieved)
+
+        check_and_increment_progress(self.user.pk, self.achievement, self.event)
+        self.assertEqual(self.progress().progress, 2)
+        self.assertTrue(self.progress().achieved)
+        self.assertEqual(self.progress().date_achieved, self.event.createdAt)
+
+        # Once achieved the progress does not change anymore
+        check_and_increment_progress(
+            self.user.pk, self.achievement, SimpleNamespace(createdAt=timezone.now())
+        )
+        self.assertEqual(self.progress().progress, 2)
+        self.assertEqual(self.progress().date_achieved, self.event.createdAt)
+
+    def testMissingProgressIsCreated(self):
+        """
+        Ensure the progress row is created when the user does not have it.
+        """
+
+        UserAchievementProgress.objects.filter(user=self.user).delete()
+        check_and_increment_progress(self.user.pk, self.achievement, self.event, 3)
+        self.assertEqual(self.progress().progress, 3)
+        self.assertTrue(self.progress().achieved)
+
+
+class ConditionalAchievementListTest(APITestCase):
+    """
+    Test the conditional GET of the achievement lists.
+    """
+
+    def setUp(self):
+        self.achievement = Achievement.objects.create(
+            title="CriticoEstelar", description="Valuate", required_points=1
+        )
+        self.user = User.objects.create(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        self.headers = {
+            "Authorization": f"Token {Token.objects.create(user=self.user)}",
+        }
+
+    def tearDown(self):
+        catalog.invalidate()
+
+    def testAchievementListNotModified(self):
+        """
+        Ensure an unchanged list is answered with 304 until an achievement is reached.
+        """
+
+        url = reverse("myAchievements")
+        response = self.client.get(url, headers=self.headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+
+        headers = {**self.headers, "If-None-Match": etag}
+        with self.assertNumQueries(1):
+            response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+        userUrl = reverse("userAchievementList", kwargs={"id": self.user.pk})
+        response = self.client.get(userUrl, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        check_and_increment_progress(
+            self.user.pk, self.achievement, SimpleNamespace(createdAt=timezone.now())
+        )
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class CamaleonTest(APITestCase):
+    """
+    Test the progress of the Camaleon achievement when the profile image changes.
+    """
+
+    def setUp(self):
+        self.achievement = Achievement.objects.create(
+            title="Camaleon", description="Change your image", required_points=2
+        )
+        User.objects.create(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+
+    def tearDown(self):
+        catalog.invalidate()
+
+    def progress(self, user):
+        return UserAchievementProgress.objects.get(user=user, achievement=self.achievement).progress
+
+    def testImageChangeIncrementsProgress(self):
+        """
+        Ensure only the saves that change the image count.
+        """
+
+        user = User.objects.get(username="test")
+        user.first_name = "Test"
+        user.save()
+        self.assertEqual(self.progress(user), 0)
+
+        user.profileImage = "profile_image/other.png"
+        user.save()
+        self.assertEqual(self.progress(user), 1)
+
+        # Saving again without changes does not count twice
+        user.save()
+        self.assertEqual(self.progress(user), 1)
+
+    def testSaveDoesNotRefetchTheUser(self):
+        """
+        Ensure saving other fields does not query the user nor the achievements.
+        """
+
+        user = User.objects.get(username="test")
+        user.profileImage = "profile_image/other.png"
+        user.last_login = timezone.now()
+        with self.assertNumQueries(1):
+            user.save(update_fields=["last_login"])
+        self.assertEqual(self.progress(user), 0)
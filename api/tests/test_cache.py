@@ -0,0 +1,200 @@
+"""
+This module contains the tests for the tiered cache.
+"""
+
+import json
+import threading
+import time
+
+from django.core.cache import caches
+from django.test import override_settings
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase, APISimpleTestCase
+from rest_framework import status
+from common.models.user import User
+from userApi.cache import TieredCache, cacheStats
+
+from rest_framework.authtoken.models import Token
+
+
+@override_settings(TIERED_CACHE="shared")
+class TieredCacheTest(APISimpleTestCase):
+    """
+    Test the in-process and shared tiers of the cache, the "shared" alias of the tests stands
+    for the Redis server of SHARED_CACHE_URL
+    """
+
+    def setUp(self):
+        caches["shared"].clear()
+        self.now = 0.0
+        self.cache = TieredCache("test", localTimeout=5, localSize=2, clock=lambda: self.now)
+
+    def otherWorker(self):
+        """
+        Returns the same cache as seen by another process, with its own L1
+        """
+        return TieredCache("test", localTimeout=5, localSize=2, clock=lambda: self.now)
+
+    def testValuesAreSharedBetweenWorkers(self):
+        """
+        Ensure a value cached by a worker is read by the others from the shared tier
+        """
+        self.cache.set("driver:1", {"username": "driver"})
+        other = self.otherWorker()
+        self.assertEqual(other.get("driver:1"), {"username": "driver"})
+        self.assertEqual(other.get("driver:1"), {"username": "driver"})
+        self.assertEqual(other.stats()["sharedHits"], 1)
+        self.assertEqual(other.stats()["localHits"], 1)
+        self.assertIsNone(other.get("driver:2"))
+        self.assertEqual(other.stats()["misses"], 1)
+
+    def testLocalValuesCannotBeChanged(self):
+        """
+        Ensure the callers get a copy of the cached value
+        """
+        self.cache.set("driver:1", {"username": "driver"})
+        self.cache.get("driver:1")["username"] = "changed"
+        self.assertEqual(self.cache.get("driver:1"), {"username": "driver"})
+
+    def testLocalTierIsBounded(self):
+        """
+        Ensure the least recently used values leave the in-process tier
+        """
+        for key in ("a", "b", "c"):
+            self.cache.set(key, key)
+        self.assertEqual(self.cache.stats()["localEntries"], 2)
+        caches["shared"].clear()
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("c"), "c")
+
+    def testInvalidateReachesOtherWorkers(self):
+        """
+        Ensure invalidating the namespace drops its values in every worker within the local TTL
+        """
+        other = self.otherWorker()
+        self.cache.set("driver:1", "old")
+        self.assertEqual(other.get("driver:1"), "old")
+
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get("driver:1"))
+        self.assertEqual(other.get("driver:1"), "old")
+        self.now += 5
+        self.assertIsNone(other.get("driver:1"))
+
+    def testDeleteForgetsValue(self):
+        """
+        Ensure a deleted key is not served from either tier
+        """
+        self.cache.set("driver:1", "old")
+        self.cache.delete("driver:1")
+        self.assertIsNone(self.cache.get("driver:1"))
+        self.assertIsNone(self.otherWorker().get("driver:1"))
+
+    def testGetOrSetComputesOnce(self):
+        """
+        Ensure concurrent misses of a key compute its value once
+        """
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return "value"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.getOrSet("key", compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 8)
+
+    def testGetOrSetWaitsForOtherWorker(self):
+        """
+        Ensure a worker waits for the value another worker is computing
+        """
+        other = self.otherWorker()
+        other.lockTimeout = 1
+        shared = caches["shared"]
+        version = other.currentVersion()
+        shared.add("test:key:lock", 1, 10, version=version)
+        threading.Timer(0.1, lambda: self.cache.set("key", "computed")).start()
+        self.assertEqual(other.getOrSet("key", lambda: "recomputed"), "computed")
+        self.assertEqual(other.stats()["waits"], 1)
+
+    def testWaitDoesNotHoldOtherKeys(self):
+        """
+        Ensure the keys sharing the in-process lock of a key waited for are still computed
+        """
+        other = self.otherWorker()
+        stripe = hash("key") % other.lockStripes
+        sibling = next(
+            f"key{i}" for i in range(100000) if hash(f"key{i}") % other.lockStripes == stripe
+        )
+        shared = caches["shared"]
+        shared.add("test:key:lock", 1, 10, version=other.currentVersion())
+        waiter = threading.Thread(target=lambda: other.getOrSet("key", lambda: "recomputed"))
+        waiter.start()
+        threading.Timer(1, lambda: self.cache.set("key", "computed")).start()
+        time.sleep(0.1)
+
+        startedAt = time.monotonic()
+        self.assertEqual(other.getOrSet(sibling, lambda: "sibling"), "sibling")
+        self.assertLess(time.monotonic() - startedAt, 0.5)
+        waiter.join()
+
+    def testValueComputedDuringInvalidationIsNotServed(self):
+        """
+        Ensure a value computed from data changed meanwhile is stored under the old version
+        """
+
+        def compute():
+            self.cache.invalidate()
+            return "stale"
+
+        self.assertEqual(self.cache.getOrSet("key", compute), "stale")
+        self.assertIsNone(self.cache.get("key"))
+
+    @override_settings(TIERED_CACHE=None)
+    def testLocalOnly(self):
+        """
+        Ensure the cache works in the process when no shared tier is configured
+        """
+        self.cache.set("key", "value")
+        self.assertEqual(self.cache.get("key"), "value")
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get("key"))
+        self.assertIsNone(caches["shared"].get("test:key"))
+
+
+class CacheMetricsTest(APITestCase):
+    """
+    Test the metrics of the tiered caches
+    """
+
+    def testMetricsRequireAdmin(self):
+        """
+        Ensure only the admins see the counters of the caches
+        """
+        TieredCache("metrics").get("missing")
+        user = User.objects.create_user(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        url = reverse("cacheMetrics")
+        headers = {
+            "Authorization": f"Token {Token.objects.create(user=user)}",
+        }
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(metrics["metrics"]["misses"], 1)
+        self.assertEqual(set(metrics), set(cacheStats()))
@@ -0,0 +1,194 @@
+"""
+This module contains the tests for the database connections.
+"""
+
+import json
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase, APISimpleTestCase
+from rest_framework import status
+from api.models import RefreshToken
+from common.models.user import User
+from userApi.db.postgresql_pool.base import DatabaseWrapper
+from userApi.db.router import ReplicaRouter, ReplicaRoutingMiddleware
+
+from rest_framework.authtoken.models import Token
+
+
+def poolSettings(**overrides):
+    return {
+        "ENGINE": "userApi.db.postgresql_pool",
+        "NAME": "ppf",
+        "USER": "ppf",
+        "PASSWORD": "ppf",
+        "HOST": "localhost",
+        "PORT": "5432",
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": False,
+        "AUTOCOMMIT": True,
+        "ATOMIC_REQUESTS": False,
+        "TIME_ZONE": None,
+        "OPTIONS": {"pool": {"min_size": 1, "max_size": 4, "timeout": 5}},
+        **overrides,
+    }
+
+
+class PooledBackendTest(APISimpleTestCase):
+    """
+    Test the configuration of the pooled PostgreSQL backend
+    """
+
+    def testPoolOptionsAreNotConnectionParams(self):
+        """
+        Ensure the pool options are not passed to psycopg as connection parameters
+        """
+        wrapper = DatabaseWrapper(poolSettings(), alias="pooled")
+        params = wrapper.get_connection_params()
+        self.assertNotIn("pool", params)
+        self.assertEqual(params["dbname"], "ppf")
+        self.assertEqual(wrapper.poolOptions, {"min_size": 1, "max_size": 4, "timeout": 5})
+        self.assertIsNone(wrapper.poolStats())
+
+    def testPersistentConnectionsAreRejected(self):
+        """
+        Ensure the pool is not combined with persistent connections
+        """
+        wrapper = DatabaseWrapper(poolSettings(CONN_MAX_AGE=60), alias="pooled")
+        with self.assertRaises(ImproperlyConfigured):
+            wrapper.pool
+
+
+class DatabaseMetricsTest(APITestCase):
+    """
+    Test the metrics of the database connections
+    """
+
+    def testMetricsRequireAdmin(self):
+        """
+        Ensure only the admins see how the connections are reused
+        """
+        user = User.objects.create_user(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        url = reverse("databaseMetrics")
+        headers = {
+            "Authorization": f"Token {Token.objects.create(user=user)}",
+        }
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = json.loads(response.content.decode("utf-8")).get("default")
+        self.assertIn("connMaxAge", metrics)
+        self.assertIsNone(metrics.get("pool"))
+
+
+@override_settings(REPLICA_PIN_CACHE="shared")
+class ReplicaRouterTest(APISimpleTestCase):
+    """
+    Test the routing of the reads to the database replicas
+    """
+
+    def setUp(self):
+        caches["shared"].clear()
+        self.router = ReplicaRouter()
+        self.router.health["replica1"] = (True, time.monotonic())
+        patcher = mock.patch("userApi.db.router.replicaAliases", return_value=["replica1"])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+
+    def route(self, request, urlName, write=False, model=User):
+        """
+        Sends the request through the middleware and returns where its view reads the model
+        """
+        databases = []
+
+        def getResponse(request):
+            middleware.process_view(request, resolve(reverse(urlName)).func, (), {})
+            if write:
+                self.router.db_for_write(User)
+            databases.append(self.router.db_for_read(model))
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(getResponse)
+        middleware(request)
+        return databases[0]
+
+    def testSafeRequestsReadFromReplica(self):
+        """
+        Ensure the GET requests of the routed apps read from a replica
+        """
+        request = self.factory.get("/users/")
+        self.assertEqual(self.route(request, "userListCreate"), "replica1")
+
+    def testWritesPinClientToPrimary(self):
+        """
+        Ensure a client reads from the primary after writing, until the pin expires
+        """
+        headers = {"HTTP_AUTHORIZATION": "Token writer"}
+        request = self.factory.post("/users/", **headers)
+        self.assertIsNone(self.route(request, "userListCreate", write=True))
+
+        request = self.factory.get("/users/", **headers)
+        self.assertIsNone(self.route(request, "userListCreate"))
+        request = self.factory.get("/users/", HTTP_AUTHORIZATION="Token other")
+        self.assertEqual(self.route(request, "userListCreate"), "replica1")
+
+        caches["shared"].clear()
+        request = self.factory.get("/users/", **headers)
+        self.assertEqual(self.route(request, "userListCreate"), "replica1")
+
+    def testCredentialsAreReadFromPrimary(self):
+        """
+        Ensure the token issued by a login is found by the next request, which is not pinned
+        """
+        request = self.factory.post("/login/", REMOTE_ADDR="10.0.0.1")
+        self.assertIsNone(self.route(request, "userListCreate", write=True))
+
+        headers = {"HTTP_AUTHORIZATION": "Token issued", "REMOTE_ADDR": "10.0.0.1"}
+        request = self.factory.get("/users/", **headers)
+        self.assertIsNone(self.route(request, "userListCreate", model=Token))
+        self.assertIsNone(self.route(request, "userListCreate", model=RefreshToken))
+        self.assertEqual(self.route(request, "userListCreate"), "replica1")
+
+    @override_settings(REPLICA_PIN_CACHE=None)
+    def testWithoutSharedPinsReadsUsePrimary(self):
+        """
+        Ensure the replicas are not used when the pins cannot be shared by the workers
+        """
+        request = self.factory.get("/users/")
+        self.assertIsNone(self.route(request, "userListCreate"))
+
+    def testReadsAfterWriteInSameRequestUsePrimary(self):
+        """
+        Ensure a request reads its own writes even when it is a GET
+        """
+        request = self.factory.get("/users/")
+        self.assertIsNone(self.route(request, "userListCreate", write=True))
+
+    def testUnhealthyReplicaFallsBackToPrimary(self):
+        """
+        Ensure the primary is used while the replica is unavailable
+        """
+        self.router.health["replica1"] = (False, time.monotonic())
+        request = self.factory.get("/users/")
+        self.assertIsNone(self.route(request, "userListCreate"))
+
+    def testReplicasAreNotMigrated(self):
+        """
+        Ensure the schema is only migrated in the primary
+        """
+        self.assertFalse(self.router.allow_migrate("replica1", "api"))
+        self.assertIsNone(self.router.allow_migrate("default", "api"))
+        self.assertIsNone(self.router.db_for_read(User))
@@ -6,10 +6,13 @@ import json
 from email import header
 
 from common.models.user import ChargerType, Driver, Preference, User
+from django.core.cache import caches
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
+from userApi.cache import resetCaches
 
 
 class CreateDriverTest(APITestCase):
@@ -299,6 +302,8 @@ class GetDriverTest(APITestCase):
     """
 
     def setUp(self):
+        caches["shared"].clear()
+        resetCaches()
         self.mennekes = ChargerType.objects.create(chargerType="Mennekes")
         self.driver = Driver.objects.create(
             username="test",
@@ -359,6 +364,112 @@ class GetDriverTest(APITestCase):
         message = json.loads(response.content.decode("utf-8"))
         self.assertEqual(message.get("detail"), "Not found.")
 
+    def testRepeatedGetIsCached(self):
+        """
+        Ensure a repeated GET of the driver only reads its version from the database.
+        """
+
+        url = reverse("driverRetriever", kwargs={"pk": self.driver.pk})
+        first = self.client.get(url)
+        with self.assertNumQueries(1):
+            second = self.client.get(url)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            json.loads(first.content.decode("utf-8")), json.loads(second.content.decode("utf-8"))
+        )
+
+    def testChangeByOtherWorkerIsNotServedStale(self):
+        """
+        Ensure a cached driver is rendered again when the row changed without this worker
+        forgetting it.
+        """
+
+        url = reverse("driverRetriever", kwargs={"pk": self.driver.pk})
+        self.client.get(url)
+        Driver.objects.filter(pk=self.driver.pk).update(
+            first_name="changed", updatedAt=timezone.now()
+        )
+        message = json.loads(self.client.get(url).content.decode("utf-8"))
+        self.assertEqual(message.get("first_name"), "changed")
+
+    def testDeletedDriverIsNotServed(self):
+        """
+        Ensure a cached driver is not found once it is deleted.
+        """
+
+        url = reverse("driverRetriever", kwargs={"pk": self.driver.pk})
+        self.client.get(url)
+        Driver.objects.filter(pk=self.driver.pk).delete()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def testUpdateDropsCachedDriver(self):
+        """
+        Ensure the driver is read again after it is updated.
+        """
+
+        url = reverse("driverRetriever", kwargs={"pk": self.driver.pk})
+        headers = {
+            "Authorization": f"Token {self.token}",
+        }
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                url, {"first_name": "cached"}, format="json", headers=headers  # type: ignore
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        message = json.loads(self.client.get(url).content.decode("utf-8"))
+        self.assertEqual(message.get("first_name"), "cached")
+
+    def testDriverNotModified(self):
+        """
+        Ensure an unchanged driver is answered with 304 until it is updated.
+        """
+
+        url = reverse("driverRetriever", kwargs={"pk": self.driver.pk})
+        headers = {
+            "Authorization": f"Token {self.token}",
+        }
+        etag = self.client.get(url)["ETag"]
+        headers["If-None-Match"] = etag
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                url, {"first_name": "changed"}, format="json", headers=headers  # type: ignore
+            )
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def testDeleteAndConversionDropCachedDriver(self):
+        """
+        Ensure the driver is not served once it is converted to a user or deleted.
+        """
+
+        url = reverse("driverRetriever", kwargs={"pk": self.driver.pk})
+        userUrl = reverse("userRetriever", kwargs={"pk": self.driver.pk})
+        headers = {
+            "Authorization": f"Token {self.token}",
+        }
+        self.client.get(url)
+        self.client.get(userUrl, headers=headers)  # type: ignore
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("driverToUser"), headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        # The conversion recreates the user, and its token with it
+        headers["Authorization"] = f"Token {Token.objects.create(user_id=self.driver.pk)}"
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(userUrl, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(userUrl, headers=headers)  # type: ignore
+        self.assertNotEqual(response.status_code, status.HTTP_200_OK)
+
 
 class UpdateDriverTest(APITestCase):
     """
@@ -7,6 +7,24 @@ from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from common.models.user import User
+from api.authentication import (
+    SignedTokenAuthentication,
+    TokenUser,
+    issueAccessToken,
+    tokenCache,
+)
+from api.models import RefreshToken
+from api.throttling import reset_throttles
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+from usrLogin.hashing import hashPool
 
 import json
 
@@ -18,6 +36,9 @@ class LoginTest(APITestCase):
     Test the login
     """
 
+    def setUp(self):
+        reset_throttles()
+
     def testLoginSucessfull(self):
         """
         Ensure the API call creates a auth token to the user
@@ -65,6 +86,52 @@ class LoginTest(APITestCase):
         self.assertEqual(message.get("token"), tokenNew.key)
         self.assertNotEqual(token.key, tokenNew.key)
 
+    def testLoginQueries(self):
+        """
+        Ensure the login loads the user once and issues the token in a single upsert
+        """
+        User.objects.create_user(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        User.objects.create_user(
+            username="google",
+            birthDate="1998-10-06",
+            password="test",
+            email="test@gmail.com",
+            typeOfLogin="google",
+        )
+
+        url = reverse("login")
+        data = {
+            "email": "test@gmail.com",
+            "password": "test",
+        }
+
+        with self.assertNumQueries(2):
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def testSocialUserCannotLoginWithPassword(self):
+        """
+        Ensure the users of a social login are not logged in with a password
+        """
+        User.objects.create_user(
+            username="google",
+            birthDate="1998-10-06",
+            password="test",
+            email="test@gmail.com",
+            typeOfLogin="google",
+        )
+
+        url = reverse("login")
+        data = {
+            "email": "test@gmail.com",
+            "password": "test",
+        }
+
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
     def testLoginFailUserNotExist(self):
         """
         Ensure the API call fails when the user is not registered
@@ -111,3 +178,375 @@ class LoginTest(APITestCase):
 
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(TOKEN_AUTH_CACHE="default")
+class CachedTokenAuthenticationTest(APITestCase):
+    """
+    Test the authentication with the cached tokens
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        self.token = Token.objects.create(user=self.user)
+        tokenCache.clear()
+        reset_throttles()
+
+    def tearDown(self):
+        tokenCache.clear()
+
+    def whoAmI(self, token):
+        url = reverse("userIdRetriever")
+        headers = {
+            "Authorization": f"Token {token}",
+        }
+        return self.client.get(url, headers=headers)  # type: ignore
+
+    def testCachedTokenDoesNotQuery(self):
+        """
+        Ensure only the first request looks the token up in the database
+        """
+        self.assertEqual(self.whoAmI(self.token).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.whoAmI(self.token)
+        self.assertEqual(json.loads(response.content.decode("utf-8")).get("user_id"), self.user.pk)
+
+        # Another worker only has the shared tier
+        tokenCache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.whoAmI(self.token).status_code, status.HTTP_200_OK)
+
+    def testLoginInvalidatesOldToken(self):
+        """
+        Ensure the token replaced by a new login stops authenticating
+        """
+        self.assertEqual(self.whoAmI(self.token).status_code, status.HTTP_200_OK)
+        response = self.client.post(
+            reverse("login"), {"email": "test@gmail.com", "password": "test"}, format="json"
+        )
+        newToken = json.loads(response.content.decode("utf-8")).get("token")
+
+        self.assertEqual(self.whoAmI(self.token).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.whoAmI(newToken).status_code, status.HTTP_200_OK)
+
+    def testPasswordResetInvalidatesToken(self):
+        """
+        Ensure the tokens purged by a password reset stop authenticating
+        """
+        self.assertEqual(self.whoAmI(self.token).status_code, status.HTTP_200_OK)
+        data = {
+            "new_password": "newPassword",
+            "new_password_confirm": "newPassword",
+            "uidb64": urlsafe_base64_encode(force_bytes(self.user.pk)),
+            "token": default_token_generator.make_token(self.user),
+        }
+        response = self.client.post(reverse("setNewPassword"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.whoAmI(self.token).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def testInactiveUserIsRejected(self):
+        """
+        Ensure deactivating the user drops its cached token
+        """
+        self.assertEqual(self.whoAmI(self.token).status_code, status.HTTP_200_OK)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.whoAmI(self.token).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def testLogoutInvalidatesToken(self):
+        """
+        Ensure logging out drops the cached snapshot
+        """
+        self.assertEqual(self.whoAmI(self.token).status_code, status.HTTP_200_OK)
+        headers = {
+            "Authorization": f"Token {self.token}",
+        }
+        response = self.client.post(reverse("logout"), headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(tokenCache.get(self.token.key))
+
+
+@override_settings(
+    REST_FRAMEWORK={
+        "DEFAULT_AUTHENTICATION_CLASSES": [
+            "api.authentication.SignedTokenAuthentication",
+            "api.authentication.CachedTokenAuthentication",
+        ],
+    }
+)
+class SignedTokenTest(APITestCase):
+    """
+    Test the signed access tokens and the rotation of the refresh tokens
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        reset_throttles()
+
+    def login(self):
+        response = self.client.post(
+            reverse("login"), {"email": "test@gmail.com", "password": "test"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content.decode("utf-8"))
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        return SignedTokenAuthentication().authenticate(request)
+
+    def testLoginIssuesSignedToken(self):
+        """
+        Ensure the login returns an access token verified without the database
+        """
+        message = self.login()
+        self.assertIsNotNone(message.get("refresh"))
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+        with self.assertNumQueries(0):
+            user, claims = self.authenticate(message.get("token"))
+        self.assertIsInstance(user, TokenUser)
+        self.assertEqual(user.id, self.user.pk)
+        self.assertEqual(claims.get("typ"), "base")
+
+    def testTamperedTokenIsRejected(self):
+        """
+        Ensure a token not signed with the secret is rejected
+        """
+        token = self.login().get("token")
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token[:-2] + "xx")
+
+    @override_settings(ACCESS_TOKEN_SECRET=None)
+    def testSecretIsRequired(self):
+        """
+        Ensure no access token is signed without a secret
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            issueAccessToken(self.user)
+
+    @override_settings(ACCESS_TOKEN_TTL=-1)
+    def testExpiredTokenIsRejected(self):
+        """
+        Ensure an access token older than its TTL is rejected
+        """
+        token = self.login().get("token")
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def testPasswordResetRevokesRefreshTokens(self):
+        """
+        Ensure a refresh token issued before a password reset cannot mint access tokens
+        """
+        refresh = self.login().get("refresh")
+        data = {
+            "new_password": "newPassword",
+            "new_password_confirm": "newPassword",
+            "uidb64": urlsafe_base64_encode(force_bytes(self.user.pk)),
+            "token": default_token_generator.make_token(self.user),
+        }
+        response = self.client.post(reverse("setNewPassword"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post(reverse("refresh_token"), {"refresh": refresh}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def testRefreshRotatesToken(self):
+        """
+        Ensure a refresh token can be used once and reusing it revokes the new one
+        """
+        refresh = self.login().get("refresh")
+        url = reverse("refresh_token")
+
+        response = self.client.post(url, {"refresh": refresh}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rotated = json.loads(response.content.decode("utf-8"))
+        self.assertNotEqual(rotated.get("refresh"), refresh)
+        self.assertEqual(self.authenticate(rotated.get("token"))[0].id, self.user.pk)
+
+        response = self.client.post(url, {"refresh": refresh}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(url, {"refresh": rotated.get("refresh")}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(
+            RefreshToken.objects.filter(user_id=self.user.pk, revokedAt__isnull=True).exists()
+        )
+
+
+@override_settings(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=4)
+class HashPoolLoginTest(APITestCase):
+    """
+    Test the login hashing the passwords in the process pool
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        hashPool.shutdown()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        hashPool.metrics.reset()
+        reset_throttles()
+
+    def testPoolLogin(self):
+        """
+        Ensure the login returns the token and records the queue wait
+        """
+        url = reverse("login")
+        data = {
+            "email": "test@gmail.com",
+            "password": "test",
+        }
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(message.get("token"), Token.objects.get(user=self.user).key)
+        self.assertEqual(hashPool.stats()["completed"], 1)
+
+    def testPoolLoginWrongPassword(self):
+        """
+        Ensure the login rejects a wrong password checked in the pool
+        """
+        url = reverse("login")
+        data = {
+            "email": "test@gmail.com",
+            "password": "wrongpassword",
+        }
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(PASSWORD_HASH_QUEUE=0)
+    def testSaturatedPoolAsksToRetry(self):
+        """
+        Ensure the login is rejected with Retry-After when the pool is full
+        """
+        url = reverse("login")
+        data = {
+            "email": "test@gmail.com",
+            "password": "test",
+        }
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(hashPool.stats()["rejected"], 1)
+
+    def testOutdatedHashIsUpgraded(self):
+        """
+        Ensure the login hashes the password again when the configured hasher changed
+        """
+        hasher = PBKDF2PasswordHasher()
+        self.user.password = hasher.encode("test", hasher.salt(), iterations=1000)
+        self.user.save()
+        outdated = self.user.password
+
+        url = reverse("login")
+        data = {
+            "email": "test@gmail.com",
+            "password": "test",
+        }
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertNotEqual(self.user.password, outdated)
+        self.assertFalse(hasher.must_update(self.user.password))
+        self.assertTrue(self.user.check_password("test"))
+
+    def testMetricsRequireAdmin(self):
+        """
+        Ensure only the admins see the metrics of the pool
+        """
+        url = reverse("hash_pool_metrics")
+        headers = {
+            "Authorization": f"Token {Token.objects.create(user=self.user)}",
+        }
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("waitAvgMs", json.loads(response.content.decode("utf-8")))
+
+
+class LoginThrottleTest(APITestCase):
+    """
+    Test the throttling of the login
+    """
+
+    def setUp(self):
+        User.objects.create_user(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        reset_throttles()
+
+    def login(self, email, password="wrongpassword", headers=None):
+        url = reverse("login")
+        data = {
+            "email": email,
+            "password": password,
+        }
+        return self.client.post(url, data, format="json", headers=headers)  # type: ignore
+
+    @override_settings(
+        REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": {"login.email": "3/min", "login.ip": "100/min"}}
+    )
+    def testEmailIsThrottled(self):
+        """
+        Ensure the logins to an email are limited and told when to retry
+        """
+        for _ in range(3):
+            self.assertEqual(self.login("Test@gmail.com").status_code, 401)
+        response = self.login("test@gmail.com", "test")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response["Retry-After"]), 0)
+
+        # Other accounts are not affected
+        self.assertEqual(self.login("other@gmail.com").status_code, 401)
+
+    @override_settings(
+        REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": {"login.ip": "2/min"}},
+        THROTTLE_CACHE="default",
+    )
+    def testIpIsThrottledInSharedCache(self):
+        """
+        Ensure the logins of a client are limited through the shared cache
+        """
+        self.assertEqual(self.login("a@gmail.com").status_code, 401)
+        self.assertEqual(self.login("b@gmail.com").status_code, 401)
+        self.assertEqual(self.login("c@gmail.com").status_code, 429)
+
+    @override_settings(
+        REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": {"login.ip": "2/min"}},
+        THROTTLE_CACHE="shared",
+    )
+    def testResetKeepsTheSharedCache(self):
+        """
+        Ensure forgetting the throttles only deletes their keys from the shared cache
+        """
+        caches["shared"].set("other", "kept")
+        self.assertEqual(self.login("a@gmail.com").status_code, 401)
+        self.assertEqual(self.login("b@gmail.com").status_code, 401)
+
+        reset_throttles()
+        self.assertEqual(caches["shared"].get("other"), "kept")
+        self.assertEqual(self.login("c@gmail.com").status_code, 401)
+
+    @override_settings(
+        REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": {"login.ip": "2/min"}, "NUM_PROXIES": 0}
+    )
+    def testForwardedForIsNotTrusted(self):
+        """
+        Ensure a client cannot dodge the IP throttle forging the X-Forwarded-For header
+        """
+        for number in range(2):
+            headers = {"X-Forwarded-For": f"10.0.0.{number}"}
+            self.assertEqual(self.login("a@gmail.com", headers=headers).status_code, 401)
+        headers = {"X-Forwarded-For": "10.0.0.2"}
+        self.assertEqual(self.login("a@gmail.com", headers=headers).status_code, 429)
@@ -0,0 +1,527 @@
+"""
+This module contains the tests for the push notifications.
+"""
+
+import json
+from datetime import timedelta
+
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+from rest_framework import status
+from common.models.fcm import FCMToken
+from common.models.route import Route
+from common.models.user import Driver, Preference, User
+from api.models import FCMDevice, PushOutbox
+from api.notifications.transport import get_transport, reset_transport
+from api.notifications.push_controller import PushController
+from api.notifications.rate_limit import TokenBucket
+from api.throttling import reset_throttles
+from api.views import pushController
+from django.test import override_settings
+from django.utils import timezone
+from firebase_admin.exceptions import UnavailableError
+from firebase_admin.messaging import UnregisteredError
+
+from rest_framework.authtoken.models import Token
+
+
+@override_settings(PUSH_TRANSPORT="api.notifications.transport.FakeTransport")
+class RegisterTokenTest(APITestCase):
+    """
+    Test the registration and validation of the FCM tokens.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        self.token = Token.objects.create(user=self.user)
+        reset_transport()
+        reset_throttles()
+
+    def register(self, token):
+        url = reverse("registerFCMToken", kwargs={"pk": self.user.pk})
+        headers = {
+            "Authorization": f"Token {self.token}",
+        }
+        data = {"token": token}
+        return self.client.post(url, data, format="json", headers=headers)  # type: ignore
+
+    def testRegisterDoesNotCallFirebase(self):
+        """
+        Ensure the token is stored as pending without sending anything.
+        """
+
+        response = self.register("device-token")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        device = FCMDevice.objects.get(token="device-token")
+        self.assertEqual(device.status, FCMDevice.PENDING)
+        self.assertEqual(get_transport().sent, [])
+        self.assertIsNone(pushController.token(self.user))
+
+    def testValidTokenIsPromoted(self):
+        """
+        Ensure the worker promotes the tokens accepted by Firebase.
+        """
+
+        self.register("device-token")
+        result = pushController.validatePendingTokens()
+        self.assertEqual(result["promoted"], 1)
+        self.assertEqual(FCMDevice.objects.get(token="device-token").status, FCMDevice.VALID)
+        self.assertEqual(pushController.token(self.user).token, "device-token")
+        message, dryRun = get_transport().sent[0]
+        self.assertEqual(message.token, "device-token")
+        self.assertTrue(dryRun)
+
+    def testInvalidTokenIsPurged(self):
+        """
+        Ensure the worker purges the tokens Firebase rejects.
+        """
+
+        get_transport().failures["bad-token"] = UnregisteredError("Unregistered")
+        self.register("bad-token")
+        result = pushController.validatePendingTokens()
+        self.assertEqual(result["purged"], 1)
+        self.assertFalse(FCMDevice.objects.filter(token="bad-token").exists())
+        self.assertFalse(FCMToken.objects.filter(token="bad-token").exists())
+
+    def testUnavailableIsRetriedWithBackoff(self):
+        """
+        Ensure transient errors are retried later and purged after the last attempt.
+        """
+
+        get_transport().failures["device-token"] = UnavailableError("Unavailable")
+        self.register("device-token")
+        result = pushController.validatePendingTokens()
+        self.assertEqual(result["retried"], 1)
+        device = FCMDevice.objects.get(token="device-token")
+        self.assertEqual(device.attempts, 1)
+        self.assertGreater(device.nextAttemptAt, timezone.now())
+
+        # Not due yet
+        self.assertEqual(pushController.validatePendingTokens()["retried"], 0)
+
+        for _ in range(PushController.validationMaxAttempts - 1):
+            FCMDevice.objects.update(nextAttemptAt=timezone.now() - timedelta(seconds=1))
+            pushController.validatePendingTokens()
+        self.assertFalse(FCMDevice.objects.filter(token="device-token").exists())
+
+
+@override_settings(PUSH_TRANSPORT="api.notifications.transport.FakeTransport")
+class NotifyDevicesTest(APITestCase):
+    """
+    Test the notifications sent to every device of a user.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        self.token = Token.objects.create(user=self.user)
+        reset_transport()
+        reset_throttles()
+        for token in ["phone", "tablet", "old-phone"]:
+            pushController.addToken(self.user, token)
+        pushController.validatePendingTokens()
+        get_transport().sent.clear()
+
+    def testEveryDeviceIsNotified(self):
+        """
+        Ensure a single multicast message reaches every device of the user.
+        """
+
+        self.assertEqual(pushController.notifyTo(self.user, "Title", "Body"), 3)
+        self.assertEqual(len(get_transport().sent), 1)
+        message, _ = get_transport().sent[0]
+        self.assertEqual(sorted(message.tokens), ["old-phone", "phone", "tablet"])
+
+    def testUnregisteredTokensArePruned(self):
+        """
+        Ensure the tokens reported as unregistered are deleted.
+        """
+
+        get_transport().failures["old-phone"] = UnregisteredError("Unregistered")
+        self.assertEqual(pushController.notifyTo(self.user, "Title", "Body"), 2)
+        self.assertEqual(
+            sorted(FCMDevice.objects.values_list("token", flat=True)), ["phone", "tablet"]
+        )
+
+    def testNotifyEndpoint(self):
+        """
+        Ensure the notify endpoint sends the notification to the devices of the user.
+        """
+
+        url = reverse("notifyUser", kwargs={"pk": self.user.pk})
+        headers = {
+            "Authorization": f"Token {self.token}",
+        }
+        data = {"title": "Title", "body": "Body", "priority": "high"}
+        response = self.client.post(url, data, format="json", headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(get_transport().sent, [])
+
+        self.assertEqual(pushController.deliverOutbox()["sent"], 1)
+        message, _ = get_transport().sent[0]
+        self.assertEqual(message.android.priority, "high")
+
+    @override_settings(REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": {"pushNotify.user": "3/min"}})
+    def testNotifyEndpointIsThrottled(self):
+        """
+        Ensure a user can send a burst of notifications and is then throttled.
+        """
+
+        url = reverse("notifyUser", kwargs={"pk": self.user.pk})
+        headers = {
+            "Authorization": f"Token {self.token}",
+        }
+        data = {"title": "Title", "body": "Body"}
+        for _ in range(3):
+            response = self.client.post(url, data, format="json", headers=headers)  # type: ignore
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(url, data, format="json", headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # A token is refilled every 20 seconds
+        self.assertLessEqual(int(response["Retry-After"]), 20)
+
+
+@override_settings(PUSH_TRANSPORT="api.notifications.transport.FakeTransport")
+class BulkNotifyTest(APITestCase):
+    """
+    Test the notifications sent to many users at once.
+    """
+
+    def setUp(self):
+        self.users = [
+            User.objects.create(
+                username=f"test{i}",
+                birthDate="1998-10-06",
+                password="test",
+                email=f"test{i}@gmail.com",
+            )
+            for i in range(3)
+        ]
+        # Only the admins notify any user
+        self.users[0].is_staff = True
+        self.users[0].save()
+        self.token = Token.objects.create(user=self.users[0])
+        self.headers = {
+            "Authorization": f"Token {self.token}",
+        }
+        reset_transport()
+        reset_throttles()
+        FCMDevice.objects.bulk_create(
+            [
+                FCMDevice(user=user, token=f"device-{user.pk}", status=FCMDevice.VALID)
+                for user in self.users[:2]
+            ]
+        )
+
+    def testNotifyUsers(self):
+        """
+        Ensure every listed user is notified and reported.
+        """
+
+        url = reverse("notifyUsers")
+        data = {"title": "Title", "body": "Body", "users": [user.pk for user in self.users]}
+        response = self.client.post(url, data, format="json", headers=self.headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(message.get("queued"), 2)
+        self.assertEqual(
+            message.get("results"),
+            [
+                {"user": self.users[0].pk, "devices": 1, "queued": True},
+                {"user": self.users[1].pk, "devices": 1, "queued": True},
+                {"user": self.users[2].pk, "devices": 0, "queued": False},
+            ],
+        )
+        self.assertEqual(get_transport().sent, [])
+
+        self.assertEqual(pushController.deliverOutbox()["sent"], 2)
+        self.assertEqual(len(get_transport().sent), 1)
+
+    def testNotifyRoutePassengers(self):
+        """
+        Ensure the passengers of a route are notified.
+        """
+
+        driver = Driver.objects.create(
+            username="driver1",
+            birthDate="1998-10-06",
+            email="driver@gmail.com",
+            password="driver",
+            dni="12345678",
+            preference=Preference.objects.create(),
+            iban="ES662100999",
+        )
+        route = Route.objects.create(
+            driver_id=driver.pk,
+            originLat=41.350450,
+            originLon=2.132660,
+            originAlias="SomeWhere",
+            destinationLat=41.419860,
+            destinationLon=2.2009346,
+            destinationAlias="AnotherPlace",
+            distance=100,
+            duration=20,
+            departureTime="2024-05-19T18:21:56.083Z",
+            freeSeats=5,
+            price=20.0,
+        )
+        route.passengers.add(self.users[1], self.users[2])
+
+        url = reverse("notifyUsers")
+        data = {"title": "Cancelled", "body": "The route is cancelled", "route": route.pk}
+        headers = {"Authorization": f"Token {Token.objects.create(user=self.users[1])}"}
+        response = self.client.post(url, data, format="json", headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        # The driver of the route notifies its passengers
+        headers = {"Authorization": f"Token {Token.objects.create(user=driver)}"}
+        response = self.client.post(url, data, format="json", headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            [result.get("user") for result in message.get("results")],
+            [self.users[1].pk, self.users[2].pk],
+        )
+        self.assertEqual(message.get("queued"), 1)
+
+    @override_settings(REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": {"pushNotify.user": "2/min"}})
+    def testBulkEndpointIsThrottled(self):
+        """
+        Ensure the bulk notifications share the throttle of the single ones.
+        """
+
+        url = reverse("notifyUsers")
+        data = {"title": "Title", "body": "Body", "users": [self.users[1].pk]}
+        for _ in range(2):
+            response = self.client.post(
+                url, data, format="json", headers=self.headers  # type: ignore
+            )
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.post(url, data, format="json", headers=self.headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def testOnlyAdminsNotifyUsers(self):
+        """
+        Ensure the users that are not admins cannot notify arbitrary users.
+        """
+
+        headers = {"Authorization": f"Token {Token.objects.create(user=self.users[1])}"}
+        url = reverse("notifyUsers")
+        data = {"title": "Title", "body": "Body", "users": [self.users[2].pk]}
+        response = self.client.post(url, data, format="json", headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(PushOutbox.objects.exists())
+
+    def testTokensAreSentInBatches(self):
+        """
+        Ensure the tokens are split in multicast messages of at most 500 tokens.
+        """
+
+        FCMDevice.objects.bulk_create(
+            [
+                FCMDevice(user=self.users[2], token=f"tablet-{i}", status=FCMDevice.VALID)
+                for i in range(500)
+            ]
+        )
+        results = pushController.notifyMany([user.pk for user in self.users], "Title", "Body")
+        self.assertEqual(sum(result["sent"] for result in results), 502)
+        self.assertEqual(
+            [len(message.tokens) for message, _ in get_transport().sent], [500, 2]
+        )
+
+    def testRecipientsRequired(self):
+        """
+        Ensure the API call returns an error without users nor route.
+        """
+
+        url = reverse("notifyUsers")
+        data = {"title": "Title", "body": "Body"}
+        response = self.client.post(url, data, format="json", headers=self.headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(
+    PUSH_TRANSPORT="api.notifications.transport.FakeTransport", PUSH_OUTBOX_COALESCE_WINDOW=60
+)
+class PushOutboxTest(APITestCase):
+    """
+    Test the queue of push notifications sent by the worker.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        reset_transport()
+        reset_throttles()
+        FCMDevice.objects.create(user=self.user, token="phone", status=FCMDevice.VALID)
+
+    def testDuplicatesAreCoalesced(self):
+        """
+        Ensure the notifications waiting with the same key are merged, the last one wins.
+        """
+
+        pushController.enqueue([self.user.pk], "Chat", "First message", collapseKey="chat")
+        pushController.enqueue([self.user.pk], "Chat", "Second message", collapseKey="chat")
+        pushController.enqueue([self.user.pk], "Route", "Route cancelled", collapseKey="route")
+        self.assertEqual(PushOutbox.objects.count(), 2)
+
+        self.assertEqual(pushController.deliverOutbox()["sent"], 2)
+        bodies = sorted(message.notification.body for message, _ in get_transport().sent)
+        self.assertEqual(bodies, ["Route cancelled", "Second message"])
+
+    def testSentWithinWindowIsDeferred(self):
+        """
+        Ensure a notification with the key of one just sent waits for the window to end.
+        """
+
+        pushController.enqueue([self.user.pk], "Chat", "First message", collapseKey="chat")
+        pushController.deliverOutbox()
+        pushController.enqueue([self.user.pk], "Chat", "Second message", collapseKey="chat")
+
+        self.assertEqual(pushController.deliverOutbox()["sent"], 0)
+        entry = PushOutbox.objects.get(status=PushOutbox.PENDING)
+        self.assertGreater(entry.nextAttemptAt, timezone.now() + timedelta(seconds=50))
+
+    def testWithoutKeyNothingIsCoalesced(self):
+        """
+        Ensure the notifications without a collapse key are all sent, even with one title.
+        """
+
+        pushController.enqueue([self.user.pk], "Chat", "First message")
+        pushController.enqueue([self.user.pk], "Chat", "Second message")
+        self.assertEqual(pushController.deliverOutbox()["sent"], 2)
+
+    def testClaimedNotificationsAreNotSentTwice(self):
+        """
+        Ensure the notifications claimed by a worker are skipped by the others until the
+        lease ends.
+        """
+
+        pushController.enqueue([self.user.pk], "Chat", "Message")
+        self.assertEqual(len(pushController.claimOutbox(10)), 1)
+        self.assertEqual(pushController.deliverOutbox()["sent"], 0)
+
+        PushOutbox.objects.update(nextAttemptAt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(pushController.deliverOutbox()["sent"], 1)
+        self.assertEqual(len(get_transport().sent), 1)
+
+    def testFailedBatchDoesNotResendTheOthers(self):
+        """
+        Ensure only the batch that failed is sent again, the ones that went out are sent.
+        """
+
+        other = User.objects.create(
+            username="other", birthDate="1998-10-06", password="test", email="other@gmail.com"
+        )
+        FCMDevice.objects.bulk_create(
+            [
+                FCMDevice(user=other, token=f"tablet-{i}", status=FCMDevice.VALID)
+                for i in range(500)
+            ]
+        )
+        pushController.enqueue([self.user.pk, other.pk], "Chat", "Message")
+        send = get_transport().send_multicast
+
+        def unavailableForPhone(message, dry_run=False):
+            if "phone" in message.tokens:
+                raise UnavailableError("Unavailable")
+            return send(message, dry_run)
+
+        get_transport().send_multicast = unavailableForPhone
+        self.assertEqual(
+            pushController.deliverOutbox(), {"sent": 1, "retried": 1, "failed": 0, "deferred": 0}
+        )
+        self.assertEqual(PushOutbox.objects.get(status=PushOutbox.PENDING).user_id, self.user.pk)
+
+    def testBucketCountsTheTokensSent(self):
+        """
+        Ensure the rate limit counts the messages of every device, not the notifications.
+        """
+
+        FCMDevice.objects.create(user=self.user, token="tablet", status=FCMDevice.VALID)
+        other = User.objects.create(
+            username="other", birthDate="1998-10-06", password="test", email="other@gmail.com"
+        )
+        FCMDevice.objects.create(user=other, token="other", status=FCMDevice.VALID)
+        pushController.enqueue([self.user.pk], "Chat", "Message")
+        pushController.enqueue([other.pk], "Route", "Route cancelled")
+
+        now = [0.0]
+        bucket = TokenBucket(2, clock=lambda: now[0])
+        result = pushController.deliverOutbox(bucket=bucket)
+        self.assertEqual((result["sent"], result["deferred"]), (1, 1))
+        self.assertEqual(PushOutbox.objects.filter(status=PushOutbox.PENDING).count(), 1)
+
+        now[0] += 1
+        self.assertEqual(pushController.deliverOutbox(bucket=bucket)["sent"], 1)
+
+    def testFailuresAreRetriedWithBackoff(self):
+        """
+        Ensure a failed send is retried later and marked as failed after the last attempt.
+        """
+
+        pushController.enqueue([self.user.pk], "Chat", "Message")
+
+        def unavailable(message, dry_run=False):
+            raise UnavailableError("Unavailable")
+
+        get_transport().send_multicast = unavailable
+        self.assertEqual(pushController.deliverOutbox()["retried"], 1)
+        self.assertEqual(pushController.deliverOutbox()["retried"], 0)
+
+        for _ in range(PushController.outboxMaxAttempts - 1):
+            PushOutbox.objects.update(nextAttemptAt=timezone.now() - timedelta(seconds=1))
+            pushController.deliverOutbox()
+        entry = PushOutbox.objects.get()
+        self.assertEqual(entry.status, PushOutbox.FAILED)
+        self.assertEqual(entry.attempts, PushController.outboxMaxAttempts)
+
+    def testTokenFailuresAreRetried(self):
+        """
+        Ensure a notification none of whose devices received it is retried, while the users
+        with a device reached are sent and the devices that are gone are pruned.
+        """
+
+        other = User.objects.create(
+            username="test2", birthDate="1998-10-06", password="test", email="test2@gmail.com"
+        )
+        FCMDevice.objects.create(user=other, token="laptop", status=FCMDevice.VALID)
+        FCMDevice.objects.create(user=self.user, token="old-phone", status=FCMDevice.VALID)
+        get_transport().failures["phone"] = UnavailableError("Unavailable")
+        get_transport().failures["old-phone"] = UnregisteredError("Unregistered")
+
+        pushController.enqueue([self.user.pk, other.pk], "Chat", "Message")
+        result = pushController.deliverOutbox()
+        self.assertEqual(result["sent"], 1)
+        self.assertEqual(result["retried"], 1)
+
+        entry = PushOutbox.objects.get(user=self.user)
+        self.assertEqual(entry.status, PushOutbox.PENDING)
+        self.assertEqual(entry.attempts, 1)
+        self.assertEqual(entry.lastError, "Unavailable")
+        self.assertGreater(entry.nextAttemptAt, timezone.now())
+        self.assertEqual(PushOutbox.objects.get(user=other).status, PushOutbox.SENT)
+        self.assertFalse(FCMDevice.objects.filter(token="old-phone").exists())
+
+        del get_transport().failures["phone"]
+        PushOutbox.objects.filter(user=self.user).update(
+            nextAttemptAt=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(pushController.deliverOutbox()["sent"], 1)
+
+    def testTokenBucketLimitsTheRate(self):
+        """
+        Ensure the bucket allows its rate per second and refills over time.
+        """
+
+        now = [0.0]
+        bucket = TokenBucket(10, clock=lambda: now[0])
+        self.assertEqual(bucket.take(25), 10)
+        self.assertEqual(bucket.take(1), 0)
+        self.assertAlmostEqual(bucket.wait(), 0.1)
+        now[0] += 0.5
+        self.assertEqual(bucket.take(25), 5)
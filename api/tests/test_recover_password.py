@@ -8,6 +8,21 @@ from rest_framework import status
 from common.models.user import User
 
 import json
+from datetime import timedelta
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.test import override_settings
+from django.utils import timezone
+from api.throttling import reset_throttles
+from emailSending.models import EmailOutbox
+from emailSending.outbox import (
+    MAX_ATTEMPTS,
+    RETENTION,
+    claimEmails,
+    deliverEmails,
+    queueEmail,
+)
 
 from rest_framework.authtoken.models import Token
 
@@ -25,6 +40,7 @@ class RecoverPassword(APITestCase):
             email="failUser@gmail.com",
         )
         self.token, _ = Token.objects.get_or_create(user=self.userFail)
+        reset_throttles()
 
     def testEmailFail(self):
         """
@@ -82,3 +98,131 @@ class RecoverPassword(APITestCase):
         }
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CountingEmailBackend(LocmemEmailBackend):
+    """
+    Locmem backend counting the connections opened.
+    """
+
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return True
+
+
+class FailingEmailBackend(LocmemEmailBackend):
+    """
+    Backend whose server is down.
+    """
+
+    def open(self):
+        raise ConnectionRefusedError("Connection refused")
+
+
+class EmailOutboxTest(APITestCase):
+    """
+    Test the outbox of the password reset emails
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username="resetUser",
+            birthDate="1998-10-06",
+            password="resetUser",
+            email="resetUser@gmail.com",
+        )
+        reset_throttles()
+
+    def testResetRequestOnlyQueues(self):
+        """
+        Test the reset request queues the email and the worker sends it
+        """
+
+        url = reverse("passwordReset")
+        response = self.client.post(url, {"email": "resetUser@gmail.com"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailOutbox.objects.get().status, EmailOutbox.PENDING)
+
+        self.assertEqual(deliverEmails()["sent"], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["resetUser@gmail.com"])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], "text/html")
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.status, EmailOutbox.SENT)
+        # The reset link is not kept once sent
+        self.assertEqual((email.body, email.htmlBody), ("", ""))
+
+    def testSentEmailsArePurged(self):
+        """
+        Test the sent emails are deleted after the retention period
+        """
+
+        queueEmail("Subject", "Body", ["resetUser@gmail.com"])
+        deliverEmails()
+        EmailOutbox.objects.update(sentAt=timezone.now() - RETENTION - timedelta(seconds=1))
+        queueEmail("Subject", "Body", ["resetUser@gmail.com"])
+        deliverEmails()
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    def testClaimedEmailsAreNotSentTwice(self):
+        """
+        Test the emails claimed by a worker are skipped by the others until the lease ends
+        """
+
+        queueEmail("Subject", "Body", ["resetUser@gmail.com"])
+        self.assertEqual(len(claimEmails(10)), 1)
+        self.assertEqual(EmailOutbox.objects.get().status, EmailOutbox.SENDING)
+        self.assertEqual(deliverEmails()["sent"], 0)
+
+        EmailOutbox.objects.update(nextAttemptAt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(deliverEmails()["sent"], 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def testResetRequestsAreThrottled(self):
+        """
+        Test the reset emails sent to an account are limited
+        """
+
+        url = reverse("passwordReset")
+        for _ in range(3):
+            response = self.client.post(url, {"email": "resetUser@gmail.com"}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(url, {"email": "resetUser@gmail.com"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(EmailOutbox.objects.count(), 3)
+
+    @override_settings(EMAIL_BACKEND="api.tests.test_recover_password.CountingEmailBackend")
+    def testBatchReusesConnection(self):
+        """
+        Test a batch of emails is sent through a single connection
+        """
+
+        CountingEmailBackend.opened = 0
+        for i in range(3):
+            queueEmail("Subject", "Body", [f"user{i}@gmail.com"])
+        self.assertEqual(deliverEmails()["sent"], 3)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+    @override_settings(EMAIL_BACKEND="api.tests.test_recover_password.FailingEmailBackend")
+    def testFailuresEndAsDeadLetter(self):
+        """
+        Test a failed email is retried later and ends as a dead letter
+        """
+
+        queueEmail("Subject", "Body", ["resetUser@gmail.com"])
+        self.assertEqual(deliverEmails()["retried"], 1)
+        self.assertEqual(EmailOutbox.objects.get().status, EmailOutbox.PENDING)
+        self.assertEqual(deliverEmails()["retried"], 0)
+
+        for _ in range(MAX_ATTEMPTS - 1):
+            EmailOutbox.objects.update(nextAttemptAt=timezone.now() - timedelta(seconds=1))
+            deliverEmails()
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.status, EmailOutbox.DEAD)
+        self.assertIn("Connection refused", email.lastError)
+        self.assertEqual(email.body, "")
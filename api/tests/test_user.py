@@ -10,6 +10,20 @@ from common.models.user import User, ChargerType, Driver, Preference
 from common.models.achievement import UserAchievementProgress
 
 import json
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import override_settings
+from userApi.cache import resetCaches
+from api.authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication,
+    issueAccessToken,
+)
+from api.pagination import KeysetPagination
+from api.search import NGramSearchBackend
+from api.views import DriverToUser, UserToDriver
+from usrLogin.hashing import hashPool
 
 from rest_framework.authtoken.models import Token
 
@@ -140,6 +154,104 @@ class CreateUserTest(APITestCase):
         self.assertEqual(messageGet.get("points"), 0)
 
 
+@override_settings(PASSWORD_HASH_WORKERS=1)
+class PoolCreateUserTest(APITestCase):
+    """
+    Test the registration hashing the password in the process pool
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        hashPool.shutdown()
+        super().tearDownClass()
+
+    def testPoolCreateUser(self):
+        """
+        Ensure the API call creates a user that can log in with the password hashed in the pool.
+        """
+
+        url = reverse("userListCreate")
+        data = {
+            "username": "test",
+            "birthDate": "1998-10-06",
+            "password": "test",
+            "password2": "test",
+            "email": "test@gmail.com",
+        }
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(message.get("username"), "test")
+        self.assertTrue(User.objects.get(username="test").check_password("test"))
+
+    def testPoolCreateUserPasswordsMustMatch(self):
+        """
+        Ensure the API call validates the user before hashing the password.
+        """
+
+        url = reverse("userListCreate")
+        data = {
+            "username": "test",
+            "birthDate": "1998-10-06",
+            "password": "test",
+            "password2": "other",
+            "email": "test@gmail.com",
+        }
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(User.objects.filter(username="test").exists())
+
+    @override_settings(PASSWORD_HASH_QUEUE=0)
+    def testSaturatedPoolLeavesNoUser(self):
+        """
+        Ensure a registration rejected by a full pool stores no user, so the retry succeeds.
+        """
+
+        url = reverse("userListCreate")
+        data = {
+            "username": "test",
+            "birthDate": "1998-10-06",
+            "password": "test",
+            "password2": "test",
+            "email": "test@gmail.com",
+        }
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(User.objects.filter(email="test@gmail.com").exists())
+
+        with override_settings(PASSWORD_HASH_QUEUE=8):
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(PASSWORD_HASH_QUEUE=0)
+    def testSaturatedPoolLeavesNoDriver(self):
+        """
+        Ensure a driver registration rejected by a full pool stores no driver nor preference.
+        """
+
+        url = reverse("driverListCreate")
+        data = {
+            "username": "test",
+            "birthDate": "1998-10-06",
+            "password": "test",
+            "password2": "test",
+            "dni": "09876543A",
+            "email": "test@gmail.com",
+            "chargerTypes": [ChargerType.objects.create(chargerType="Mennekes").pk],
+            "preference": {
+                "canNotTravelWithPets": True,
+                "listenToMusic": True,
+                "noSmoking": True,
+                "talkTooMuch": True,
+            },
+            "iban": "ES6567822449",
+        }
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(User.objects.filter(email="test@gmail.com").exists())
+        self.assertFalse(Preference.objects.exists())
+
+
 class ListUserTest(APITestCase):
     """
     Test List User
@@ -197,12 +309,189 @@ class ListUserTest(APITestCase):
         self.assertEqual(message[2].get("points"), self.user3.points)
 
 
+class PaginatedListUserTest(APITestCase):
+    """
+    Test List User with cursor pagination
+    """
+
+    def setUp(self):
+        for i in range(5):
+            User.objects.create(
+                username=f"test{i}",
+                birthDate="1998-10-06",
+                password="test",
+                email=f"test{i}@gmail.com",
+                points=i % 2,
+            )
+
+    def testWalkPages(self):
+        """
+        Ensure the cursors walk every user once and in order.
+        """
+
+        url = reverse("userListCreate")
+        response = self.client.get(url, {"page_size": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(len(message.get("results")), 2)
+        self.assertIsNone(message.get("previous"))
+
+        seen = [user.get("username") for user in message.get("results")]
+        while message.get("next"):
+            response = self.client.get(message.get("next"))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            message = json.loads(response.content.decode("utf-8"))
+            seen += [user.get("username") for user in message.get("results")]
+        self.assertEqual(seen, [f"test{i}" for i in range(5)])
+
+        # Going back from the last page returns the previous one
+        response = self.client.get(message.get("previous"))
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            [user.get("username") for user in message.get("results")], ["test2", "test3"]
+        )
+
+    def testOrderingByPoints(self):
+        """
+        Ensure the keyset follows the ordering param with the id as tie-breaker.
+        """
+
+        url = reverse("userListCreate")
+        response = self.client.get(url, {"page_size": 3, "ordering": "-points"})
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            [user.get("username") for user in message.get("results")], ["test3", "test1", "test4"]
+        )
+        response = self.client.get(message.get("next"))
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            [user.get("username") for user in message.get("results")], ["test2", "test0"]
+        )
+        self.assertIsNone(message.get("next"))
+
+    def testPageSizeIsCapped(self):
+        """
+        Ensure the page size cannot go over the maximum.
+        """
+
+        url = reverse("userListCreate")
+        with mock.patch.object(KeysetPagination, "max_page_size", 3):
+            response = self.client.get(url, {"page_size": 100000})
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(len(message.get("results")), 3)
+        self.assertIsNotNone(message.get("next"))
+
+    def testInvalidCursor(self):
+        """
+        Ensure the API call returns an error if the cursor is not valid.
+        """
+
+        url = reverse("userListCreate")
+        response = self.client.get(url, {"cursor": "notACursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SearchUserTest(APITestCase):
+    """
+    Test Search User
+    """
+
+    def setUp(self):
+        for username in ["marta", "martina", "amartin", "pol"]:
+            User.objects.create(
+                username=username,
+                birthDate="1998-10-06",
+                password="test",
+                email=f"{username}@gmail.com",
+            )
+
+    def testSearchIsRanked(self):
+        """
+        Ensure the search returns exact, prefix and substring matches in that order.
+        """
+
+        url = reverse("userListCreate")
+        response = self.client.get(url, {"search": "mart"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            [user.get("username") for user in message], ["marta", "martina", "amartin"]
+        )
+
+        response = self.client.get(url, {"search": "marta"})
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual([user.get("username") for user in message], ["marta"])
+
+    def testPaginatedSearchKeepsRanking(self):
+        """
+        Ensure the pages of a search keep the best matches first, ordered within each rank.
+        """
+
+        url = reverse("userListCreate")
+        params = {"search": "mart", "ordering": "-createdAt", "page_size": 1}
+        usernames = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            message = json.loads(response.content.decode("utf-8"))
+            usernames += [user.get("username") for user in message.get("results")]
+            if not message.get("next"):
+                break
+            response = self.client.get(message.get("next"))
+        self.assertEqual(usernames, ["martina", "marta", "amartin"])
+
+    def testSearchWithoutNarrowingIndex(self):
+        """
+        Ensure the search gives the same results when the index matches too many users.
+        """
+
+        url = reverse("userListCreate")
+        with mock.patch.object(NGramSearchBackend, "maxCandidates", 1):
+            response = self.client.get(url, {"search": "mart"})
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            [user.get("username") for user in message], ["marta", "martina", "amartin"]
+        )
+
+    def testSearchFollowsRenames(self):
+        """
+        Ensure the search index is updated when a username changes.
+        """
+
+        url = reverse("userListCreate")
+        self.client.get(url, {"search": "pol"})
+        user = User.objects.get(username="pol")
+        user.username = "paula"
+        user.save()
+
+        response = self.client.get(url, {"search": "pol"})
+        self.assertEqual(json.loads(response.content.decode("utf-8")), [])
+        response = self.client.get(url, {"search": "pau"})
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual([user.get("username") for user in message], ["paula"])
+
+    def testAutocomplete(self):
+        """
+        Ensure the autocomplete returns the best matches for a short text.
+        """
+
+        url = reverse("usernameAutocomplete")
+        response = self.client.get(url, {"q": "ma"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            [user.get("username") for user in message], ["marta", "martina", "amartin"]
+        )
+
+
 class GetUserTest(APITestCase):
     """
     Test Get User
     """
 
     def setUp(self):
+        caches["shared"].clear()
+        resetCaches()
         self.user = User.objects.create(
             username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
         )
@@ -612,6 +901,77 @@ class DriverToUserTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+class SignedTokenConversionTest(APITestCase):
+    """
+    Test the conversions between user and driver with a signed access token
+    """
+
+    def setUp(self):
+        # The views read the authentication classes of the settings when imported
+        for view in (DriverToUser, UserToDriver):
+            patcher = mock.patch.object(
+                view,
+                "authentication_classes",
+                [SignedTokenAuthentication, CachedTokenAuthentication],
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def testDriverToUser(self):
+        """
+        Ensure the driver becomes a user keeping its data, the token user is not read after
+        the driver row is deleted.
+        """
+        driver = Driver.objects.create(
+            username="driver1",
+            first_name="Driver",
+            birthDate="1998-10-06",
+            email="driver@gmail.com",
+            password="driver",
+            dni="12345678",
+            preference=Preference.objects.create(),
+            iban="ES662100999",
+        )
+        headers = {"Authorization": f"Bearer {issueAccessToken(driver)}"}
+        response = self.client.post(reverse("driverToUser"), headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user = User.objects.get(pk=driver.pk)
+        self.assertEqual((user.username, user.first_name), ("driver1", "Driver"))
+        self.assertFalse(Driver.objects.filter(pk=driver.pk).exists())
+
+    def testUserToDriver(self):
+        """
+        Ensure the user becomes a driver with a signed access token.
+        """
+        user = User.objects.create(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        headers = {"Authorization": f"Bearer {issueAccessToken(user)}"}
+        response = self.client.post(
+            reverse("userToDriver"), {"dni": "E210283822"}, headers=headers  # type: ignore
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Driver.objects.get(pk=user.pk).username, "test")
+
+    def testFailedConversionKeepsDriver(self):
+        """
+        Ensure a conversion failing midway leaves the driver as it was.
+        """
+        driver = Driver.objects.create(
+            username="driver1",
+            birthDate="1998-10-06",
+            email="driver@gmail.com",
+            password="driver",
+            dni="12345678",
+            iban="ES662100999",
+        )
+        headers = {"Authorization": f"Bearer {issueAccessToken(driver)}"}
+        with mock.patch("api.views.User.objects.create", side_effect=ValueError("failed")):
+            response = self.client.post(reverse("driverToUser"), headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Driver.objects.filter(pk=driver.pk).exists())
+
+
 class LogoutTest(APITestCase):
     """
     Test Logout
@@ -13,8 +13,18 @@ from rest_framework import status
 from common.models.valuation import Valuation
 from common.models.user import User, Driver, ChargerType, Preference
 from common.models.route import Route
+from common.models.achievement import Achievement, UserAchievementProgress
 
 import json
+from io import StringIO
+from types import SimpleNamespace
+
+from achievement.catalog import catalog
+from api.models import UserRatingSummary
+from api.serializers import ValuationRegisterSerializer
+from userApi.cache import resetCaches
+from django.core.cache import caches
+from django.core.management import call_command
 
 from rest_framework.authtoken.models import Token
 
@@ -249,6 +259,53 @@ class CreateValuationTest(APITestCase):
         self.assertIn("You have already rated this user in this route.", message.get("error"))
 
 
+class ValuationQueryBudgetTest(APITestCase):
+    """
+    Test module pinning the number of queries of the valuation validation.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        self.driver = Driver.objects.create(
+            username="driver1",
+            birthDate="1998-10-06",
+            email="driver@gmail.com",
+            password="driver",
+            dni="12345678",
+            preference=Preference.objects.create(),
+            iban="ES662100999",
+        )
+        self.route = Route.objects.create(
+            driver_id=self.driver.pk,
+            originLat=41.350450,
+            originLon=2.132660,
+            originAlias="SomeWhere",
+            destinationLat=41.419860,
+            destinationLon=2.2009346,
+            destinationAlias="AnotherPlace",
+            distance=100,
+            duration=20,
+            departureTime="2024-05-19T18:21:56.083Z",
+            freeSeats=5,
+            price=20.0,
+        )
+        self.route.passengers.add(self.user)
+
+    def testValidationQueryBudget(self):
+        """
+        Ensure the validation loads the route, its members and the duplicate check only.
+        """
+
+        data = {"receiver": self.driver.pk, "route": self.route.pk, "rating": 5}
+        serializer = ValuationRegisterSerializer(
+            data=data, context={"request": SimpleNamespace(user=self.user)}
+        )
+        with self.assertNumQueries(3):
+            self.assertTrue(serializer.is_valid())
+
+
 class ListValuationTest(APITestCase):
     """
     Test module for listing valuations.
@@ -394,3 +451,285 @@ class ListValuationTest(APITestCase):
         self.assertEqual(message[1].get("giver"), self.user2.pk)
         self.assertEqual(message[1].get("rating"), 5)
         self.assertEqual(message[1].get("comment"), "Valuando driver")
+
+
+    def testValuationListNotModified(self):
+        """
+        Ensure an unchanged list of valuations is answered with 304 until a valuation arrives.
+        """
+
+        url = reverse("myValuationList")
+        headers = {
+            "Authorization": f"Token {self.tokenDriver}",
+        }
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+
+        headers["If-None-Match"] = etag
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+        data = {"receiver": self.driver.pk, "route": self.route.pk, "rating": 4}
+        response = self.client.post(
+            reverse("valuationListCreate"),
+            data,
+            format="json",
+            headers={"Authorization": f"Token {self.tokenUser}"},  # type: ignore
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+        userUrl = reverse("userValuationList", kwargs={"user_id": self.driver.pk})
+        response = self.client.get(userUrl, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        headers["If-None-Match"] = response["ETag"]
+        response = self.client.get(userUrl, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], headers["If-None-Match"])
+
+
+class RatingSummaryTest(APITestCase):
+    """
+    Test module for the rating summary of the users.
+    """
+
+    def setUp(self):
+        caches["shared"].clear()
+        resetCaches()
+        self.user = User.objects.create(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        self.tokenUser = Token.objects.create(user=self.user)
+        self.user2 = User.objects.create(
+            username="test2", birthDate="1998-10-06", password="test2", email="test2@gmail.com"
+        )
+        self.tokenUser2 = Token.objects.create(user=self.user2)
+        self.driver = Driver.objects.create(
+            username="driver1",
+            birthDate="1998-10-06",
+            email="driver@gmail.com",
+            password="driver",
+            dni="12345678",
+            preference=Preference.objects.create(),
+            iban="ES662100999",
+        )
+        self.tokenDriver = Token.objects.create(user=self.driver)
+        self.route = Route.objects.create(
+            driver_id=self.driver.pk,
+            originLat=41.350450,
+            originLon=2.132660,
+            originAlias="SomeWhere",
+            destinationLat=41.419860,
+            destinationLon=2.2009346,
+            destinationAlias="AnotherPlace",
+            distance=100,
+            duration=20,
+            departureTime="2024-05-19T18:21:56.083Z",
+            freeSeats=5,
+            price=20.0,
+        )
+        self.route.passengers.add(self.user)
+        self.route.passengers.add(self.user2)
+
+    def valuate(self, token, rating):
+        url = reverse("valuationListCreate")
+        data = {"receiver": self.driver.pk, "route": self.route.pk, "rating": rating}
+        headers = {
+            "Authorization": f"Token {token}",
+        }
+        response = self.client.post(url, data, format="json", headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def testSummaryIsUpdated(self):
+        """
+        Ensure the summary is updated with every valuation and exposed on the driver.
+        """
+
+        self.valuate(self.tokenUser, 5)
+        self.valuate(self.tokenUser2, 2)
+
+        url = reverse("userRatingSummary", kwargs={"user_id": self.driver.pk})
+        headers = {
+            "Authorization": f"Token {self.tokenUser}",
+        }
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(message.get("count"), 2)
+        self.assertEqual(message.get("total"), 7)
+        self.assertEqual(message.get("mean"), 3.5)
+        self.assertEqual(message.get("histogram"), {"1": 0, "2": 1, "3": 0, "4": 0, "5": 1})
+
+        url = reverse("driverRetriever", kwargs={"pk": self.driver.pk})
+        response = self.client.get(url)
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(message.get("rating").get("count"), 2)
+        self.assertEqual(message.get("rating").get("mean"), 3.5)
+
+    def testCachedDriverShowsNewRating(self):
+        """
+        Ensure a valuation drops the cached driver, whose rating changed.
+        """
+
+        url = reverse("driverRetriever", kwargs={"pk": self.driver.pk})
+        response = self.client.get(url)
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(message.get("rating").get("count"), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.valuate(self.tokenUser, 4)
+        response = self.client.get(url)
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(message.get("rating").get("count"), 1)
+        self.assertEqual(message.get("rating").get("mean"), 4)
+
+    def testSummaryOfUnratedUser(self):
+        """
+        Ensure a user without valuations has an empty summary.
+        """
+
+        url = reverse("userRatingSummary", kwargs={"user_id": self.user.pk})
+        headers = {
+            "Authorization": f"Token {self.tokenUser}",
+        }
+        response = self.client.get(url, headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        message = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(message.get("count"), 0)
+        self.assertIsNone(message.get("mean"))
+
+    def testDeletedValuationsAreRemoved(self):
+        """
+        Ensure the valuations deleted along with their giver or route leave the summary.
+        """
+
+        self.valuate(self.tokenUser, 5)
+        self.valuate(self.tokenUser2, 2)
+
+        self.user2.delete()
+        summary = UserRatingSummary.objects.get(user_id=self.driver.pk)
+        self.assertEqual((summary.count, summary.total), (1, 5))
+        self.assertEqual(summary.histogram, {"1": 0, "2": 0, "3": 0, "4": 0, "5": 1})
+
+        self.route.delete()
+        summary.refresh_from_db()
+        self.assertEqual((summary.count, summary.total, summary.stars5), (0, 0, 0))
+        self.assertIsNone(summary.mean)
+
+    def testRebuildSummaries(self):
+        """
+        Ensure the management command rebuilds the summaries from the valuations.
+        """
+
+        self.valuate(self.tokenUser, 4)
+        UserRatingSummary.objects.all().delete()
+
+        call_command("rebuild_rating_summaries", stdout=StringIO())
+        summary = UserRatingSummary.objects.get(user_id=self.driver.pk)
+        self.assertEqual(summary.count, 1)
+        self.assertEqual(summary.stars4, 1)
+
+
+class BulkValuationTest(APITestCase):
+    """
+    Test module for creating many valuations at once.
+    """
+
+    def setUp(self):
+        self.achievement = Achievement.objects.create(
+            title="CriticoEstelar", description="Valuate", required_points=2
+        )
+        self.user = User.objects.create(
+            username="test", birthDate="1998-10-06", password="test", email="test@gmail.com"
+        )
+        self.user2 = User.objects.create(
+            username="test2", birthDate="1998-10-06", password="test2", email="test2@gmail.com"
+        )
+        self.outsider = User.objects.create(
+            username="test3", birthDate="1998-10-06", password="test3", email="test3@gmail.com"
+        )
+        self.driver = Driver.objects.create(
+            username="driver1",
+            birthDate="1998-10-06",
+            email="driver@gmail.com",
+            password="driver",
+            dni="12345678",
+            preference=Preference.objects.create(),
+            iban="ES662100999",
+        )
+        self.tokenDriver = Token.objects.create(user=self.driver)
+        self.route = Route.objects.create(
+            driver_id=self.driver.pk,
+            originLat=41.350450,
+            originLon=2.132660,
+            originAlias="SomeWhere",
+            destinationLat=41.419860,
+            destinationLon=2.2009346,
+            destinationAlias="AnotherPlace",
+            distance=100,
+            duration=20,
+            departureTime="2024-05-19T18:21:56.083Z",
+            freeSeats=5,
+            price=20.0,
+        )
+        self.route.passengers.add(self.user)
+        self.route.passengers.add(self.user2)
+
+    def tearDown(self):
+        catalog.invalidate()
+
+    def testBulkValuation(self):
+        """
+        Ensure the valid valuations are created and the invalid ones are reported.
+        """
+
+        url = reverse("bulkValuationCreate")
+        data = {
+            "valuations": [
+                {"receiver": self.user.pk, "route": self.route.pk, "rating": 5, "comment": "Bien"},
+                {"receiver": self.user2.pk, "route": self.route.pk, "rating": 3},
+                {"receiver": self.outsider.pk, "route": self.route.pk, "rating": 1},
+                {"receiver": self.user.pk, "route": self.route.pk, "rating": 1},
+            ]
+        }
+        headers = {
+            "Authorization": f"Token {self.tokenDriver}",
+        }
+        response = self.client.post(url, data, format="json", headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = json.loads(response.content.decode("utf-8")).get("results")
+        self.assertEqual([result.get("created") for result in results], [True, True, False, False])
+        self.assertEqual(results[2].get("error"), "The receiver is not part of the route.")
+        self.assertEqual(results[3].get("error"), "You have already rated this user in this route.")
+
+        valuation = Valuation.objects.get(pk=results[0].get("id"))
+        self.assertEqual(valuation.receiver.pk, self.user.pk)
+        self.assertEqual(valuation.comment, "Bien")
+        self.assertEqual(Valuation.objects.count(), 2)
+        self.assertEqual(UserRatingSummary.objects.get(user_id=self.user2.pk).total, 3)
+
+        progress = UserAchievementProgress.objects.get(
+            user=self.driver, achievement=self.achievement
+        )
+        self.assertEqual(progress.progress, 2)
+        self.assertTrue(progress.achieved)
+
+    def testNothingCreated(self):
+        """
+        Ensure the API call returns an error when every valuation is invalid.
+        """
+
+        url = reverse("bulkValuationCreate")
+        data = {"valuations": [{"receiver": self.driver.pk, "route": self.route.pk, "rating": 5}]}
+        headers = {
+            "Authorization": f"Token {self.tokenDriver}",
+        }
+        response = self.client.post(url, data, format="json", headers=headers)  # type: ignore
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        results = json.loads(response.content.decode("utf-8")).get("results")
+        self.assertEqual(results[0].get("error"), "You cannot rate yourself.")
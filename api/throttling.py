@@ -0,0 +1,222 @@
+"""
+Throttling of the expensive endpoints (password checks, emails and Firebase calls), keyed by
+the client IP, the authenticated user or the email the request targets.
+
+The views pick a ``throttle_scope`` and the throttle classes for the keys they care about,
+the rate of each key is ``REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]["<scope>.<key>"]``, i.e.
+``"login.email": "5/min"``. Keys without a rate are not throttled. The state lives in the
+cache alias named by ``THROTTLE_CACHE``, the shared cache of ``SHARED_CACHE_URL`` by default,
+so the rate is shared by the workers. Without a shared cache it lives in each process, and a
+client gets the rate once per worker. Throttled requests get a 429 with the ``Retry-After``
+header set by DRF. The client IP is the one of ``REST_FRAMEWORK["NUM_PROXIES"]``, the address
+of the connection unless proxies in front of the api are configured.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+class MemoryThrottleStore:
+    """
+    Throttling state of this process, bounded to ``maxEntries`` keys.
+    """
+
+    maxEntries = 100000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            return entry[0]
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            if len(self.entries) >= self.maxEntries:
+                now = time.monotonic()
+                self.entries = {k: e for k, e in self.entries.items() if e[1] > now}
+            self.entries[key] = (value, time.monotonic() + timeout)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class CacheThrottleStore:
+    """
+    Throttling state shared by the workers through a Django cache. The cache is shared with
+    other state, so clear() only deletes the keys this process wrote, at most ``maxEntries``
+    of them are remembered until they expire.
+    """
+
+    maxEntries = 100000
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.lock = threading.Lock()
+        self.written = {}
+
+    def get(self, key):
+        return caches[self.alias].get(key)
+
+    def set(self, key, value, timeout):
+        caches[self.alias].set(key, value, timeout)
+        with self.lock:
+            if len(self.written) >= self.maxEntries:
+                now = time.monotonic()
+                self.written = {k: at for k, at in self.written.items() if at > now}
+            if len(self.written) < self.maxEntries:
+                self.written[key] = time.monotonic() + timeout
+
+    def clear(self):
+        with self.lock:
+            keys, self.written = list(self.written), {}
+        caches[self.alias].delete_many(keys)
+
+
+_store = None
+
+
+def get_throttle_store():
+    """
+    Returns the store configured in ``settings.THROTTLE_CACHE``.
+    """
+    global _store
+    if _store is None:
+        alias = getattr(settings, "THROTTLE_CACHE", None)
+        _store = CacheThrottleStore(alias) if alias else MemoryThrottleStore()
+    return _store
+
+
+def reset_throttles():
+    """
+    Forgets the state of every throttle, the next store is built from the settings.
+    """
+    global _store
+    if _store is not None:
+        _store.clear()
+    _store = None
+
+
+@receiver(setting_changed)
+def throttle_cache_changed(setting, **kwargs):
+    if setting == "THROTTLE_CACHE":
+        reset_throttles()
+
+
+def parseRate(rate):
+    """
+    Returns the requests and the seconds of a rate like "5/min".
+    """
+    num, period = rate.split("/")
+    return int(num), {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+
+
+class ScopedKeyThrottle(BaseThrottle):
+    """
+    Base of the throttles, subclasses tell which key of the request they limit. The
+    ``throttle_algorithm`` of the view is either "sliding_window", where at most N requests
+    are allowed in any window of the period, or "token_bucket", which refills N tokens per
+    period and allows bursts of N requests.
+    """
+
+    key = None
+
+    def identity(self, request, view):
+        raise NotImplementedError
+
+    def rate(self, view):
+        scope = getattr(view, "throttle_scope", None)
+        if scope is None:
+            return None
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(f"{scope}.{self.key}")
+        return parseRate(rate) if rate else None
+
+    def allow_request(self, request, view):
+        self.waitFor = None
+        rate = self.rate(view)
+        identity = self.identity(request, view) if rate else None
+        if identity is None:
+            return True
+
+        algorithm = getattr(view, "throttle_algorithm", "sliding_window")
+        cacheKey = f"throttle:{view.throttle_scope}:{self.key}:{algorithm}:{identity}"
+        num, duration = rate
+        if algorithm == "token_bucket":
+            self.waitFor = self.tokenBucket(cacheKey, num, duration)
+        else:
+            self.waitFor = self.slidingWindow(cacheKey, num, duration)
+        return self.waitFor is None
+
+    def slidingWindow(self, cacheKey, num, duration):
+        store = get_throttle_store()
+        now = time.time()
+        history = [at for at in store.get(cacheKey) or [] if at > now - duration]
+        if len(history) >= num:
+            return history[len(history) - num] + duration - now
+        history.append(now)
+        store.set(cacheKey, history, duration)
+        return None
+
+    def tokenBucket(self, cacheKey, num, duration):
+        store = get_throttle_store()
+        now = time.time()
+        refill = num / duration
+        tokens, updatedAt = store.get(cacheKey) or (num, now)
+        tokens = min(num, tokens + (now - updatedAt) * refill)
+        if tokens < 1:
+            return (1 - tokens) / refill
+        store.set(cacheKey, (tokens - 1, now), duration)
+        return None
+
+    def wait(self):
+        return self.waitFor
+
+
+class IPThrottle(ScopedKeyThrottle):
+    """
+    Limits the requests of each client IP.
+    """
+
+    key = "ip"
+
+    def identity(self, request, view):
+        return self.get_ident(request)
+
+
+class UserThrottle(ScopedKeyThrottle):
+    """
+    Limits the requests of each authenticated user.
+    """
+
+    key = "user"
+
+    def identity(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return None
+        return request.user.pk
+
+
+class EmailThrottle(ScopedKeyThrottle):
+    """
+    Limits the requests targeting each email, i.e. the logins or resets of an account.
+    """
+
+    key = "email"
+
+    def identity(self, request, view):
+        email = request.data.get("email") if hasattr(request.data, "get") else None
+        if not isinstance(email, str) or not email:
+            return None
+        return email.strip().lower()
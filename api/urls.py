@@ -20,7 +20,10 @@ from django.urls import path
 
 urlpatterns = [
     path("logut/", views.Logout.as_view(), name="logout"),
+    path("metrics/db/", views.DatabaseMetrics.as_view(), name="databaseMetrics"),
+    path("metrics/cache/", views.CacheMetrics.as_view(), name="cacheMetrics"),
     path("users/", views.UserListCreate.as_view(), name="userListCreate"),
+    path("users/autocomplete/", views.UsernameAutocomplete.as_view(), name="usernameAutocomplete"),
     path("drivers/", views.DriverListCreate.as_view(), name="driverListCreate"),
     path("drivers/<int:pk>/", views.DriverRetriever.as_view(), name="driverRetriever"),
     path("users/<int:pk>/", views.UserRetriever.as_view(), name="userRetriever"),
@@ -28,13 +31,20 @@ urlpatterns = [
     path("reports/<int:pk>/", views.ReportRetriever.as_view(), name="reportRetriever"),
     path("users/self/", views.UserIdRetriever.as_view(), name="userIdRetriever"),
     path("valuate/", views.ValuationListCreate.as_view(), name="valuationListCreate"),
+    path("valuate/bulk/", views.BulkValuationCreate.as_view(), name="bulkValuationCreate"),
     path("self/valuations/", views.MyValuationList.as_view(), name="myValuationList"),
     path(
         "users/<int:user_id>/valuations/",
         views.UserValuationList.as_view(),
         name="userValuationList",
     ),
+    path(
+        "users/<int:user_id>/rating/",
+        views.UserRatingSummaryRetriever.as_view(),
+        name="userRatingSummary",
+    ),
     path("push/register/<int:pk>", views.RegisterFCMToken.as_view(), name="registerFCMToken"),
+    path("push/notify/bulk", views.SendBulkFCMNotification.as_view(), name="notifyUsers"),
     path("push/notify/<int:pk>", views.SendFCMNotification.as_view(), name="notifyUser"),
     path("users/<int:pk>/avatar", views.UserModifyAvatar.as_view(), name="userModifyAvatar"),
     path("user-to-driver/", views.UserToDriver.as_view(), name="userToDriver"),
@@ -8,13 +8,13 @@ from common.models.route import Route
 from common.models.user import ChargerType, Driver, Preference, Report, User
 from common.models.valuation import Valuation
 from django.contrib.auth import logout
+from django.db import connections, transaction
+from django.db.models import Count, Max
 from django.forms import model_to_dict
 from django.shortcuts import get_object_or_404
 from drf_yasg.utils import swagger_auto_schema
-from firebase_admin.exceptions import FirebaseError
 from rest_framework import generics, status
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import (
     CreateAPIView,
     GenericAPIView,
@@ -29,24 +29,38 @@ from rest_framework.response import Response
 from rest_framework.status import (
     HTTP_200_OK,
     HTTP_201_CREATED,
+    HTTP_202_ACCEPTED,
+    HTTP_207_MULTI_STATUS,
     HTTP_400_BAD_REQUEST,
     HTTP_403_FORBIDDEN,
-    HTTP_500_INTERNAL_SERVER_ERROR,
 )
 from rest_framework.views import APIView
-
+from userApi.cache import cacheStats
+
+from .authentication import tokenCache
+from .conditional import ConditionalGetMixin, fingerprintETag
+from .models import RefreshToken
+from .pagination import KeysetPagination
+from .profile_cache import CachedRetrieveMixin, forgetProfile
+from .search import UsernameSearchFilter, get_search_backend
+from .throttling import UserThrottle
 from .serializers import (
+    BulkFCMessageSerializer,
+    BulkValuationSerializer,
     DriverRegisterSerializer,
     DriverSerializer,
     FCMessageSerializer,
     FCMTokenSerializer,
+    RatingSummarySerializer,
     ReportSerializer,
     UserImageUpdateSerializer,
     UserRegisterSerializer,
     UserSerializer,
+    UserSuggestionSerializer,
     UserToDriverSerializer,
     ValuationRegisterSerializer,
     ValuationSerializer,
+    ratingSummaryOf,
 )
 
 pushController = PushController()
@@ -60,11 +74,12 @@ class UserListCreate(ListCreateAPIView):
         generics (ListAPIView): This generates a list of users and pass it as json for the response
     """
 
-    queryset = User.objects.all()
+    queryset = User.objects.select_related("rating_summary")
     serializer_class = UserSerializer
-    filter_backends = [SearchFilter, OrderingFilter]
+    filter_backends = [UsernameSearchFilter, OrderingFilter]
     search_fields = ["username"]
-    order_fields = ["points", "createdAt", "updatedAt"]
+    ordering_fields = ["points", "createdAt", "updatedAt"]
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         if self.request.method == "POST":
@@ -72,6 +87,24 @@ class UserListCreate(ListCreateAPIView):
         return super().get_serializer_class()
 
 
+class UsernameAutocomplete(ListAPIView):
+    """
+    The class that will return the users whose username best matches the typed text
+
+    Args:
+        generics (ListAPIView): This generates a list of users and pass it as json for the response
+    """
+
+    serializer_class = UserSuggestionSerializer
+    limit = 10
+
+    def get_queryset(self):
+        term = self.request.query_params.get("q", "").strip()
+        if not term:
+            return User.objects.none()
+        return get_search_backend().suggest(User.objects.all(), term, self.limit)
+
+
 class UserModifyAvatar(UpdateAPIView):
     """
     The class that will modify the avatar of a user
@@ -82,7 +115,6 @@ class UserModifyAvatar(UpdateAPIView):
 
     queryset = User.objects.all()
     serializer_class = UserImageUpdateSerializer
-    authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
 
@@ -105,11 +137,12 @@ class DriverListCreate(ListCreateAPIView):
         generics (ListAPIView): This generates a list of users and pass it as json for the response
     """
 
-    queryset = Driver.objects.all()
+    queryset = Driver.objects.select_related("rating_summary")
     serializer_class = DriverSerializer
-    filter_backends = [SearchFilter, OrderingFilter]
+    filter_backends = [UsernameSearchFilter, OrderingFilter]
     search_fields = ["username"]
-    order_fields = ["driverPoints", "createdAt", "updatedAt"]
+    ordering_fields = ["driverPoints", "points", "createdAt", "updatedAt"]
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         if self.request.method == "POST":
@@ -117,7 +150,7 @@ class DriverListCreate(ListCreateAPIView):
         return super().get_serializer_class()
 
 
-class DriverRetriever(RetrieveUpdateDestroyAPIView):
+class DriverRetriever(CachedRetrieveMixin, RetrieveUpdateDestroyAPIView):
     """
     The Retriever for the Driver class
 
@@ -126,9 +159,9 @@ class DriverRetriever(RetrieveUpdateDestroyAPIView):
         updating or deleting a model instance.
     """
 
-    queryset = Driver.objects.all()
+    queryset = Driver.objects.select_related("rating_summary")
     serializer_class = DriverSerializer
-    authentication_classes = [TokenAuthentication]
+    profileKind = "driver"
 
     def get_permissions(self):
         if self.request.method == "GET":
@@ -150,6 +183,7 @@ class DriverRetriever(RetrieveUpdateDestroyAPIView):
         for route in routes:
             route.passengers.remove(instance)
 
+        forgetProfile(instance.id)
         return super().delete(request, *args, **kwargs)
 
     def update(self, request, *args, **kwargs):
@@ -163,7 +197,7 @@ class DriverRetriever(RetrieveUpdateDestroyAPIView):
         return super().update(request, *args, **kwargs)
 
 
-class UserRetriever(RetrieveUpdateDestroyAPIView):
+class UserRetriever(CachedRetrieveMixin, RetrieveUpdateDestroyAPIView):
     """
     The Retriever for the User class
 
@@ -172,11 +206,11 @@ class UserRetriever(RetrieveUpdateDestroyAPIView):
         updating or deleting a model instance.
     """
 
-    queryset = User.objects.all()
+    queryset = User.objects.select_related("rating_summary")
     serializer_class = UserSerializer
+    profileKind = "user"
     # parser_classes = (FormParser, MultiPartParser)
 
-    authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def delete(self, request, *args, **kwargs):
@@ -190,6 +224,7 @@ class UserRetriever(RetrieveUpdateDestroyAPIView):
         routes = Route.objects.filter(passengers=instance)
         for route in routes:
             route.passengers.remove(instance)
+        forgetProfile(instance.id)
         return super().delete(request, *args, **kwargs)
 
     def update(self, request, *args, **kwargs):
@@ -213,7 +248,6 @@ class ReportListCreate(ListCreateAPIView):
 
     queryset = Report.objects.all()
     serializer_class = ReportSerializer
-    authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
 
@@ -228,7 +262,6 @@ class ReportRetriever(RetrieveUpdateDestroyAPIView):
 
     queryset = Report.objects.all()
     serializer_class = ReportSerializer
-    authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def delete(self, request, *args, **kwargs):
@@ -260,7 +293,6 @@ class UserIdRetriever(GenericAPIView):
         generics (GenericAPIView): Generic view for retrieving the user id.
     """
 
-    authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = UserSerializer
 
@@ -288,11 +320,53 @@ class ValuationListCreate(CreateAPIView):
 
     queryset = Valuation.objects.all()
     serializer_class = ValuationRegisterSerializer
-    authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
 
-class MyValuationList(ListAPIView):
+class BulkValuationCreate(APIView):
+    """
+    The class that will create many valuations at once, i.e. when a route finishes
+
+    Args:
+        APIView: This creates the valuations and pass the result of each one as json
+    """
+
+    serializer_class = BulkValuationSerializer
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        request_body=BulkValuationSerializer,
+        operation_summary="Create many valuations at once",
+        operation_description="Create many valuations at once, the result of each one is returned",
+        responses={201: "Created", 207: "Partially created", 400: "Bad Request"},
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save()
+
+        created = sum(1 for result in results if result["created"])
+        if created == len(results):
+            responseStatus = HTTP_201_CREATED
+        elif created:
+            responseStatus = HTTP_207_MULTI_STATUS
+        else:
+            responseStatus = HTTP_400_BAD_REQUEST
+        return Response(data={"results": results}, status=responseStatus)
+
+
+class ValuationFingerprintMixin(ConditionalGetMixin):
+    """
+    ETag of the valuation lists: valuations are never edited, so their number and the last
+    id tell whether the list changed.
+    """
+
+    def etag(self, request):
+        versions = self.get_queryset().aggregate(count=Count("id"), last=Max("id"))
+        return fingerprintETag(request.get_full_path(), versions["count"], versions["last"])
+
+
+class MyValuationList(ValuationFingerprintMixin, ListAPIView):
     """
     The class that will generate all the valuations of the user logged in
 
@@ -301,14 +375,13 @@ class MyValuationList(ListAPIView):
     """
 
     serializer_class = ValuationSerializer
-    authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Valuation.objects.filter(receiver=self.request.user)
+        return Valuation.objects.filter(receiver_id=self.request.user.id)
 
 
-class UserValuationList(ListAPIView):
+class UserValuationList(ValuationFingerprintMixin, ListAPIView):
     """
     The class that will generate all the valuations of a user
 
@@ -317,7 +390,6 @@ class UserValuationList(ListAPIView):
     """
 
     serializer_class = ValuationSerializer
-    authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -325,6 +397,33 @@ class UserValuationList(ListAPIView):
         return Valuation.objects.filter(receiver=user)
 
 
+class UserRatingSummaryRetriever(GenericAPIView):
+    """
+    The class that will return the rating summary of a user
+
+    Args:
+        generics (GenericAPIView): Generic view for retrieving the rating summary.
+    """
+
+    serializer_class = RatingSummarySerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Retrieves the count, sum, mean and per-star histogram of the valuations of a user.
+
+        Args:
+            request (HttpRequest): The request object
+
+        Returns:
+            Response: The rating summary
+        """
+        queryset = User.objects.select_related("rating_summary")
+        user = get_object_or_404(queryset, pk=kwargs["user_id"])
+        serializer = self.get_serializer(ratingSummaryOf(user))
+        return Response(data=serializer.data, status=HTTP_200_OK)
+
+
 class RegisterFCMToken(APIView):
     """
     The class that will register the FCM token of the user
@@ -334,8 +433,9 @@ class RegisterFCMToken(APIView):
     """
 
     serializer_class = FCMTokenSerializer
-    authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_scope = "pushRegister"
+    throttle_classes = [UserThrottle]
 
     @swagger_auto_schema(
         request_body=FCMTokenSerializer,
@@ -350,16 +450,9 @@ class RegisterFCMToken(APIView):
         serializer.is_valid(raise_exception=True)
 
         token: str = serializer.validated_data.get("token")  # type: ignore
-        try:
-            # Retrieve the fcm token
-            pushController.addToken(user, token)
-        except FirebaseError as e:
-            if isinstance(e.http_response, Response):
-                return e.http_response
-            return Response(
-                data={"error": e.cause},
-                status=HTTP_500_INTERNAL_SERVER_ERROR,
-            )
+        # The token is validated with Firebase in the background by validate_fcm_tokens, the
+        # response keeps the 201 the clients expect
+        pushController.addToken(user, token)
         return Response(status=HTTP_201_CREATED)
 
 
@@ -372,7 +465,10 @@ class SendFCMNotification(APIView):
     """
 
     serializer_class = FCMessageSerializer
-    authentication_classes = [TokenAuthentication]
+    # Bursts are fine, i.e. a chat with several messages, the refill keeps the average
+    throttle_scope = "pushNotify"
+    throttle_algorithm = "token_bucket"
+    throttle_classes = [UserThrottle]
     permission_classes = [
         IsAuthenticated,
         # IsAdminUser,
@@ -382,7 +478,7 @@ class SendFCMNotification(APIView):
         request_body=FCMessageSerializer,
         operation_summary="Send a FCM notification to a user",
         operation_description="Send a FCM notification to a user",
-        responses={201: "Sent", 400: "Bad Request", 403: "Forbidden"},
+        responses={201: "Queued", 400: "Bad Request", 403: "Forbidden"},
     )
     def post(self, request, pk):
         user = get_object_or_404(User, pk=pk)
@@ -390,8 +486,7 @@ class SendFCMNotification(APIView):
         serializer = self.serializer_class(data=request.data)
         serializer.is_valid(raise_exception=True)
         # Check if user has a device token
-        token = pushController.token(user)
-        if token is None:
+        if not pushController.hasDevices(user):
             return Response(
                 data={"error": "User does not have a device token"},
                 status=HTTP_403_FORBIDDEN,
@@ -401,133 +496,234 @@ class SendFCMNotification(APIView):
         title: str = valid.get("title")  # type: ignore
         body: str = valid.get("body")  # type: ignore
 
-        try:
-            pushController.notifyTo(
-                user, title, body, PushController.FCMPriority(priority))
-        except FirebaseError as e:
-            return Response(data={"error": "Error sending the FCM notification"}, status=e.code)
+        # Sent by the send_push_outbox worker
+        pushController.enqueue(
+            [user.pk], title, body, PushController.FCMPriority(priority), valid.get("collapseKey")
+        )
         return Response(status=HTTP_201_CREATED)
 
 
-class DriverToUser(APIView):
+class SendBulkFCMNotification(APIView):
+    """
+    The class that will send a FCM notification to many users at once
+
+    Args:
+        APIView: This queues the FCM notification and pass the result of each user as json
+    """
+
+    serializer_class = BulkFCMessageSerializer
+    # Shares the bucket of SendFCMNotification, a bulk send is one request of the sender
+    throttle_scope = "pushNotify"
+    throttle_algorithm = "token_bucket"
+    throttle_classes = [UserThrottle]
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
 
+    @swagger_auto_schema(
+        request_body=BulkFCMessageSerializer,
+        operation_summary="Send a FCM notification to many users",
+        operation_description="Send a FCM notification to the given users or route passengers",
+        responses={
+            202: "Queued",
+            400: "Bad Request",
+            403: "Forbidden",
+            404: "Route not found",
+            429: "Too Many Requests",
+        },
+    )
     def post(self, request):
-        try:
-            driver = get_object_or_404(Driver, id=request.user.id)
-            achivements = UserAchievementProgress.objects.filter(
-                user=request.user
-            )
-            vector_achivements_data = []
-            for achivement in achivements:
-                vector_achivements_data.append(model_to_dict(achivement))
-
-            driver_data = {
-                "dni": driver.dni,
-                "driverPoints": driver.driverPoints,
-                "autonomy": driver.autonomy,
-                "chargerTypes": list(driver.chargerTypes.all()),
-                "preference": driver.preference,
-                "iban": driver.iban,
-                "profileImage": driver.profileImage,
-                "createdAt": driver.createdAt,
-                "birthDate": driver.birthDate,
-                "points": driver.points,
-                "password": driver.password,
-                "typeOfLogin": driver.typeOfLogin,
-            }
-            driver.delete()
-
-            # Recreate the user with the same ID (ID is not changed)
-            user = User.objects.create(
-                id=request.user.id,
-                username=request.user.username,
-                first_name=request.user.first_name,
-                last_name=request.user.last_name,
-                password=driver_data.get("password", "0"),
-                email=request.user.email,
-                birthDate=driver_data["birthDate"],
-                points=driver_data["points"],
-                profileImage=driver_data["profileImage"],
-                createdAt=driver_data["createdAt"],
-                typeOfLogin=driver_data.get("typeOfLogin", "base"),
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not serializer.allowedFor(request.user):
+            return Response(
+                data={"error": "Only admins or the driver of the route can send it."},
+                status=HTTP_403_FORBIDDEN,
             )
-            achivements = UserAchievementProgress.objects.filter(user=user)
+        valid = serializer.validated_data
+        priority: str = valid.get("priority", "normal")  # type: ignore
+
+        # Only the users with a device are queued, the worker sends to them later
+        recipients = serializer.recipients()
+        tokens = pushController.tokensOf(recipients)
+        results = [
+            {"user": userId, "devices": len(tokens.get(userId, [])), "queued": userId in tokens}
+            for userId in recipients
+        ]
+        pushController.enqueue(
+            list(tokens),
+            valid.get("title"),  # type: ignore
+            valid.get("body"),  # type: ignore
+            PushController.FCMPriority(priority),
+            valid.get("collapseKey"),
+        )
+        return Response(data={"queued": len(tokens), "results": results}, status=HTTP_202_ACCEPTED)
 
-            i = 0
-            for achivement in achivements:
-                achivement.date_achieved = vector_achivements_data[i]["date_achieved"]
-                achivement.progress = vector_achivements_data[i]["progress"]
-                achivement.achieved = vector_achivements_data[i]["achieved"]
-                achivement.save()
-                i += 1
 
+class DriverToUser(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            # The user is deleted and created again, nothing is lost when it fails midway
+            with transaction.atomic():
+                user = self.convert(request.user.id)
             serialaizer = UserSerializer(user)
 
             return Response(serialaizer.data, status=HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
 
+    def convert(self, userId):
+        driver = get_object_or_404(Driver, id=userId)
+        achivements = UserAchievementProgress.objects.filter(user_id=userId)
+        vector_achivements_data = []
+        for achivement in achivements:
+            vector_achivements_data.append(model_to_dict(achivement))
+
+        # Read from the driver before deleting it, request.user may load the deleted row
+        driver_data = {
+            "username": driver.username,
+            "first_name": driver.first_name,
+            "last_name": driver.last_name,
+            "email": driver.email,
+            "profileImage": driver.profileImage,
+            "createdAt": driver.createdAt,
+            "birthDate": driver.birthDate,
+            "points": driver.points,
+            "password": driver.password,
+            "typeOfLogin": driver.typeOfLogin,
+        }
+        driver.delete()
+        forgetProfile(userId)
+
+        # Recreate the user with the same ID (ID is not changed)
+        user = User.objects.create(
+            id=userId,
+            username=driver_data["username"],
+            first_name=driver_data["first_name"],
+            last_name=driver_data["last_name"],
+            password=driver_data.get("password", "0"),
+            email=driver_data["email"],
+            birthDate=driver_data["birthDate"],
+            points=driver_data["points"],
+            profileImage=driver_data["profileImage"],
+            createdAt=driver_data["createdAt"],
+            typeOfLogin=driver_data.get("typeOfLogin", "base"),
+        )
+        achivements = UserAchievementProgress.objects.filter(user=user)
+
+        i = 0
+        for achivement in achivements:
+            achivement.date_achieved = vector_achivements_data[i]["date_achieved"]
+            achivement.progress = vector_achivements_data[i]["progress"]
+            achivement.achieved = vector_achivements_data[i]["achieved"]
+            achivement.save()
+            i += 1
+        return user
+
 
 class UserToDriver(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
     serializer_class = UserToDriverSerializer
 
     def post(self, request):
         try:
-            user = get_object_or_404(User, id=request.user.id)
-            data = request.data
-
-            charger_types = data.get("chargerTypes", [])
-
-            preferences = data.get("preferences", {})
-            preferenceInstance = Preference.objects.create()
-            preferenceInstance.canNotTravelWithPets = preferences.get(
-                "canNotTravelWithPets", False)
-            preferenceInstance.listenToMusic = preferences.get(
-                "listenToMusic", False)
-            preferenceInstance.noSmoking = preferences.get("noSmoking", False)
-            preferenceInstance.talkTooMuch = preferences.get(
-                "talkTooMuch", False)
-            preferenceInstance.save()
-
-            driver = Driver.objects.create(
-                id=request.user.id,
-                username=user.username,
-                first_name=user.first_name,
-                last_name=user.last_name,
-                email=user.email,
-                password=user.password,
-                birthDate=user.birthDate,
-                points=user.points,
-                profileImage=user.profileImage,
-                createdAt=user.createdAt,
-                typeOfLogin=user.typeOfLogin,
-                dni=data["dni"],
-                driverPoints=data.get("driverPoints", 0),
-                autonomy=data.get("autonomy", 0),
-                iban=data.get("iban", ""),
-
-            )
-            driver.chargerTypes.set(charger_types)
-            driver.preference = preferenceInstance  # type: ignore
-            driver.save()
-            print("driver saved")
+            with transaction.atomic():
+                user = get_object_or_404(User, id=request.user.id)
+                data = request.data
+
+                charger_types = data.get("chargerTypes", [])
+
+                preferences = data.get("preferences", {})
+                preferenceInstance = Preference.objects.create()
+                preferenceInstance.canNotTravelWithPets = preferences.get(
+                    "canNotTravelWithPets", False)
+                preferenceInstance.listenToMusic = preferences.get(
+                    "listenToMusic", False)
+                preferenceInstance.noSmoking = preferences.get("noSmoking", False)
+                preferenceInstance.talkTooMuch = preferences.get(
+                    "talkTooMuch", False)
+                preferenceInstance.save()
+
+                driver = Driver.objects.create(
+                    id=request.user.id,
+                    username=user.username,
+                    first_name=user.first_name,
+                    last_name=user.last_name,
+                    email=user.email,
+                    password=user.password,
+                    birthDate=user.birthDate,
+                    points=user.points,
+                    profileImage=user.profileImage,
+                    createdAt=user.createdAt,
+                    typeOfLogin=user.typeOfLogin,
+                    dni=data["dni"],
+                    driverPoints=data.get("driverPoints", 0),
+                    autonomy=data.get("autonomy", 0),
+                    iban=data.get("iban", ""),
+
+                )
+                driver.chargerTypes.set(charger_types)
+                driver.preference = preferenceInstance  # type: ignore
+                driver.save()
+                forgetProfile(driver.id)
+                print("driver saved")
 
             return Response({"message": "You are now a driver."}, status=HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
 
 
+class DatabaseMetrics(APIView):
+    """
+    The class that returns how the database connections of this worker are reused
+
+    Args:
+        APIView: This returns, for each database, its persistence settings and the counters
+        of its connection pool when DATABASE_POOL is enabled
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        metrics = {}
+        for connection in connections.all():
+            poolStats = getattr(connection, "poolStats", None)
+            metrics[connection.alias] = {
+                "vendor": connection.vendor,
+                "connMaxAge": connection.settings_dict["CONN_MAX_AGE"],
+                "healthChecks": connection.settings_dict["CONN_HEALTH_CHECKS"],
+                "pool": poolStats() if poolStats else None,
+            }
+        return Response(data=metrics, status=HTTP_200_OK)
+
+
+class CacheMetrics(APIView):
+    """
+    The class that returns the counters of the tiered caches of this worker
+
+    Args:
+        APIView: This returns, for each cache namespace, its hits in each tier, misses,
+        invalidations and the entries of its in-process tier
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(data=cacheStats(), status=HTTP_200_OK)
+
+
 class Logout(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
 
     def post(self, request):
         try:
+            userId = request.user.id
             logout(request)
+            if isinstance(request.auth, dict):
+                # Signed access tokens expire by themselves, only the refresh tokens are revoked
+                RefreshToken.revokeAll(userId)
+            elif request.auth is not None:
+                tokenCache.invalidate(request.auth.key)
             return Response({"message": "You are now logged out."}, status=HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
@@ -0,0 +1,29 @@
+"""
+Management command running the worker that sends the queued emails.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from emailSending.outbox import deliverEmails
+
+
+class Command(BaseCommand):
+    help = "Send the queued emails, reusing one connection to the email server per batch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Send the due emails and exit")
+        parser.add_argument("--interval", type=float, default=5.0)
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        while True:
+            result = deliverEmails(options["batch_size"])
+            if any(result.values()):
+                self.stdout.write(
+                    f"Sent {result['sent']}, retried {result['retried']}, "
+                    f"dead {result['dead']} emails"
+                )
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emailSending', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailoutbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('sending', 'sending'), ('sent', 'sent'), ('dead', 'dead')], default='pending', max_length=10),
+        ),
+    ]
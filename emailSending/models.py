@@ -0,0 +1,41 @@
+"""
+This document contains the models of the emails sent by the user api
+"""
+
+from django.db import models
+from django.utils import timezone
+
+
+class EmailOutbox(models.Model):
+    """
+    An email waiting to be sent by the ``send_email_outbox`` worker. A worker sending an email
+    marks it as sending until ``nextAttemptAt``, when another worker may claim it again. Emails
+    that keep failing end as dead letters, kept with their last error for inspection. The body
+    of the emails is blanked once they are sent or dead, and the sent ones are purged after a
+    day.
+    """
+
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    DEAD = "dead"
+
+    statusChoices = [(PENDING, "pending"), (SENDING, "sending"), (SENT, "sent"), (DEAD, "dead")]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    htmlBody = models.TextField(blank=True)
+    fromEmail = models.CharField(max_length=255)
+    to = models.JSONField()
+    status = models.CharField(max_length=10, choices=statusChoices, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    nextAttemptAt = models.DateTimeField(default=timezone.now)
+    lastError = models.TextField(blank=True)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    sentAt = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "nextAttemptAt"])]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)}"
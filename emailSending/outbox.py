@@ -0,0 +1,130 @@
+"""
+Outbox of the emails sent by the user api, the requests only queue them and the
+``send_email_outbox`` worker delivers them reusing one SMTP connection per batch.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+# Delivery of the queued emails, retried with exponential backoff before the dead letter
+MAX_ATTEMPTS = 5
+BACKOFF = timedelta(seconds=30)
+MAX_BACKOFF = timedelta(hours=1)
+
+# Time a worker has to send the emails it claimed before others claim them
+LEASE = timedelta(minutes=5)
+
+# Sent emails are kept this long, without their body, before they are purged
+RETENTION = timedelta(days=1)
+
+
+def queueEmail(subject, body, to, htmlBody="", fromEmail=None):
+    """
+    Stores the email in the outbox and returns it, it is sent by the worker.
+    """
+    return EmailOutbox.objects.create(
+        subject=subject,
+        body=body,
+        htmlBody=htmlBody,
+        fromEmail=fromEmail or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+    )
+
+
+def buildMessage(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject, email.body, email.fromEmail, email.to, connection=connection
+    )
+    if email.htmlBody:
+        message.attach_alternative(email.htmlBody, "text/html")
+    return message
+
+
+def forgetBody(email):
+    # The body may hold secrets, i.e. the password reset link, not needed once delivered
+    email.body = ""
+    email.htmlBody = ""
+
+
+def failed(email, error):
+    email.attempts += 1
+    email.lastError = str(error)
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = EmailOutbox.DEAD
+        forgetBody(email)
+        return "dead"
+    email.status = EmailOutbox.PENDING
+    email.nextAttemptAt = timezone.now() + min(BACKOFF * 2 ** (email.attempts - 1), MAX_BACKOFF)
+    return "retried"
+
+
+def claimEmails(limit):
+    """
+    Marks the due emails as being sent by this worker until LEASE ends and returns them. The
+    rows locked by another worker claiming them at the same time are skipped, and the ones
+    whose lease ended, i.e. the worker sending them died, are claimed again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[EmailOutbox.PENDING, EmailOutbox.SENDING], nextAttemptAt__lte=now)
+            .order_by("nextAttemptAt", "pk")[:limit]
+        )
+        EmailOutbox.objects.filter(pk__in=[email.pk for email in due]).update(
+            status=EmailOutbox.SENDING, nextAttemptAt=now + LEASE
+        )
+    return due
+
+
+def deliverEmails(limit=100):
+    """
+    Claims the queued emails whose time has come and sends them through a single connection
+    of the configured EMAIL_BACKEND. Emails that fail are retried with backoff and end as dead
+    letters after MAX_ATTEMPTS. The body of the sent and dead emails is blanked, and the sent
+    ones are purged after RETENTION. Returns how many emails ended in each state.
+    """
+    result = {"sent": 0, "retried": 0, "dead": 0}
+    due = claimEmails(limit)
+    if not due:
+        return result
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.error(f"Failed to connect to the email server {e}")
+        for email in due:
+            result[failed(email, e)] += 1
+    else:
+        try:
+            for email in due:
+                try:
+                    buildMessage(email, connection).send()
+                except Exception as e:
+                    logger.error(f"Failed to send email {email.pk} {e}")
+                    result[failed(email, e)] += 1
+                else:
+                    email.status = EmailOutbox.SENT
+                    email.sentAt = timezone.now()
+                    forgetBody(email)
+                    result["sent"] += 1
+        finally:
+            connection.close()
+
+    EmailOutbox.objects.bulk_update(
+        due, ["status", "attempts", "nextAttemptAt", "lastError", "sentAt", "body", "htmlBody"]
+    )
+    EmailOutbox.objects.filter(
+        status=EmailOutbox.SENT, sentAt__lt=timezone.now() - RETENTION
+    ).delete()
+    return result
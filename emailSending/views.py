@@ -2,8 +2,6 @@
     This module contains the view used to send an email to the site owner.
 """
 
-from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
 from rest_framework import status
@@ -13,7 +11,10 @@ from rest_framework.authtoken.models import Token
 from django.contrib.auth.tokens import default_token_generator
 from django.shortcuts import render
 
+from .outbox import queueEmail
 from .serializers import PasswordResetRequestSerializer, SetNewPasswordSerializer
+from api.models import RefreshToken
+from api.throttling import EmailThrottle, IPThrottle
 from common.models.user import User
 
 
@@ -27,6 +28,8 @@ class PasswordResetRequestView(GenericAPIView):
     """
 
     serializer_class = PasswordResetRequestSerializer
+    throttle_scope = "passwordReset"
+    throttle_classes = [IPThrottle, EmailThrottle]
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -60,10 +63,8 @@ class PasswordResetRequestView(GenericAPIView):
             <p>If you did not make this request, you can ignore this email.</p>
             <p>Thanks,<br>Your Website Team</p>
             """
-            from_email = settings.DEFAULT_FROM_EMAIL
-            msg = EmailMultiAlternatives(subject, text_content, from_email, [email])
-            msg.attach_alternative(html_content, "text/html")
-            msg.send()
+            # Sent by the send_email_outbox worker, the request does not wait for the server
+            queueEmail(subject, text_content, [email], htmlBody=html_content)
 
             return Response({"message": "Password reset link sent."}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -87,8 +88,9 @@ class PasswordResetConfirmView(GenericAPIView):
             user.set_password(new_password)
             user.save()
 
-            # Invalidate all auth tokens for the user
+            # Invalidate all auth tokens for the user, and the refresh tokens minting new ones
             Token.objects.filter(user=user).delete()
+            RefreshToken.revokeAll(user.pk)
 
             return Response(
                 {"message": "Password has been reset successfully."}, status=status.HTTP_200_OK
@@ -0,0 +1,90 @@
+"""
+Gunicorn configuration of the production server, used by the Dockerfile:
+
+    gunicorn -c gunicorn.conf.py
+
+SERVER_MODE selects the application: "wsgi" serves userApi/wsgi.py with threaded workers and
+"asgi" serves userApi/asgi.py with uvicorn workers. With PASSWORD_HASH_WORKERS the threads of a
+worker hash the passwords in a process pool, so a login burst does not hold its GIL.
+
+With RUN_WORKERS=true the master also runs ``manage.py run_workers``, which sends the queued
+push notifications and emails and validates the FCM tokens. Enable it in a single container
+of the deployment, or run that command as its own service instead.
+
+The app is preloaded in the master so the workers share its memory after the fork. Send HUP
+to the master to gracefully restart the workers with the same code, and USR2 followed by
+QUIT to the old master to gracefully switch to new code.
+"""
+
+import multiprocessing
+import os
+import subprocess
+import sys
+
+mode = os.environ.get("SERVER_MODE", "wsgi")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+if mode == "asgi":
+    wsgi_app = "userApi.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "userApi.wsgi:application"
+    worker_class = "gthread"
+    threads = int(os.environ.get("SERVER_THREADS", 4))
+
+# The usual 2 x CPU + 1, WEB_CONCURRENCY overrides it
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+preload_app = True
+
+# Requests running when a worker is asked to stop have this long to finish
+graceful_timeout = int(os.environ.get("SERVER_GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("SERVER_TIMEOUT", 60))
+keepalive = 5
+
+# Recycle the workers now and then, so a leak cannot grow without bounds
+max_requests = int(os.environ.get("SERVER_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("SERVER_LOG_LEVEL", "info")
+
+runWorkers = os.environ.get("RUN_WORKERS", "false").lower() == "true"
+backgroundWorkers = None
+
+
+def when_ready(server):
+    # The background workers live as long as the master, not restarted with the web workers
+    global backgroundWorkers
+    if runWorkers:
+        manage = os.path.join(os.path.dirname(os.path.abspath(__file__)), "manage.py")
+        backgroundWorkers = subprocess.Popen([sys.executable, manage, "run_workers"])
+
+
+def on_exit(server):
+    if backgroundWorkers is not None and backgroundWorkers.poll() is None:
+        backgroundWorkers.terminate()
+        try:
+            backgroundWorkers.wait(15)
+        except subprocess.TimeoutExpired:
+            backgroundWorkers.kill()
+
+
+def post_fork(server, worker):
+    # Connections opened while preloading must not be shared by the forked workers
+    from django.db import connections
+
+    connections.close_all()
+
+
+def worker_exit(server, worker):
+    # Close the persistent and pooled connections of the worker
+    from django.db import connections
+
+    connections.close_all()
+    if os.environ.get("DATABASE_POOL", "false").lower() == "true":
+        from userApi.db.postgresql_pool.base import DatabaseWrapper
+
+        DatabaseWrapper.closePools()
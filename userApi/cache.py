@@ -0,0 +1,290 @@
+"""
+Tiered cache of the read paths: a bounded LRU in each process (L1) in front of the cache
+alias named by ``TIERED_CACHE`` (L2), shared by the workers. ``TIERED_CACHE`` is the Redis
+server of ``SHARED_CACHE_URL`` by default; without one there is no L2 and each process only
+has its L1, so an invalidation made by another process, i.e. a management command, only
+reaches it when its entries expire.
+
+Each ``TieredCache`` has a namespace whose keys are invalidated all at once by bumping the
+namespace version kept in L2. A process trusts the L1 entries and the version it has seen for
+``TIERED_CACHE_LOCAL_TTL`` seconds, so the changes made by the other workers reach it within
+that time. ``getOrSet`` computes a missing value once, even when many requests ask for it at
+the same time in this or another worker.
+"""
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+MISSING = object()
+
+_registry = {}
+
+
+class TieredCache:
+    """
+    Cache of one namespace, i.e. ``TieredCache("drivers")``.
+
+    Parameters:
+        namespace: Prefix of the keys, registered to report its counters
+        timeout: Seconds the values live in L2, the alias default when not given
+        localTimeout: Seconds the values live in L1, ``TIERED_CACHE_LOCAL_TTL`` by default
+        localSize: Entries kept in L1, ``TIERED_CACHE_LOCAL_SIZE`` by default
+    """
+
+    # Seconds a worker computing a value keeps the others waiting for it at most
+    lockTimeout = 10
+    lockStripes = 64
+
+    def __init__(
+        self,
+        namespace,
+        timeout=DEFAULT_TIMEOUT,
+        localTimeout=None,
+        localSize=None,
+        clock=time.monotonic,
+    ):
+        self.namespace = namespace
+        self.timeout = timeout
+        self.localTimeoutOverride = localTimeout
+        self.localSizeOverride = localSize
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.computeLocks = [threading.Lock() for _ in range(self.lockStripes)]
+        self.version = None
+        self.versionCheckedAt = 0.0
+        self.versionKey = f"{namespace}:version"
+        self.resetCounters()
+        _registry[namespace] = self
+
+    @property
+    def cache(self):
+        alias = getattr(settings, "TIERED_CACHE", None)
+        return caches[alias] if alias else None
+
+    @property
+    def localTimeout(self):
+        if self.localTimeoutOverride is not None:
+            return self.localTimeoutOverride
+        return settings.TIERED_CACHE_LOCAL_TTL
+
+    @property
+    def localSize(self):
+        if self.localSizeOverride is not None:
+            return self.localSizeOverride
+        return settings.TIERED_CACHE_LOCAL_SIZE
+
+    def resetCounters(self):
+        with self.lock:
+            self.counters = {
+                "localHits": 0,
+                "sharedHits": 0,
+                "misses": 0,
+                "sets": 0,
+                "invalidations": 0,
+                "waits": 0,
+            }
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def sharedKey(self, key):
+        return f"{self.namespace}:{key}"
+
+    def currentVersion(self):
+        """
+        The version of the namespace, read from L2 at most every ``localTimeout`` seconds.
+        """
+        now = self.clock()
+        with self.lock:
+            if self.version is not None and now - self.versionCheckedAt < self.localTimeout:
+                return self.version
+
+        cache = self.cache
+        version = cache.get(self.versionKey) if cache else None
+        if cache and version is None:
+            cache.add(self.versionKey, 1, timeout=None)
+            version = cache.get(self.versionKey, 1)
+        with self.lock:
+            if version is None:
+                version = self.version or 1
+            if version != self.version:
+                self.entries.clear()
+            self.version = version
+            self.versionCheckedAt = now
+        return version
+
+    def getLocal(self, key, version):
+        with self.lock:
+            entry = self.entries.get((version, key))
+            if entry is None:
+                return MISSING
+            pickled, expiresAt = entry
+            if expiresAt <= self.clock():
+                del self.entries[(version, key)]
+                return MISSING
+            self.entries.move_to_end((version, key))
+        return pickle.loads(pickled)
+
+    def setLocal(self, key, value, version):
+        # Pickled, so the callers cannot change the cached values
+        pickled = pickle.dumps(value)
+        with self.lock:
+            self.entries[(version, key)] = (pickled, self.clock() + self.localTimeout)
+            self.entries.move_to_end((version, key))
+            while len(self.entries) > self.localSize:
+                self.entries.popitem(last=False)
+
+    def lookup(self, key, version):
+        value = self.getLocal(key, version)
+        if value is not MISSING:
+            self.count("localHits")
+            return value
+        cache = self.cache
+        value = cache.get(self.sharedKey(key), MISSING, version=version) if cache else MISSING
+        if value is MISSING:
+            return MISSING
+        self.count("sharedHits")
+        self.setLocal(key, value, version)
+        return value
+
+    def store(self, key, value, timeout, version):
+        self.count("sets")
+        self.setLocal(key, value, version)
+        cache = self.cache
+        if cache:
+            timeout = self.timeout if timeout is DEFAULT_TIMEOUT else timeout
+            cache.set(self.sharedKey(key), value, timeout, version=version)
+
+    def get(self, key, default=None):
+        """
+        Returns the value of the key, the default when it is not cached.
+        """
+        value = self.lookup(key, self.currentVersion())
+        if value is MISSING:
+            self.count("misses")
+            return default
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        """
+        Caches the value of the key in both tiers.
+        """
+        self.store(key, value, timeout, self.currentVersion())
+
+    def getOrSet(self, key, compute, timeout=DEFAULT_TIMEOUT):
+        """
+        Returns the value of the key, calling ``compute`` to cache it when it is missing.
+
+        Only one thread of the process computes a key at a time, and the L2 lock makes the
+        other workers wait up to ``lockTimeout`` seconds for its value instead of computing
+        it too, without holding the in-process lock of the key while they wait. The value is cached under the version seen before computing it, so a value
+        computed while the namespace is invalidated is not served afterwards.
+        """
+        version = self.currentVersion()
+        value = self.lookup(key, version)
+        if value is not MISSING:
+            return value
+
+        with self.computeLocks[hash(key) % self.lockStripes]:
+            value = self.lookup(key, version)
+            if value is not MISSING:
+                return value
+            self.count("misses")
+
+            cache = self.cache
+            lockKey = f"{self.sharedKey(key)}:lock"
+            locked = cache is None or cache.add(lockKey, 1, self.lockTimeout, version=version)
+            if locked:
+                try:
+                    value = compute()
+                    self.store(key, value, timeout, version)
+                finally:
+                    if cache is not None:
+                        cache.delete(lockKey, version=version)
+                return value
+
+        # Waited without the stripe lock, the other keys of the stripe are not held up
+        value = self.waitShared(key, version)
+        if value is MISSING:
+            value = compute()
+            self.store(key, value, timeout, version)
+        return value
+
+    def waitShared(self, key, version):
+        # Another worker computes the value, it is computed here too if it takes too long
+        self.count("waits")
+        cache = self.cache
+        deadline = self.clock() + self.lockTimeout
+        while self.clock() < deadline:
+            time.sleep(0.05)
+            value = cache.get(self.sharedKey(key), MISSING, version=version)
+            if value is not MISSING:
+                self.setLocal(key, value, version)
+                return value
+        return MISSING
+
+    def delete(self, key):
+        """
+        Forgets the value of the key, the other processes keep their L1 copy until it expires.
+        """
+        version = self.currentVersion()
+        with self.lock:
+            self.entries.pop((version, key), None)
+        cache = self.cache
+        if cache:
+            cache.delete(self.sharedKey(key), version=version)
+
+    def invalidate(self):
+        """
+        Forgets every value of the namespace by moving it to a new version.
+        """
+        self.count("invalidations")
+        cache = self.cache
+        with self.lock:
+            version = (self.version or 1) + 1
+        if cache:
+            cache.add(self.versionKey, 1, timeout=None)
+            version = cache.incr(self.versionKey)
+        with self.lock:
+            self.entries.clear()
+            self.version = version
+            self.versionCheckedAt = self.clock()
+
+    def clearLocal(self):
+        """
+        Forgets the L1 of this process and the version it has seen.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.version = None
+
+    def stats(self):
+        """
+        The counters of the cache with the size of its L1.
+        """
+        with self.lock:
+            return {**self.counters, "localEntries": len(self.entries), "version": self.version}
+
+
+def cacheStats():
+    """
+    The stats of every tiered cache of the process, keyed by namespace.
+    """
+    return {namespace: cache.stats() for namespace, cache in _registry.items()}
+
+
+def resetCaches():
+    """
+    Forgets the L1 and the counters of every tiered cache of the process.
+    """
+    for cache in _registry.values():
+        cache.clearLocal()
+        cache.resetCounters()
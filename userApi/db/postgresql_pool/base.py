@@ -0,0 +1,96 @@
+"""
+PostgreSQL backend taking its connections from a psycopg 3 connection pool, selected with
+DATABASE_POOL=true. Django 5.0 has no pool support of its own, this follows the one added in
+Django 5.1 so the backend can be dropped when upgrading.
+
+The pool options are read from ``OPTIONS["pool"]``: min_size, max_size, timeout (seconds to
+wait for a free connection) and check, which tests every connection before handing it out.
+"""
+
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from psycopg import IsolationLevel
+from psycopg_pool import ConnectionPool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # One pool per database alias shared by the threads of the process
+    connectionPools = {}
+    poolsLock = threading.Lock()
+
+    @property
+    def poolOptions(self):
+        return dict(self.settings_dict["OPTIONS"].get("pool") or {})
+
+    @property
+    def pool(self):
+        pool = self.connectionPools.get(self.alias)
+        if pool is not None:
+            return pool
+
+        with self.poolsLock:
+            if self.alias not in self.connectionPools:
+                if self.settings_dict["CONN_MAX_AGE"] != 0:
+                    raise ImproperlyConfigured(
+                        "Pooled connections must set CONN_MAX_AGE to 0, the pool keeps them."
+                    )
+                options = self.poolOptions
+                check = options.pop("check", True)
+                pool = ConnectionPool(
+                    kwargs=self.get_connection_params(),
+                    open=False,
+                    name=self.alias,
+                    check=ConnectionPool.check_connection if check else None,
+                    **options,
+                )
+                pool.open()
+                self.connectionPools[self.alias] = pool
+        return self.connectionPools[self.alias]
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("pool", None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        isolationLevel = self.settings_dict["OPTIONS"].get("isolation_level")
+        try:
+            self.isolation_level = (
+                IsolationLevel.READ_COMMITTED
+                if isolationLevel is None
+                else IsolationLevel(isolationLevel)
+            )
+        except ValueError:
+            raise ImproperlyConfigured(
+                f"Invalid transaction isolation level {isolationLevel} specified. "
+                f"Use one of the psycopg.IsolationLevel values."
+            )
+        connection = self.pool.getconn()
+        if isolationLevel is not None:
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            # Give the connection back to the pool instead of closing it
+            self.connection._pool.putconn(self.connection)
+            self.connection = None
+
+    def poolStats(self):
+        """
+        The counters of the pool, i.e. its size, the connections available and the time
+        spent waiting for one.
+        """
+        pool = self.connectionPools.get(self.alias)
+        return pool.get_stats() if pool is not None else None
+
+    @classmethod
+    def closePools(cls):
+        with cls.poolsLock:
+            pools, cls.connectionPools = cls.connectionPools, {}
+        for pool in pools.values():
+            pool.close()
@@ -0,0 +1,168 @@
+"""
+Routing of the reads to the database replicas configured with DATABASE_REPLICAS.
+
+Only the safe requests (GET, HEAD, OPTIONS) served by the views of REPLICA_ROUTED_APPS read
+from a replica, everything else uses the primary. A client that writes is pinned to the
+primary for REPLICA_PIN_SECONDS so it reads back its own changes, and a replica that cannot
+be reached is skipped for REPLICA_HEALTH_TTL seconds. The credentials are always read from
+the primary: the request following a login sends a token the replicas may not have yet.
+
+The pins are kept in the cache alias named by REPLICA_PIN_CACHE, which must be shared by every
+worker: the next request of the client may reach another one. Without it every request reads
+from the primary, since a pin kept in one process would not protect the others.
+"""
+
+import contextvars
+import hashlib
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Models authenticating the requests, a client is not pinned before it is authenticated
+PRIMARY_MODELS = ("authtoken.token", "api.refreshtoken")
+
+_routing = contextvars.ContextVar("replicaRouting", default=None)
+
+
+class RoutingState:
+    """
+    How the queries of the current request are routed.
+    """
+
+    def __init__(self):
+        self.useReplica = False
+        self.wrote = False
+
+
+def replicaAliases():
+    return [alias for alias in settings.DATABASES if alias.startswith("replica")]
+
+
+def clientIdentity(request):
+    """
+    The client a request comes from: its credentials, or its IP when it sends none.
+    """
+    authorization = request.META.get("HTTP_AUTHORIZATION")
+    if authorization:
+        return hashlib.sha256(authorization.encode()).hexdigest()[:32]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def pinKey(identity):
+    return f"replica:pin:{identity}"
+
+
+def pinCache():
+    alias = getattr(settings, "REPLICA_PIN_CACHE", None)
+    return caches[alias] if alias else None
+
+
+class ReplicaRouter:
+    """
+    Database router reading from a healthy replica when the current request allows it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.health = {}
+
+    @property
+    def replicas(self):
+        return replicaAliases()
+
+    def isHealthy(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            healthy, checkedAt = self.health.get(alias, (None, 0.0))
+        if healthy is not None and now - checkedAt < settings.REPLICA_HEALTH_TTL:
+            return healthy
+
+        try:
+            connections[alias].ensure_connection()
+            healthy = True
+        except DatabaseError as e:
+            logger.warning(f"Database replica {alias} is unavailable: {e}")
+            healthy = False
+        with self.lock:
+            self.health[alias] = (healthy, now)
+        return healthy
+
+    def pickReplica(self):
+        replicas = self.replicas
+        random.shuffle(replicas)
+        for alias in replicas:
+            if self.isHealthy(alias):
+                return alias
+        return None
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or not state.useReplica or state.wrote:
+            return None
+        if model._meta.label_lower in PRIMARY_MODELS:
+            return None
+        # None falls back to the primary
+        return self.pickReplica()
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *self.replicas}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replicas receive the schema from the primary
+        if db in self.replicas:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Tells the ReplicaRouter which requests may read from a replica and pins the clients
+    that write to the primary.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState()
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        cache = pinCache()
+        if state.wrote and cache is not None and replicaAliases():
+            cache.set(pinKey(clientIdentity(request)), True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _routing.get()
+        cache = pinCache()
+        if state is None or request.method not in SAFE_METHODS or not replicaAliases():
+            return None
+        if cache is None:
+            # The pin of a client that wrote through another worker cannot be seen
+            return None
+        view = getattr(view_func, "view_class", view_func)
+        if view.__module__.split(".")[0] not in settings.REPLICA_ROUTED_APPS:
+            return None
+        state.useReplica = not cache.get(pinKey(clientIdentity(request)))
+        return None
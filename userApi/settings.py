@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from storages.backends.s3boto3 import S3Boto3Storage
 import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from storages.backends.s3boto3 import S3Boto3Storage
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -62,6 +63,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "userApi.db.router.ReplicaRoutingMiddleware",
 ]
 
 ROOT_URLCONF = "userApi.urls"
@@ -88,17 +90,59 @@ WSGI_APPLICATION = "userApi.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# DATABASE_POOL=true takes the PostgreSQL connections from a psycopg 3 pool, otherwise they
+# are kept open for DATABASE_CONN_MAX_AGE seconds and checked before being reused
+DATABASE_POOL = os.environ.get("DATABASE_POOL", "false").lower() == "true"
+
 DATABASES = {
     "default": {
-        "ENGINE": os.environ.get("DATABASE_ENGINE", "django.db.backends.sqlite3"),
+        "ENGINE": (
+            "userApi.db.postgresql_pool"
+            if DATABASE_POOL
+            else os.environ.get("DATABASE_ENGINE", "django.db.backends.sqlite3")
+        ),
         "NAME": os.environ.get("DATABASE_NAME", BASE_DIR / "db/db.sqlite3"),
         "USER": os.environ.get("DATABASE_USER", None),
         "PASSWORD": os.environ.get("DATABASE_PASSWORD", None),
         "HOST": os.environ.get("DATABASE_HOST", None),
         "PORT": os.environ.get("DATABASE_PORT", None),
+        "CONN_MAX_AGE": 0 if DATABASE_POOL else int(os.environ.get("DATABASE_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": os.environ.get("DATABASE_CONN_HEALTH_CHECKS", "true") == "true",
+        "OPTIONS": (
+            {
+                "pool": {
+                    "min_size": int(os.environ.get("DATABASE_POOL_MIN_SIZE", 2)),
+                    "max_size": int(os.environ.get("DATABASE_POOL_MAX_SIZE", 10)),
+                    "timeout": float(os.environ.get("DATABASE_POOL_TIMEOUT", 10)),
+                }
+            }
+            if DATABASE_POOL
+            else {}
+        ),
     }
 }
 
+# DATABASE_REPLICAS is a comma separated list of "host" or "host:port" read replicas of the
+# primary, the safe requests of REPLICA_ROUTED_APPS read from them (see userApi/db/router.py)
+for number, replica in enumerate(filter(None, os.environ.get("DATABASE_REPLICAS", "").split(","))):
+    host, _, port = replica.strip().partition(":")
+    DATABASES[f"replica{number + 1}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["userApi.db.router.ReplicaRouter"]
+
+REPLICA_ROUTED_APPS = ["api", "achievement", "usrLogin"]
+
+# Seconds a client reads from the primary after writing, so it sees its own changes
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 5))
+
+# Seconds the health of a replica is trusted before checking it again
+REPLICA_HEALTH_TTL = int(os.environ.get("REPLICA_HEALTH_TTL", 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -142,19 +186,125 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Authentication settings
+# Add "api.authentication.SignedTokenAuthentication" first to issue signed access tokens
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ],
+    # Rates of the api.throttling classes as "<throttle_scope>.<ip|user|email>"
+    "DEFAULT_THROTTLE_RATES": {
+        "login.ip": os.environ.get("THROTTLE_LOGIN_IP", "30/min"),
+        "login.email": os.environ.get("THROTTLE_LOGIN_EMAIL", "5/min"),
+        "passwordReset.ip": os.environ.get("THROTTLE_PASSWORD_RESET_IP", "10/hour"),
+        "passwordReset.email": os.environ.get("THROTTLE_PASSWORD_RESET_EMAIL", "3/hour"),
+        "pushRegister.user": os.environ.get("THROTTLE_PUSH_REGISTER_USER", "10/min"),
+        "pushNotify.user": os.environ.get("THROTTLE_PUSH_NOTIFY_USER", "60/min"),
+    },
+    # Proxies in front of the api, the client IP of the throttles is read from X-Forwarded-For
+    # behind them, otherwise from the connection since the header can be forged by the client
+    "NUM_PROXIES": int(os.environ.get("NUM_PROXIES", 0)),
+}
+
+
+# Username search backend, by default pg_trgm on PostgreSQL and an in-process n-gram index otherwise
+USERNAME_SEARCH_BACKEND = os.environ.get("USERNAME_SEARCH_BACKEND", None)
+
+# "default" lives in each process, "shared" is reached by every web and worker process when
+# SHARED_CACHE_URL points to a Redis server, i.e. "redis://redis:6379/0" (or when
+# SHARED_CACHE_BACKEND and SHARED_CACHE_LOCATION point to another server like Memcached).
+# Without them "shared" is one more cache of each process: nothing is shared, every worker
+# sees the changes made by the others only when its entries expire.
+SHARED_CACHE_URL = os.environ.get("SHARED_CACHE_URL", None)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": (
+            "django.core.cache.backends.redis.RedisCache"
+            if SHARED_CACHE_URL
+            else os.environ.get(
+                "SHARED_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+            )
+        ),
+        "LOCATION": SHARED_CACHE_URL or os.environ.get("SHARED_CACHE_LOCATION", "shared"),
+        "TIMEOUT": int(os.environ.get("SHARED_CACHE_TIMEOUT", 300)),
+        "KEY_PREFIX": "ppf",
+    },
 }
 
+# Alias of the cache really shared between processes, None when "shared" lives in each one
+SHARED_CACHE = "shared" if SHARED_CACHE_URL or os.environ.get("SHARED_CACHE_BACKEND") else None
+
+# Cache alias of the replica pins (userApi/db/router.py), shared by every worker.
+# Without it the replicas are not used, a client could miss its own writes
+REPLICA_PIN_CACHE = os.environ.get("REPLICA_PIN_CACHE", SHARED_CACHE) or None
+
+# Cache alias sharing the throttling state between workers, in-process only when not set: each
+# worker then allows the whole rate on its own
+THROTTLE_CACHE = os.environ.get("THROTTLE_CACHE", SHARED_CACHE) or None
+
+# L2 alias of the tiered caches of the read paths (userApi/cache.py), L1 only when empty
+TIERED_CACHE = os.environ.get("TIERED_CACHE", SHARED_CACHE) or None
+
+# The L1 is not told about changes made by other workers, keep it short lived
+TIERED_CACHE_LOCAL_TTL = int(os.environ.get("TIERED_CACHE_LOCAL_TTL", 5))
+TIERED_CACHE_LOCAL_SIZE = int(os.environ.get("TIERED_CACHE_LOCAL_SIZE", 10000))
+
+# Seconds the serialized users and drivers are cached. Each request checks the versions of
+# the user, only the changes that do not update them, i.e. queryset updates of other
+# services, are seen after it
+PROFILE_CACHE_TTL = int(os.environ.get("PROFILE_CACHE_TTL", 60))
+
+# Cache alias sharing the achievement catalog between workers, in-process only when not set
+ACHIEVEMENT_CATALOG_CACHE = os.environ.get("ACHIEVEMENT_CATALOG_CACHE", SHARED_CACHE) or None
+
+# Seconds the catalog is kept, the achievements other services change are seen after it
+ACHIEVEMENT_CATALOG_TTL = int(os.environ.get("ACHIEVEMENT_CATALOG_TTL", 300))
+
+# Transport used to send the push notifications, the FakeTransport records them instead
+PUSH_TRANSPORT = os.environ.get("PUSH_TRANSPORT", "api.notifications.transport.FirebaseTransport")
+
+# Seconds during which the notifications to a user with the same collapse key are merged
+PUSH_OUTBOX_COALESCE_WINDOW = int(os.environ.get("PUSH_OUTBOX_COALESCE_WINDOW", 60))
+
+# Maximum messages per second, one per device token, the send_push_outbox worker sends to
+# Firebase
+PUSH_OUTBOX_RATE = float(os.environ.get("PUSH_OUTBOX_RATE", 100))
+
+# Cache alias sharing the authenticated tokens between workers, in-process only when not set
+TOKEN_AUTH_CACHE = os.environ.get("TOKEN_AUTH_CACHE", SHARED_CACHE) or None
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get("TOKEN_AUTH_CACHE_TTL", 300))
+
+# The in-process copy is not told about changes made by other workers, keep it short lived
+TOKEN_AUTH_LOCAL_TTL = int(os.environ.get("TOKEN_AUTH_LOCAL_TTL", 10))
+TOKEN_AUTH_LOCAL_SIZE = int(os.environ.get("TOKEN_AUTH_LOCAL_SIZE", 10000))
+
+# Signed access tokens, the other services verify them with the same secret. The SECRET_KEY
+# above is public, so outside DEBUG the secret must come from the environment
+ACCESS_TOKEN_SECRET = os.environ.get("ACCESS_TOKEN_SECRET") or (SECRET_KEY if DEBUG else None)
+if not ACCESS_TOKEN_SECRET and any(
+    path.endswith(".SignedTokenAuthentication")
+    for path in REST_FRAMEWORK["DEFAULT_AUTHENTICATION_CLASSES"]
+):
+    raise ImproperlyConfigured("ACCESS_TOKEN_SECRET must be set to issue signed access tokens")
+ACCESS_TOKEN_TTL = int(os.environ.get("ACCESS_TOKEN_TTL", 300))
+REFRESH_TOKEN_TTL = int(os.environ.get("REFRESH_TOKEN_TTL", 30 * 24 * 3600))
+
+# Processes of each server worker hashing the passwords of the login and registration views,
+# 0 hashes in the request thread, and how many hashes may wait for them before the requests
+# are rejected with 503
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 0))
+PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", max(PASSWORD_HASH_WORKERS, 1) * 8))
+
 AUTHENTICATION_BACKENDS = [
     "usrLogin.backends.EmailBackend",
     "django.contrib.auth.backends.ModelBackend",
 ]
 
 # Email settings
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+# The console or filebased backends stand in for SMTP in local development, the tests use locmem
+EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
 EMAIL_HOST = os.environ.get("EMAIL_HOST")
 EMAIL_USE_TLS = True
 EMAIL_PORT = 587
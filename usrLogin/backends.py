@@ -2,8 +2,9 @@
     Module including the custom authentication backend for the user login.
 """
 
-from django.contrib.auth import get_user_model
+from common.models.user import User
 from django.contrib.auth.backends import ModelBackend
+from usrLogin.hashing import hashPool
 
 
 class EmailBackend(ModelBackend):
@@ -11,14 +12,32 @@ class EmailBackend(ModelBackend):
     Custom authentication backend for user login.
     """
 
-    def authenticate(self, request, username=None, password=None, **kwargs):
-        user_model = get_user_model()
+    # The only columns needed to check the credentials
+    loginFields = ["password", "is_active", "typeOfLogin"]
+
+    def authenticate(
+        self, request, username=None, password=None, email=None, typeOfLogin="base", **kwargs
+    ):
+        """
+        Returns the user with the email and password that logs in with typeOfLogin, loaded
+        with a single query. The login views pass the email as ``email``, so the
+        ModelBackend after this one skips them, other callers may still pass it as username.
+        The password is checked in the hashPool, which raises HashPoolSaturated when full, and
+        hashed again when the configured hasher changed, as User.check_password does.
+        """
+        email = email if email is not None else username
+        if email is None or password is None:
+            return None
         try:
-            # authenticate use by default the username field, but we are using the email field
-            user = user_model.objects.get(email=username)
-        except user_model.DoesNotExist:
+            user = User.objects.only(*self.loginFields).get(email=email, typeOfLogin=typeOfLogin)
+        except User.DoesNotExist:
             return None
         else:
-            if user.check_password(password):
+            matches, mustUpdate = hashPool.checkPassword(password, user.password)
+            if matches:
+                if mustUpdate:
+                    user.password = hashPool.makePassword(password)
+                    user.save(update_fields=["password"])
                 return user
         return None
+
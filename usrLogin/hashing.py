@@ -0,0 +1,177 @@
+"""
+Bounded process pool computing the password hashes of the login and registration views, so
+the CPU-bound hashing runs outside the GIL of the server worker and does not starve the
+threads serving the other requests.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HashPoolSaturated(APIException):
+    """
+    Raised when the pool already has ``PASSWORD_HASH_QUEUE`` hashes waiting or running, the
+    views answer it with a 503 asking the client to retry after a second.
+    """
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many requests at once, try again later"
+    default_code = "hash_pool_saturated"
+    wait = 1
+
+
+def initWorker():
+    # Spawned workers import the settings to know the configured password hashers
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "userApi.settings")
+    django.setup()
+
+
+def checkPasswordJob(password, encoded):
+    matches = check_password(password, encoded)
+    try:
+        # Like User.check_password, a hash of an older hasher or fewer iterations is upgraded
+        mustUpdate = matches and identify_hasher(encoded).must_update(encoded)
+    except ValueError:
+        mustUpdate = False
+    return time.time(), (matches, mustUpdate)
+
+
+def makePasswordJob(password):
+    return time.time(), make_password(password)
+
+
+class HashPoolMetrics:
+    """
+    Counters of the pool: how long the hashes waited for a worker and how many were rejected.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.completed = 0
+        self.rejected = 0
+        self.waitTotal = 0.0
+        self.waitMax = 0.0
+
+    def recordWait(self, wait):
+        with self.lock:
+            self.completed += 1
+            self.waitTotal += wait
+            self.waitMax = max(self.waitMax, wait)
+
+    def recordRejected(self):
+        with self.lock:
+            self.rejected += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "waitAvgMs": round(self.waitTotal / self.completed * 1000, 2)
+                if self.completed
+                else 0.0,
+                "waitMaxMs": round(self.waitMax * 1000, 2),
+            }
+
+
+class HashPool:
+    """
+    Runs the hashes in ``PASSWORD_HASH_WORKERS`` processes, started the first time they are
+    needed, or in the calling thread when it is 0. At most ``PASSWORD_HASH_QUEUE`` hashes are
+    accepted at once, the rest are rejected with HashPoolSaturated so the client retries later.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.inFlight = 0
+        self.metrics = HashPoolMetrics()
+
+    @property
+    def workers(self):
+        return settings.PASSWORD_HASH_WORKERS
+
+    @property
+    def maxQueue(self):
+        return settings.PASSWORD_HASH_QUEUE
+
+    def getExecutor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=initWorker,
+                )
+            return self.executor
+
+    def acquire(self):
+        with self.lock:
+            if self.inFlight >= self.maxQueue:
+                saturated = True
+            else:
+                saturated = False
+                self.inFlight += 1
+        if saturated:
+            self.metrics.recordRejected()
+            raise HashPoolSaturated()
+
+    def release(self):
+        with self.lock:
+            self.inFlight -= 1
+
+    def run(self, job, *args):
+        self.acquire()
+        try:
+            submittedAt = time.time()
+            if self.workers:
+                startedAt, result = self.getExecutor().submit(job, *args).result()
+            else:
+                startedAt, result = job(*args)
+            self.metrics.recordWait(max(0.0, startedAt - submittedAt))
+            return result
+        finally:
+            self.release()
+
+    def checkPassword(self, password, encoded):
+        """
+        Returns whether the password matches the encoded hash and, when it does, whether the
+        hash must be computed again with the configured hasher.
+        """
+        return self.run(checkPasswordJob, password, encoded)
+
+    def makePassword(self, password):
+        """
+        Returns the hash of the password with the configured hasher.
+        """
+        return self.run(makePasswordJob, password)
+
+    def stats(self):
+        """
+        The metrics of the pool with its current load.
+        """
+        with self.lock:
+            load = {"workers": self.workers, "maxQueue": self.maxQueue, "inFlight": self.inFlight}
+        return {**load, **self.metrics.snapshot()}
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+hashPool = HashPool()
+
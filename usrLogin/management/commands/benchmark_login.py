@@ -0,0 +1,57 @@
+"""
+Management command that measures how many password logins per second the login view serves.
+"""
+
+import time
+import uuid
+
+from common.models.user import User
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+from usrLogin.views import LoginAPIView
+
+
+class Command(BaseCommand):
+    help = "Benchmark the password login with the configured password hasher, in logins/second"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        email = f"benchmark-{uuid.uuid4().hex[:12]}@example.com"
+        factory = APIRequestFactory()
+        # The login throttle would answer most of the repeated logins with 429
+        view = LoginAPIView.as_view(throttle_classes=[])
+
+        # The benchmark user and its tokens are rolled back at the end
+        with transaction.atomic():
+            User.objects.create_user(
+                username=email.split("@")[0],
+                birthDate="2000-01-01",
+                password="benchmark",
+                email=email,
+            )
+            data = {"email": email, "password": "benchmark"}
+            failures = {}
+            start = time.perf_counter()
+            for _ in range(iterations):
+                response = view(factory.post("/login/", data, format="json"))
+                if response.status_code != 200:
+                    failures[response.status_code] = failures.get(response.status_code, 0) + 1
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+
+        # Only the successful logins count, a fast error would inflate the rate
+        logins = iterations - sum(failures.values())
+        for statusCode, count in sorted(failures.items()):
+            self.stderr.write(f"{count} logins failed with status {statusCode}")
+        if not logins:
+            self.stderr.write("No login succeeded")
+            return
+        self.stdout.write(
+            f"{logins} logins with {get_hasher().algorithm} in {elapsed:.2f}s: "
+            f"{logins / elapsed:.1f} logins/s, {elapsed / logins * 1000:.1f} ms/login"
+        )
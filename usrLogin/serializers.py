@@ -17,3 +17,14 @@ class UserLoginSerializer(serializers.Serializer):
 
     email = serializers.EmailField()
     password = serializers.CharField(max_length=128, write_only=True)
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """
+    Serializer for the refresh token exchanged for new tokens.
+
+    Args:
+        Serializer: Base class for serializers in Django REST Framework.
+    """
+
+    refresh = serializers.CharField(max_length=64)
@@ -1,7 +1,12 @@
 from operator import is_
 
+from api.authentication import issueAccessToken, signedTokensEnabled, tokenCache
+from api.models import RefreshToken
 from api.serializers import UserRegisterSerializer
 from common.models.user import User
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
@@ -10,20 +15,40 @@ from rest_framework.response import Response
 def generate_token(user):
     """
     Generate a token for a user.
-    """
-    # Find an active token for the user
-    token = Token.objects.filter(
-        user=user)  # pylint: disable=no-member
-    if token.exists():
-        token = token.delete()
 
-    # Create a new token for the user
-    token = Token.objects.create(
-        user=user)  # pylint: disable=no-member
-    token.save()
+    The token of the user is replaced with a new key in a single upsert, instead of deleting
+    and creating the row, and the old key is dropped from the token cache.
+    """
+    token = Token(key=Token.generate_key(), user=user, created=timezone.now())
+    table, key, userId, created = map(
+        connection.ops.quote_name, [Token._meta.db_table, "key", "user_id", "created"]
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({key}, {userId}, {created}) VALUES (%s, %s, %s) "
+            f"ON CONFLICT ({userId}) DO UPDATE "
+            f"SET {key} = EXCLUDED.{key}, {created} = EXCLUDED.{created}",
+            [token.key, user.pk, token.created],
+        )
+    token._state.adding = False
+    tokenCache.invalidateUser(user.pk)
     return token
 
 
+def generate_credentials(user):
+    """
+    Generate the credentials returned by a login: a signed access token with a refresh token
+    when SignedTokenAuthentication is enabled, a DRF token otherwise.
+    """
+    if signedTokensEnabled():
+        return {
+            "token": issueAccessToken(user),
+            "refresh": RefreshToken.issue(user.pk),
+            "expiresIn": settings.ACCESS_TOKEN_TTL,
+        }
+    return {"token": generate_token(user).key}
+
+
 def get_or_create_from_google(data):
     # Check if user exists in the database
     user = User.objects.filter(email=data.get(
@@ -23,4 +23,6 @@ urlpatterns = [
     path("google", views.GoogleLoginAPIView.as_view(), name="google_login"),
     path("facebook", views.FacebookLoginAPIView.as_view(),
          name="facebook_login"),
+    path("refresh", views.RefreshTokenAPIView.as_view(), name="refresh_token"),
+    path("metrics/hashing", views.HashPoolMetricsView.as_view(), name="hash_pool_metrics"),
 ]
@@ -2,15 +2,21 @@
     This module provides an API endpoint for user login.
 """
 
+from django.conf import settings
 from django.contrib.auth import authenticate
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .service.social_logins import get_or_create_from_google, ger_or_create_from_facebook, generate_token
+from .service.social_logins import get_or_create_from_google, ger_or_create_from_facebook, generate_credentials
+from api.authentication import issueAccessToken
+from api.throttling import EmailThrottle, IPThrottle
+from api.models import RefreshToken
 from common.models.user import User
-from .serializers import UserLoginSerializer
+from .hashing import hashPool
+from .serializers import RefreshTokenSerializer, UserLoginSerializer
 
 # Create your views here.
 
@@ -23,6 +29,9 @@ class LoginAPIView(APIView):
         APIView: Base class for handling HTTP requests.
     """
 
+    throttle_scope = "login"
+    throttle_classes = [IPThrottle, EmailThrottle]
+
     @swagger_auto_schema(
         request_body=UserLoginSerializer,
         responses={
@@ -42,6 +51,7 @@ class LoginAPIView(APIView):
                         type=openapi.TYPE_STRING)},
                 ),
             ),
+            503: "Too many passwords being checked, retry after Retry-After seconds",
         },
     )
     def post(self, request):
@@ -60,18 +70,11 @@ class LoginAPIView(APIView):
             email = serializer.validated_data.get("email")  # type: ignore
             password = serializer.validated_data.get(
                 "password")  # type: ignore
-            # authenticate use by default the username field, but we are using the email field
-            user = authenticate(username=email, password=password)
+            # Only the base users log in with a password, the backend checks the login type
+            user = authenticate(request, email=email, password=password, typeOfLogin="base")
 
             if user:
-                # Check if the user is a base user (not a social login user)
-                userLogged = User.objects.filter(
-                    email=email).first()
-                if userLogged and userLogged.typeOfLogin != "base":
-                    return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
-
-                generatedToken = generate_token(user)
-                return Response({"token": generatedToken.key})
+                return Response(generate_credentials(user))
             # If user not found means that the credentials are invalid or
             # wrong username
             return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
@@ -117,8 +120,7 @@ class GoogleLoginAPIView(APIView):
         # return Response({"message": "Google login not implemented yet"})
         user = get_or_create_from_google(request.data)
         if user:
-            generatedToken = generate_token(user)
-            return Response({"token": generatedToken.key})
+            return Response(generate_credentials(user))
         return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
 
@@ -139,6 +141,78 @@ class FacebookLoginAPIView(APIView):
         """
         user = ger_or_create_from_facebook(request.data)
         if user:
-            generatedToken = generate_token(user)
-            return Response({"token": generatedToken.key})
+            return Response(generate_credentials(user))
         return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
+
+
+class RefreshTokenAPIView(APIView):
+    """
+    The class that exchanges a refresh token for a new access token and refresh token.
+    """
+
+    @swagger_auto_schema(
+        request_body=RefreshTokenSerializer,
+        responses={
+            200: openapi.Response(
+                description="Tokens successfully rotated",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        "token": openapi.Schema(type=openapi.TYPE_STRING),
+                        "refresh": openapi.Schema(type=openapi.TYPE_STRING),
+                        "expiresIn": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    },
+                ),
+            ),
+            401: "Invalid refresh token",
+        },
+    )
+    def post(self, request):
+        """
+        Handle POST request for rotating a refresh token.
+
+        Parameters:
+        - request: HTTP request object containing the refresh token.
+
+        Returns:
+        - Response: HTTP response object containing the new tokens or error message.
+        """
+        serializer = RefreshTokenSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_401_UNAUTHORIZED)
+
+        rotated = RefreshToken.rotate(serializer.validated_data.get("refresh"))  # type: ignore
+        if rotated is None:
+            return Response({"error": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
+        userId, refresh = rotated
+        user = User.objects.filter(pk=userId, is_active=True).only("typeOfLogin").first()
+        if user is None:
+            return Response({"error": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(
+            {
+                "token": issueAccessToken(user),
+                "refresh": refresh,
+                "expiresIn": settings.ACCESS_TOKEN_TTL,
+            }
+        )
+
+
+class HashPoolMetricsView(APIView):
+    """
+    The class that returns the load of the password hashing pool and how long the hashes
+    wait for a worker.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """
+        Handle GET request for the password hashing metrics.
+
+        Parameters:
+        - request: HTTP request object of an admin user.
+
+        Returns:
+        - Response: HTTP response object containing the metrics of the pool.
+        """
+        return Response(hashPool.stats())